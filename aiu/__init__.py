@@ -1,16 +1,24 @@
 from .archiveit_collection import ArchiveItCollection, ArchiveItCollectionException
 from .trove_collection import TroveCollection, TroveCollectionException
 from .pandora_collection import PandoraCollection, PandoraSubject, PandoraCollectionException
-from .timemap import convert_LinkTimeMap_to_dict, MalformedLinkFormatTimeMap
+from .timemap import convert_LinkTimeMap_to_dict, iter_LinkTimeMap, MalformedLinkFormatTimeMap, TimeMap, parse_timemaps_parallel
+from .memento_datetime import parse_memento_datetime
+from .compact_timemap import CompactTimeMap
 from .archive_information import generate_raw_urim
-from .utils import generate_archiveit_urits, process_timemaps_for_mementos, discover_raw_urims, get_uri_responses
+from .utils import generate_archiveit_urits, process_timemaps_for_mementos, fetch_timemaps, load_captured_timemaps, discover_raw_urims, iter_raw_urims, get_uri_responses, iter_uri_responses, prefetch
+from .cache import MetadataCache
+from .dedup import DedupIndex
+from .warc import export_mementos_to_warc
+from .sessions import create_session, create_uncached_session, get_session, connection_statistics
 from .version import name, version, user_agent_string
 
 
 __all__ = [ "ArchiveItCollection", "ArchiveItCollectionException",
-    "convert_LinkTimeMap_to_dict", "MalformedLinkFormatTimeMap",
-    "generate_raw_urim", "generate_archiveit_urits", "process_timemaps_for_mementos",
-    "discover_raw_urims", "get_uri_responses", "version", "name", "user_agent_string", "TroveCollection", "PandoraCollection", "PandoraSubject" ]
+    "convert_LinkTimeMap_to_dict", "iter_LinkTimeMap", "MalformedLinkFormatTimeMap", "TimeMap",
+    "parse_timemaps_parallel", "parse_memento_datetime", "CompactTimeMap",
+    "generate_raw_urim", "generate_archiveit_urits", "process_timemaps_for_mementos", "fetch_timemaps",
+    "load_captured_timemaps", "discover_raw_urims", "iter_raw_urims", "get_uri_responses", "iter_uri_responses",
+    "prefetch", "MetadataCache", "DedupIndex", "export_mementos_to_warc", "create_session", "create_uncached_session", "get_session", "connection_statistics", "version", "name", "user_agent_string", "TroveCollection", "PandoraCollection", "PandoraSubject" ]
 
 import logging
 try:  # Python 2.7+
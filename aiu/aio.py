@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.aio
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module contains asyncio versions of the functions in `aiu.utils` that
+download mementos and TimeMaps. Because waiting on a request does not hold
+a thread, thousands of requests can be in flight at once, limited per
+archive host by the session from `create_session`.
+
+It requires aiohttp, which is installed with `pip install aiu[aio]`.
+"""
+
+import os
+import csv
+import json
+import asyncio
+import logging
+import functools
+
+try:
+    import aiohttp
+except ImportError as e:
+    raise ImportError("aiu.aio requires aiohttp, which can be installed "
+        "with 'pip install aiu[aio]'") from e
+
+from .archive_information import generate_raw_urim
+from .utils import store_timemap
+from .version import user_agent_string
+
+logger = logging.getLogger(__name__)
+
+default_limit = 1000
+default_limit_per_host = 100
+
+class Response:
+    """A response that has been read in full by `fetch`. It has the
+    attributes of a `requests` response that aiu relies on, except that
+    `history` holds the URIs that were redirected from.
+    """
+
+    def __init__(self, url, status_code, headers, content, history, encoding='utf-8'):
+
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.history = history
+        self.encoding = encoding
+
+    @property
+    def text(self):
+
+        return self.content.decode(self.encoding, errors='replace')
+
+    def __repr__(self):
+
+        return "<Response [{}] {}>".format(self.status_code, self.url)
+
+def create_session(limit=default_limit, limit_per_host=default_limit_per_host, timeout=300):
+    """This function creates an `aiohttp.ClientSession` that keeps at most
+    `limit` connections open, and at most `limit_per_host` to any one
+    archive, giving up on a request after `timeout` seconds. It must be
+    created, and closed, inside a running event loop.
+    """
+
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+
+    return aiohttp.ClientSession(connector=connector,
+        headers={'user-agent': user_agent_string},
+        timeout=aiohttp.ClientTimeout(total=timeout))
+
+async def fetch(session, uri, method="GET"):
+    """This function requests `uri` with `session`, following all
+    redirects, and returns a `Response` with the entire body read.
+    """
+
+    logger.debug("issuing {} on uri {}".format(method, uri))
+
+    async with session.request(method, uri, allow_redirects=True) as response:
+
+        content = await response.read()
+
+        return Response(str(response.url), response.status, response.headers,
+            content, tuple( str(r.url) for r in response.history ),
+            encoding=response.charset or 'utf-8')
+
+async def iter_responses(session, uris, method="GET", window=None):
+    """This function requests each of `uris` with `session`, keeping at
+    most `window` requests in flight, defaulting to the connection limit
+    of the session, and generates a `(uri, response, error)` tuple for
+    each request as it completes. One of `response` or `error` is None.
+    Duplicate URIs are only requested once.
+
+    Requests still in flight are cancelled, and awaited, when the generator
+    is closed early or raises.
+    """
+
+    if window is None:
+        window = session.connector.limit or default_limit
+
+    uris = iter(uris)
+    submitted = set()
+    pending = {}
+
+    def submit_next():
+
+        for uri in uris:
+
+            if uri not in submitted:
+                submitted.add(uri)
+                pending[asyncio.ensure_future(fetch(session, uri, method=method))] = uri
+                return
+
+    try:
+
+        for i in range(window):
+            submit_next()
+
+        while len(pending) > 0:
+
+            done, not_done = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+
+                uri = pending.pop(task)
+                submit_next()
+
+                try:
+                    result = task.result()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    yield uri, None, e
+                else:
+                    yield uri, result, None
+
+    finally:
+
+        for task in pending:
+            task.cancel()
+
+        if len(pending) > 0:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def get_uri_responses(session, raw_uris):
+    """This function issues a GET request for each URI-M in `raw_uris`
+    using `session`, and returns a `dict` mapping each URI-M to its
+    `Response`, or to the exception raised if the request failed.
+    """
+
+    responses = {}
+
+    async for uri, response, error in iter_responses(session, raw_uris):
+        responses[uri] = error if response is None else response
+
+    return responses
+
+async def iter_raw_urims(urimlist, session):
+    """This function checks that the URI-Ms in `urimlist` are valid mementos,
+    following all redirects and checking for a Memento-Datetime header.
+
+    It generates a `(urim, raw_urim, error)` tuple for each URI-M as soon as
+    its HEAD request completes, where one of `raw_urim` or `error` is None.
+    """
+
+    async for urim, response, error in iter_responses(session, urimlist, method="HEAD"):
+
+        if response is None:
+            logger.warning("While acquiring memento at {} there was an error of {}, "
+                "this event is being recorded".format(urim, repr(error)))
+            yield urim, None, repr(error)
+
+        elif "memento-datetime" in response.headers:
+
+            if len(response.history) == 0:
+                raw_urim = generate_raw_urim(urim)
+            else:
+                raw_urim = generate_raw_urim(response.url)
+
+            logger.debug("added raw URI-M {} associated with URI-M {}"
+                " to the list to be downloaded".format(raw_urim, urim))
+
+            yield urim, raw_urim, None
+
+        else:
+
+            warn_msg = "No Memento-Datetime in Response Headers for " \
+                "URI-M {}".format(urim)
+
+            logger.warning(warn_msg)
+
+            yield urim, None, warn_msg
+
+async def discover_raw_urims(urimlist, session=None):
+    """This function is the asyncio version of
+    `aiu.utils.discover_raw_urims`, returning a `dict` mapping each valid
+    URI-M in `urimlist` to its raw URI-M and a `dict` mapping each other
+    URI-M to its error. A session from `create_session` is used if
+    `session` is not given.
+    """
+
+    if session is None:
+        async with create_session() as session:
+            return await discover_raw_urims(urimlist, session=session)
+
+    raw_urimdata = {}
+    errordata = {}
+
+    async for urim, raw_urim, error in iter_raw_urims(urimlist, session):
+
+        if error is None:
+            raw_urimdata[urim] = raw_urim
+        else:
+            errordata[urim] = error
+
+    return raw_urimdata, errordata
+
+async def process_timemaps_for_mementos(urit_list, working_directory, storage="raw", session=None):
+    """This function is the asyncio version of
+    `aiu.utils.process_timemaps_for_mementos`, storing the TimeMaps at
+    `urit_list` in `working_directory` in the same way and returning the
+    parsed TimeMaps. A session from `create_session` is used if `session`
+    is not given. TimeMaps are parsed and stored on the default executor of
+    the event loop, so that parsing a large one does not stall the
+    requests in flight.
+    """
+
+    if storage not in ("raw", "compact"):
+        raise ValueError("unknown TimeMap storage {}".format(storage))
+
+    if session is None:
+        async with create_session() as session:
+            return await process_timemaps_for_mementos(urit_list,
+                working_directory, storage=storage, session=session)
+
+    loop = asyncio.get_running_loop()
+    timemap_data = {}
+
+    output_directory = "{}/capture/timemaps".format(working_directory)
+
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+
+    with open("{}/manifest.tsv".format(output_directory), 'w') as manifestout, \
+        open("{}/errors.jsonl".format(output_directory), 'w') as errorsout:
+
+        fieldnames = [ "URI-T", "Filename"]
+
+        manifestwriter = csv.DictWriter(manifestout, fieldnames, delimiter='\t')
+        manifestwriter.writeheader()
+
+        async for urit, response, error in iter_responses(session, urit_list):
+
+            logger.debug("URI-T {} is done, extracting content".format(urit))
+
+            if response is None:
+
+                logger.warning("There was an error of {} while attempting "
+                    "to download URI-T {}".format(repr(error), urit))
+
+                errorsout.write("{}\n".format(json.dumps(
+                    {
+                        "URI-T": urit,
+                        "error": repr(error)
+                    }
+                )))
+
+            elif response.status_code == 200:
+
+                logger.info("adding TimeMap content for URI-T {}".format(
+                    urit))
+
+                uritfilename, timemap_data[urit] = await loop.run_in_executor(None,
+                    functools.partial(store_timemap, urit, response.text,
+                        output_directory, storage=storage))
+
+                manifestwriter.writerow({
+                    'URI-T': urit,
+                    'Filename': uritfilename
+                })
+
+            else:
+                errorsout.write("{}\n".format(json.dumps(
+                    {
+                        "URI-T": urit,
+                        "status": response.status_code,
+                        "headers": dict(response.headers)
+                    }
+                )))
+
+    return timemap_data
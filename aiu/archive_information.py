@@ -7,6 +7,8 @@ aiu.archive_information
 This module handles the idiosyncracies between archives.
 """
 
+import re
+
 archive_mappings = {
     "wayback.archive-it.org": ( '/http', 'id_/http' ),
     "web.archive.org": ( '/http', 'id_/http' )
@@ -35,4 +37,40 @@ def generate_raw_urim(urim):
 
             break
 
-    return raw_urim
\ No newline at end of file
+    return raw_urim
+
+def _compile_timestamp_patterns():
+
+    patterns = {}
+
+    for domainname in archive_mappings:
+
+        search_pattern = archive_mappings[domainname][0]
+        replacement_pattern = archive_mappings[domainname][1]
+
+        patterns[domainname] = re.compile(r'/(\d{{14}})(?:{}|{})'.format(
+            re.escape(replacement_pattern), re.escape(search_pattern)))
+
+    return patterns
+
+urim_timestamp_patterns = _compile_timestamp_patterns()
+
+def split_urim(urim):
+    """Splits a URI-M from one of the archives in `archive_mappings` into
+    a tuple of the text before its 14-digit timestamp, the timestamp, and
+    the text after it, e.g., the raw marker and the URI-R. Returns `None`
+    for URI-Ms that do not follow these patterns.
+    """
+
+    for domainname in archive_mappings:
+
+        if domainname in urim:
+
+            match = urim_timestamp_patterns[domainname].search(urim)
+
+            if match is None:
+                return None
+
+            return urim[:match.start(1)], match.group(1), urim[match.end(1):]
+
+    return None
@@ -23,16 +23,27 @@ import csv
 import sys
 
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 
 from datetime import datetime
-from bs4 import BeautifulSoup
 
 from .version import user_agent_string
+from .sessions import get_session
+from .cache import open_cache
+from .html_parsers import check_html_parser, default_html_parser, parse_html, RegionFilter
 
 logger = logging.getLogger(__name__)
 
 collection_uri_prefix = "https://archive-it.org/collections"
 
+# the number of results pages requested and parsed at once
+page_workers = 4
+
+# the only regions of a results page that are scraped
+results_page_regions = RegionFilter(
+    ids=("all-search-results", "pageNext"),
+    classes=("entity-meta", "result-item", "paginator"))
+
 class ArchiveItCollectionException(Exception):
     """An exception class to be used by the functions in this file so that the
     source of error can be detected.
@@ -248,6 +259,17 @@ def scrape_next_page_number(soup):
 
     return nextpage
 
+def get_seed_metadata_from_results_page(page_uri, session, parser=default_html_parser):
+    """Downloads the Archive-It results page at `page_uri` and scrapes its
+    seed metadata using the BeautifulSoup parser `parser`.
+    """
+
+    r = session.get(page_uri)
+
+    soup = parse_html(r.text, parser, parse_only=results_page_regions)
+
+    return scrape_seed_metadata(soup)
+
 def get_seed_metadata_from_seed_report(collection_id, session):
     """Builds the CSV seed report URI using `collection_id` and saves the
     seed report in `pages_dir`.
@@ -283,10 +305,13 @@ def get_seed_metadata_from_seed_report(collection_id, session):
 class ArchiveItCollection:
     """Organizes all information acquired about the Archive-It collection."""
 
-    def __init__(self, collection_id, session=requests.Session(), logger=None):
+    def __init__(self, collection_id, session=None, logger=None, parser=None, cache=None):
 
         self.collection_id = str(collection_id)
-        self.session = session
+        self.session = session if session is not None else get_session()
+        self.parser = check_html_parser(parser)
+        self.cache = open_cache(cache)
+        self.firstpage_soup = None
         self.metadata_loaded = False
         self.seed_metadata_loaded = False
         self.metadata = {}
@@ -295,28 +320,68 @@ class ArchiveItCollection:
         self.exists = None
 
         self.collection_uri = "{}/{}".format(collection_uri_prefix, collection_id)
-        self.firstpage_response = self.session.get(self.collection_uri)        
+        self._firstpage_response = None
 
         self.logger = logger or logging.getLogger(__name__)
 
+    @property
+    def firstpage_response(self):
+        """The response for the first results page, requested on first use."""
+
+        return self.fetch_firstpage()
+
+    def fetch_firstpage(self):
+        """Requests the first results page, unless it already has been, and
+        returns its response. It is not requested by the constructor, so
+        that many collections can be created without any requests and fetched
+        together with `aiu.utils.prefetch`."""
+
+        if self._firstpage_response is None:
+            self._firstpage_response = self.session.get(self.collection_uri)
+
+        return self._firstpage_response
+
+    def get_firstpage_soup(self):
+        """Returns the parsed regions of the first results page, which are
+        shared by the collection and seed metadata scrapers."""
+
+        if self.firstpage_soup is None:
+            self.firstpage_soup = parse_html(self.firstpage_response.text,
+                self.parser, parse_only=results_page_regions)
+
+        return self.firstpage_soup
+
     def load_collection_metadata(self):
-        """Loads collection metadata from an existing directory, if possible.
-        If the existing directory does not exist, it will then download the
-        collection and process its metadata.
+        """Loads collection metadata from the cache, if it is fresh there.
+        Otherwise it scrapes the metadata from the first results page and
+        stores it in the cache, unless the collection was not found, which
+        may only be for now.
         """
 
         if not self.metadata_loaded:
 
-            soup = BeautifulSoup(self.firstpage_response.text, 'html5lib')
+            metadata = self.cache.load("archiveit", self.collection_id, "metadata")
+
+            if metadata is None:
+
+                soup = self.get_firstpage_soup()
 
-            self.metadata["main"] = scrape_main_collection_data(soup)
-            self.metadata["optional"] = scrape_optional_collection_data(soup)
+                metadata = {
+                    "main": scrape_main_collection_data(soup),
+                    "optional": scrape_optional_collection_data(soup)
+                }
+
+                if metadata["main"]["exists"]:
+                    self.cache.store("archiveit", self.collection_id, "metadata", metadata)
+
+            self.metadata.update(metadata)
 
             self.metadata_loaded = True
 
     def load_seed_metadata(self):
-        """Loads the seed metadata previously downloaded if possible, otherwise
-        acquires all collection results pages and parses them for seed metadata.
+        """Loads the seed metadata previously downloaded from the cache if it
+        is fresh there, otherwise acquires all collection results pages and
+        parses them for seed metadata, storing it in the cache.
 
         This function is separate to limit the number of requests. It should only
         be called if seed metadata is needed.
@@ -334,30 +399,68 @@ class ArchiveItCollection:
 
         if not self.seed_metadata_loaded:
 
+            seed_metadata = self.cache.load("archiveit", self.collection_id, "seed_metadata")
+
+            if seed_metadata is not None:
+                self.seed_metadata = seed_metadata
+                self.seed_metadata_loaded = True
+                return
+
             timestamp = datetime.now()
 
             seed_metadata_list = []
 
-            soup = BeautifulSoup(self.firstpage_response.text, 'html5lib')
+            with ThreadPoolExecutor(max_workers=page_workers + 1) as executor:
+
+                # the seed report downloads alongside the results pages
+                seed_report_future = executor.submit(
+                    get_seed_metadata_from_seed_report, self.collection_id, self.session)
 
-            seed_metadata_list.extend( scrape_seed_metadata(soup) )
+                soup = self.get_firstpage_soup()
 
-            nextpage = scrape_next_page_number(soup)
-            result_count = scrape_result_count(soup)
+                seed_metadata_list.extend( scrape_seed_metadata(soup) )
 
-            while nextpage:
+                nextpage = scrape_next_page_number(soup)
+                result_count = scrape_result_count(soup)
+                page_count = scrape_page_count(soup)
 
-                page_uri = "{}/{}/?page={}&totalResultCount={}".format(
-                    collection_uri_prefix, self.collection_id, 
-                    nextpage, result_count)
+                if nextpage and page_count and nextpage.isdigit() and page_count.isdigit():
 
-                r = self.session.get(page_uri)
+                    # every results page URI is known from the first page
+                    page_futures = []
 
-                soup = BeautifulSoup(r.text, 'html5lib')
+                    for page_number in range(int(nextpage), int(page_count) + 1):
 
-                seed_metadata_list.extend( scrape_seed_metadata(soup) )
+                        page_uri = "{}/{}/?page={}&totalResultCount={}".format(
+                            collection_uri_prefix, self.collection_id,
+                            page_number, result_count)
 
-                nextpage = scrape_next_page_number(soup)
+                        page_futures.append( executor.submit(
+                            get_seed_metadata_from_results_page, page_uri, self.session,
+                            parser=self.parser) )
+
+                    for future in page_futures:
+                        seed_metadata_list.extend( future.result() )
+
+                else:
+
+                    while nextpage:
+
+                        page_uri = "{}/{}/?page={}&totalResultCount={}".format(
+                            collection_uri_prefix, self.collection_id, 
+                            nextpage, result_count)
+
+                        r = self.session.get(page_uri)
+
+                        soup = parse_html(r.text, self.parser,
+                            parse_only=results_page_regions)
+
+                        seed_metadata_list.extend( scrape_seed_metadata(soup) )
+
+                        nextpage = scrape_next_page_number(soup)
+
+                seed_report_metadata = seed_report_future.result()
+                seed_report_timestamp = datetime.now()
 
             for item in seed_metadata_list:
                 uri = item["uri"]
@@ -373,9 +476,6 @@ class ArchiveItCollection:
                 self.seed_metadata["seeds"][uri].setdefault(
                     "collection_web_pages", []).append(itemdict)
 
-            seed_report_metadata = get_seed_metadata_from_seed_report(self.collection_id, self.session)
-            seed_report_timestamp = datetime.now()
-
             for uri in seed_report_metadata:
                 self.seed_metadata.setdefault("seeds", {})
                 self.seed_metadata["seeds"].setdefault(uri, {})
@@ -388,8 +488,24 @@ class ArchiveItCollection:
 
             self.seed_metadata["timestamps"]["seed_report_timestamp"] = seed_report_timestamp
 
+            self.cache.store("archiveit", self.collection_id, "seed_metadata", self.seed_metadata)
+
             self.seed_metadata_loaded = True
 
+    def invalidate_cache(self):
+        """Removes the metadata of this collection from its cache, and
+        forgets what has been loaded, so that it is acquired again from
+        the archive."""
+
+        self.cache.invalidate("archiveit", self.collection_id)
+
+        self.metadata_loaded = False
+        self.seed_metadata_loaded = False
+        self.metadata = {}
+        self.seed_metadata = {}
+        self._firstpage_response = None
+        self.firstpage_soup = None
+
     def get_collection_name(self):
         """Getter for the collection name, as scraped."""
 
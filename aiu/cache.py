@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module stores the metadata acquired by the collection classes on disk,
+so that later runs can load it instead of scraping the archive again.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# entries written with any other format version are ignored
+cache_format_version = 1
+
+# seconds an entry is fresh for, unless given a TTL of its own
+default_ttl = 7 * 24 * 60 * 60
+
+def _encode(value):
+    """Converts the tuples and datetimes in `value`, which JSON cannot
+    represent, into tagged objects that `_decode` converts back."""
+
+    if isinstance(value, dict):
+        return { key: _encode(item) for key, item in value.items() }
+
+    if isinstance(value, list):
+        return [ _encode(item) for item in value ]
+
+    if isinstance(value, tuple):
+        return { "__tuple__": [ _encode(item) for item in value ] }
+
+    if isinstance(value, datetime):
+        return { "__datetime__": value.isoformat() }
+
+    return value
+
+def _decode(obj):
+
+    if len(obj) == 1:
+
+        if "__tuple__" in obj:
+            return tuple(obj["__tuple__"])
+
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+
+    return obj
+
+class MetadataCache:
+    """Stores each section of metadata, such as the collection or seed
+    metadata, of each collection as a JSON file under `directory`. Each
+    entry records the cache format version and when it expires, `ttl`
+    seconds after it was stored unless given a TTL of its own, or never
+    if the TTL is None. A cache with no `directory` stores nothing.
+    """
+
+    def __init__(self, directory=None, ttl=default_ttl):
+
+        self.directory = directory
+        self.ttl = ttl
+
+    def entry_path(self, kind, identifier, section):
+        """Returns the path of the entry for the `section` of the metadata
+        of the collection of kind `kind` identified by `identifier`."""
+
+        return os.path.join(self.directory, kind, str(identifier),
+            "{}.json".format(section))
+
+    def load(self, kind, identifier, section):
+        """Returns the value stored for this entry, or None if it is
+        missing, expired, unreadable, or written in another format version.
+        """
+
+        if self.directory is None:
+            return None
+
+        path = self.entry_path(kind, identifier, section)
+
+        try:
+            with open(path) as f:
+                entry = json.load(f, object_hook=_decode)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("ignoring unreadable cache entry {}: {}".format(path, repr(e)))
+            return None
+
+        if entry.get("version") != cache_format_version:
+            logger.info("ignoring cache entry {} written in format version {}".format(
+                path, entry.get("version")))
+            return None
+
+        if entry["expires"] is not None and entry["expires"] <= time.time():
+            logger.info("cache entry {} has expired".format(path))
+            return None
+
+        logger.debug("loaded cache entry {}".format(path))
+
+        return entry["value"]
+
+    def store(self, kind, identifier, section, value, ttl=None):
+        """Stores `value` as this entry, fresh for `ttl` seconds, or for the
+        TTL of the cache if `ttl` is None. The entry is replaced atomically,
+        so a reader never sees it half-written."""
+
+        if self.directory is None:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+
+        stored = time.time()
+
+        entry = {
+            "version": cache_format_version,
+            "stored": stored,
+            "expires": None if ttl is None else stored + ttl,
+            "value": _encode(value)
+        }
+
+        path = self.entry_path(kind, identifier, section)
+        entry_directory = os.path.dirname(path)
+
+        os.makedirs(entry_directory, exist_ok=True)
+
+        fd, temporary_path = tempfile.mkstemp(dir=entry_directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        logger.debug("stored cache entry {}".format(path))
+
+    def invalidate(self, kind, identifier, section=None):
+        """Removes this entry, or every entry of the collection if `section`
+        is None."""
+
+        if self.directory is None:
+            return
+
+        if section is None:
+            sections = [ filename[:-len(".json")] for filename in
+                self._list_entries(kind, identifier) ]
+        else:
+            sections = [ section ]
+
+        for section in sections:
+
+            try:
+                os.remove(self.entry_path(kind, identifier, section))
+            except FileNotFoundError:
+                pass
+
+    def _list_entries(self, kind, identifier):
+
+        try:
+            filenames = os.listdir(os.path.join(self.directory, kind, str(identifier)))
+        except FileNotFoundError:
+            return []
+
+        return [ filename for filename in filenames if filename.endswith(".json") ]
+
+def open_cache(cache):
+    """Returns `cache` if it is a `MetadataCache`, otherwise a
+    `MetadataCache` in the directory `cache`, which stores nothing if
+    `cache` is None."""
+
+    if isinstance(cache, MetadataCache):
+        return cache
+
+    return MetadataCache(cache)
@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.compact_timemap
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a memory efficient representation of a parsed
+link-format TimeMap. Rather than a dictionary per memento, memento
+datetimes are kept as epoch seconds in an array and URI-Ms are kept in a
+single buffer, with dictionaries only created when a memento is accessed.
+
+URI-Ms from the archives in `archive_information.archive_mappings` can
+instead be reduced to their 14-digit timestamps, with the rest of each
+URI-M kept once per TimeMap and the URI-M rebuilt on demand.
+"""
+
+import json
+
+from array import array
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timedelta
+
+from .archive_information import split_urim
+from .memento_datetime import parse_memento_datetime
+
+compact_timemap_format_version = 1
+
+_epoch = datetime(1970, 1, 1)
+_one_second = timedelta(seconds=1)
+
+def datetime_to_epoch(mdt):
+    """Converts the naive UTC datetime `mdt` into seconds since the epoch."""
+
+    return (mdt - _epoch) // _one_second
+
+def epoch_to_datetime(seconds):
+    """Converts `seconds` since the epoch into a naive UTC datetime."""
+
+    return _epoch + timedelta(seconds=seconds)
+
+class JoinedURIStore:
+    """Stores URIs encoded back to back in one buffer, with an array of
+    offsets marking where each URI ends."""
+
+    def __init__(self):
+
+        self.buffer = bytearray()
+        self.ends = array('Q')
+
+    def append(self, uri):
+
+        self.buffer.extend(uri.encode('utf8'))
+        self.ends.append(len(self.buffer))
+
+    def __len__(self):
+
+        return len(self.ends)
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self.ends)
+
+        if not 0 <= index < len(self.ends):
+            raise IndexError("URI index out of range")
+
+        start = self.ends[index - 1] if index > 0 else 0
+
+        return self.buffer[start:self.ends[index]].decode('utf8')
+
+    def nbytes(self):
+        """Returns the number of bytes used by the buffer and offsets."""
+
+        return len(self.buffer) + self.ends.itemsize * len(self.ends)
+
+class TemplatedURIStore:
+    """Stores URI-Ms as a 14-digit timestamp plus the index of a template,
+    the text before and after the timestamp that is shared by the URI-Ms
+    of a TimeMap. URI-Ms that do not follow the patterns of
+    `archive_information.archive_mappings` are stored as they are."""
+
+    # template index of the URI-Ms stored as they are
+    untemplated = 0xFFFFFFFF
+
+    def __init__(self):
+
+        self.templates = []
+        self.template_indexes = {}
+        self.timestamps = array('q')
+        self.indexes = array('I')
+        self.untemplated_uris = {}
+
+    def append(self, uri):
+
+        parts = split_urim(uri)
+
+        if parts is None:
+            self.untemplated_uris[len(self.indexes)] = uri
+            self.timestamps.append(0)
+            self.indexes.append(self.untemplated)
+            return
+
+        prefix, timestamp, suffix = parts
+        template = (prefix, suffix)
+
+        index = self.template_indexes.get(template)
+
+        if index is None:
+            index = len(self.templates)
+            self.templates.append(template)
+            self.template_indexes[template] = index
+
+        self.timestamps.append(int(timestamp))
+        self.indexes.append(index)
+
+    def __len__(self):
+
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self.indexes)
+
+        if not 0 <= index < len(self.indexes):
+            raise IndexError("URI index out of range")
+
+        template_index = self.indexes[index]
+
+        if template_index == self.untemplated:
+            return self.untemplated_uris[index]
+
+        prefix, suffix = self.templates[template_index]
+
+        return "{}{:014d}{}".format(prefix, self.timestamps[index], suffix)
+
+    def nbytes(self):
+        """Returns the number of bytes used by the timestamps, template
+        indexes, templates, and untemplated URI-Ms."""
+
+        return self.timestamps.itemsize * len(self.timestamps) + \
+            self.indexes.itemsize * len(self.indexes) + \
+            sum(len(prefix) + len(suffix) for prefix, suffix in self.templates) + \
+            sum(len(uri) for uri in self.untemplated_uris.values())
+
+def _timestamp_of_epoch(seconds):
+    """Returns the 14-digit timestamp of `seconds` since the epoch as an
+    integer, e.g., 20100802055126."""
+
+    mdt = epoch_to_datetime(seconds)
+
+    return ((((mdt.year * 100 + mdt.month) * 100 + mdt.day) * 100 +
+        mdt.hour) * 100 + mdt.minute) * 100 + mdt.second
+
+def _encode_memento_fields(fields):
+    """Returns a copy of `fields` with the datetimes of the first and last
+    mementos in epoch seconds, for JSON."""
+
+    encoded = dict(fields)
+
+    if "mementos" in fields:
+
+        encoded["mementos"] = {}
+
+        for key in fields["mementos"]:
+
+            value = fields["mementos"][key]
+
+            if isinstance(value, dict):
+                value = dict(value)
+
+                if "datetime" in value:
+                    value["datetime"] = datetime_to_epoch(value["datetime"])
+
+            encoded["mementos"][key] = value
+
+    return encoded
+
+def _decode_memento_fields(encoded):
+    """Reverses `_encode_memento_fields`."""
+
+    fields = dict(encoded)
+
+    if "mementos" in encoded:
+
+        fields["mementos"] = {}
+
+        for key in encoded["mementos"]:
+
+            value = encoded["mementos"][key]
+
+            if isinstance(value, dict):
+                value = dict(value)
+
+                if "datetime" in value:
+                    value["datetime"] = epoch_to_datetime(value["datetime"])
+
+            fields["mementos"][key] = value
+
+    return fields
+
+class CompactMementoList(Sequence):
+    """A read-only view of the mementos of a `CompactTimeMap` that behaves
+    like the list of `{"datetime": ..., "uri": ...}` dictionaries returned by
+    `convert_LinkTimeMap_to_dict`, creating each dictionary on access."""
+
+    def __init__(self, timemap):
+
+        self.timemap = timemap
+
+    def __len__(self):
+
+        return len(self.timemap.datetimes)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self))) ]
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("memento index out of range")
+
+        return {
+            "datetime": epoch_to_datetime(self.timemap.datetimes[index]),
+            "uri": self.timemap.uris[index]
+        }
+
+    def __eq__(self, other):
+
+        if isinstance(other, (list, CompactMementoList)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+
+        return NotImplemented
+
+    def __repr__(self):
+
+        return "CompactMementoList({} mementos)".format(len(self))
+
+class CompactTimeMap(Mapping):
+    """A parsed TimeMap that stores memento datetimes as an `array('q')`
+    of epoch seconds and URI-Ms in a single buffer. If `template_urims` is
+    True, URI-Ms are instead stored as timestamps and templates by a
+    `TemplatedURIStore`.
+
+    It can be read like the dictionary returned by
+    `convert_LinkTimeMap_to_dict`, e.g., `timemap["mementos"]["list"]`, and
+    `to_dict()` returns exactly that dictionary.
+    """
+
+    def __init__(self, template_urims=False):
+
+        # the relations other than the memento list, in order of appearance
+        self.fields = {}
+        self.datetimes = array('q')
+
+        if template_urims:
+            self.uris = TemplatedURIStore()
+        else:
+            self.uris = JoinedURIStore()
+
+    @classmethod
+    def from_dict(cls, timemap_dict, template_urims=False):
+        """Creates a CompactTimeMap from the output of
+        `convert_LinkTimeMap_to_dict`."""
+
+        timemap = cls(template_urims=template_urims)
+
+        for key in timemap_dict:
+
+            if key == "mementos":
+
+                timemap.fields["mementos"] = {}
+
+                for memento_key in timemap_dict["mementos"]:
+
+                    if memento_key == "list":
+                        timemap.fields["mementos"]["list"] = None
+
+                        for memento in timemap_dict["mementos"]["list"]:
+                            timemap.append_memento(memento["datetime"], memento["uri"])
+
+                    else:
+                        timemap.fields["mementos"][memento_key] = \
+                            dict(timemap_dict["mementos"][memento_key])
+
+            elif key == "timemap_uri":
+                timemap.fields[key] = dict(timemap_dict[key])
+
+            else:
+                timemap.fields[key] = timemap_dict[key]
+
+        return timemap
+
+    def append_memento(self, mdt, uri):
+        """Adds the memento at `uri` with the datetime `mdt` to the list."""
+
+        self.datetimes.append(datetime_to_epoch(mdt))
+        self.uris.append(uri)
+
+    def add_link(self, uri, attributes):
+        """Adds the link entry for `uri` with the link `attributes`, such as
+        `rel` and `datetime`, in the same way that
+        `convert_LinkTimeMap_to_dict` adds it to its dictionary."""
+
+        relation = attributes["rel"]
+        first = False
+        last = False
+
+        if relation == "original":
+            self.fields["original_uri"] = uri
+
+        elif relation == "timegate":
+            self.fields["timegate_uri"] = uri
+
+        elif relation == "self":
+            self.fields.setdefault("timemap_uri", {})
+            self.fields["timemap_uri"]["link_format"] = uri
+
+        elif relation == "timemap":
+            self.fields.setdefault("timemap_uri", {})
+
+            if attributes["type"] == "application/link-format":
+                self.fields["timemap_uri"]["link_format"] = uri
+            elif attributes["type"] == "application/json":
+                self.fields["timemap_uri"]["json_format"] = uri
+
+        elif "memento" in relation:
+            self.fields.setdefault("mementos", {})
+
+            if "first" in relation:
+                self.fields["mementos"]["first"] = { "uri": uri }
+                first = True
+
+            if "last" in relation:
+                self.fields["mementos"]["last"] = { "uri": uri }
+                last = True
+
+            # the list itself is stored in the arrays
+            self.fields["mementos"].setdefault("list", None)
+
+        if "datetime" in attributes and "memento" in relation:
+
+            mdt = parse_memento_datetime(attributes["datetime"])
+
+            self.append_memento(mdt, uri)
+
+            if first:
+                self.fields["mementos"]["first"]["datetime"] = mdt
+
+            if last:
+                self.fields["mementos"]["last"]["datetime"] = mdt
+
+    def __getitem__(self, key):
+
+        value = self.fields[key]
+
+        if key == "mementos":
+            value = dict(value)
+            value["list"] = CompactMementoList(self)
+
+        return value
+
+    def __iter__(self):
+
+        return iter(self.fields)
+
+    def __len__(self):
+
+        return len(self.fields)
+
+    def __repr__(self):
+
+        return "CompactTimeMap(original_uri={!r}, {} mementos)".format(
+            self.fields.get("original_uri"), len(self.datetimes))
+
+    def memento_count(self):
+        """Returns the number of mementos in the list."""
+
+        return len(self.datetimes)
+
+    def nbytes(self):
+        """Returns the number of bytes used by the memento datetimes and
+        URI-Ms, not counting the other relations."""
+
+        return self.datetimes.itemsize * len(self.datetimes) + self.uris.nbytes()
+
+    def to_dict(self):
+        """Returns the dictionary that `convert_LinkTimeMap_to_dict` returns
+        for the same TimeMap."""
+
+        timemap_dict = {}
+
+        for key in self.fields:
+
+            if key == "mementos":
+
+                timemap_dict["mementos"] = {}
+
+                for memento_key in self.fields["mementos"]:
+
+                    if memento_key == "list":
+                        timemap_dict["mementos"]["list"] = list(CompactMementoList(self))
+                    else:
+                        timemap_dict["mementos"][memento_key] = \
+                            dict(self.fields["mementos"][memento_key])
+
+            elif key == "timemap_uri":
+                timemap_dict[key] = dict(self.fields[key])
+
+            else:
+                timemap_dict[key] = self.fields[key]
+
+        return timemap_dict
+
+    def dump(self, fp):
+        """Writes this TimeMap to the text file object `fp` as JSON.
+
+        Memento datetimes are written as the difference from the previous
+        memento. If URI-Ms are templated, only their timestamps are written,
+        as 0 where the timestamp matches the memento's datetime.
+        """
+
+        datetime_deltas = []
+        previous = 0
+
+        for seconds in self.datetimes:
+            datetime_deltas.append(seconds - previous)
+            previous = seconds
+
+        data = {
+            "format": "aiu-compact-timemap",
+            "version": compact_timemap_format_version,
+            "fields": _encode_memento_fields(self.fields),
+            "datetime_deltas": datetime_deltas
+        }
+
+        if isinstance(self.uris, TemplatedURIStore):
+
+            timestamps = []
+
+            for seconds, timestamp in zip(self.datetimes, self.uris.timestamps):
+
+                if timestamp == _timestamp_of_epoch(seconds):
+                    timestamps.append(0)
+                else:
+                    timestamps.append(timestamp)
+
+            data["uris"] = {
+                "templates": self.uris.templates,
+                "timestamps": timestamps,
+                "template_indexes": [
+                    -1 if index == TemplatedURIStore.untemplated else index
+                    for index in self.uris.indexes
+                ],
+                "untemplated": self.uris.untemplated_uris
+            }
+
+        else:
+            data["uris"] = list(self.uris)
+
+        json.dump(data, fp, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, fp):
+        """Reads a TimeMap written by `dump` from the text file object
+        `fp`."""
+
+        data = json.load(fp)
+
+        if data.get("format") != "aiu-compact-timemap" or \
+            data.get("version") != compact_timemap_format_version:
+            raise ValueError("unsupported compact TimeMap format")
+
+        templated = isinstance(data["uris"], dict)
+
+        timemap = cls(template_urims=templated)
+        timemap.fields = _decode_memento_fields(data["fields"])
+
+        seconds = 0
+
+        for delta in data["datetime_deltas"]:
+            seconds += delta
+            timemap.datetimes.append(seconds)
+
+        if templated:
+
+            uris = timemap.uris
+            uris.templates = [ tuple(template) for template in data["uris"]["templates"] ]
+            uris.template_indexes = {
+                template: index for index, template in enumerate(uris.templates)
+            }
+
+            for seconds, timestamp, index in zip(timemap.datetimes,
+                data["uris"]["timestamps"], data["uris"]["template_indexes"]):
+
+                if index == -1:
+                    uris.indexes.append(TemplatedURIStore.untemplated)
+                else:
+                    uris.indexes.append(index)
+
+                if timestamp == 0 and index != -1:
+                    timestamp = _timestamp_of_epoch(seconds)
+
+                uris.timestamps.append(timestamp)
+
+            uris.untemplated_uris = {
+                int(index): uri for index, uri in data["uris"]["untemplated"].items()
+            }
+
+        else:
+
+            for uri in data["uris"]:
+                timemap.uris.append(uri)
+
+        return timemap
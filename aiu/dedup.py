@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.dedup
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module keeps an index, in SQLite, of the records written to WARCs, so
+that later exports of a growing collection skip the mementos already
+archived, and a payload archived before is written as a revisit record
+rather than in full.
+"""
+
+import sqlite3
+import logging
+
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def memento_datetime_key(memento_datetime):
+    """Returns the memento-datetime, a `datetime` or a WARC-Date string, as
+    it is stored in the index."""
+
+    if isinstance(memento_datetime, datetime):
+        return memento_datetime.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return memento_datetime
+
+class DedupIndex:
+    """Records, in the SQLite database at `path`, where each memento was
+    written, keyed by its URI-R and memento-datetime, and indexed by its
+    payload digest. The URI-Ms that led to each memento are recorded too,
+    as its URI-R and memento-datetime may differ from those in the TimeMap
+    listing them. Entries only become visible to other connections, and
+    survive a crash, once committed.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+
+        # writer processes share the database, each with a connection
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS records (
+                urir TEXT NOT NULL,
+                memento_datetime TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                record_type TEXT NOT NULL,
+                record_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (urir, memento_datetime)
+            )""")
+
+            self.connection.execute("""CREATE INDEX IF NOT EXISTS records_digest
+                ON records (digest, record_type)""")
+
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS urims (
+                urim TEXT PRIMARY KEY,
+                urir TEXT NOT NULL,
+                memento_datetime TEXT NOT NULL
+            )""")
+
+    def lookup_memento(self, urir, memento_datetime):
+        """Returns the record written for the memento of `urir` at
+        `memento_datetime` as a `dict`, or None if there is none."""
+
+        row = self.connection.execute("""SELECT * FROM records
+            WHERE urir = ? AND memento_datetime = ?""",
+            (urir, memento_datetime_key(memento_datetime))).fetchone()
+
+        return None if row is None else dict(row)
+
+    def lookup_urim(self, urim):
+        """Returns the record written for the memento that the URI-M `urim`
+        led to as a `dict`, or None if there is none."""
+
+        row = self.connection.execute("""SELECT records.* FROM urims
+            JOIN records USING (urir, memento_datetime) WHERE urim = ?""",
+            (urim,)).fetchone()
+
+        return None if row is None else dict(row)
+
+    def lookup_payload(self, digest):
+        """Returns a response record holding the payload with `digest` as a
+        `dict`, or None if there is none."""
+
+        row = self.connection.execute("""SELECT * FROM records
+            WHERE digest = ? AND record_type = 'response' LIMIT 1""",
+            (digest,)).fetchone()
+
+        return None if row is None else dict(row)
+
+    def add_record(self, urir, memento_datetime, digest, record_type, record_id,
+        filename, offset, length):
+        """Records that the memento of `urir` at `memento_datetime` was
+        written as the `record_type` record `record_id`, `length` bytes at
+        `offset` in the WARC `filename`."""
+
+        self.connection.execute("""INSERT OR REPLACE INTO records
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (urir, memento_datetime_key(memento_datetime), digest, record_type,
+                record_id, filename, offset, length))
+
+    def add_urims(self, urims, urir, memento_datetime):
+        """Records that the URI-Ms in `urims` led to the memento of `urir`
+        at `memento_datetime`."""
+
+        self.connection.executemany("INSERT OR REPLACE INTO urims VALUES (?, ?, ?)",
+            [ (urim, urir, memento_datetime_key(memento_datetime)) for urim in urims ])
+
+    def commit(self):
+
+        self.connection.commit()
+
+    def close(self):
+
+        self.connection.commit()
+        self.connection.close()
+
+    def __len__(self):
+
+        return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+def open_dedup_index(dedup):
+    """Returns `dedup` if it is a `DedupIndex` or None, otherwise a
+    `DedupIndex` in the SQLite file `dedup`."""
+
+    if dedup is None or isinstance(dedup, DedupIndex):
+        return dedup
+
+    return DedupIndex(dedup)
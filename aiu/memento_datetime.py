@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.memento_datetime
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module parses the RFC 1123 dates used by the Memento-Datetime header
+and the datetime attribute of link-format TimeMaps.
+"""
+
+import re
+
+from datetime import datetime
+from functools import lru_cache
+
+memento_datetime_format = "%a, %d %b %Y %H:%M:%S GMT"
+
+_months = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
+}
+
+_weekdays = frozenset([ "Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun" ])
+
+# e.g., Mon, 02 Aug 2010 05:51:26 GMT
+_rfc1123_layout = re.compile(
+    r'[A-Z][a-z]{2}, \d\d [A-Z][a-z]{2} \d{4} \d\d:\d\d:\d\d GMT', re.ASCII)
+
+@lru_cache(maxsize=8192)
+def parse_memento_datetime(mdt_string):
+    """Converts the RFC 1123 date in `mdt_string`, such as
+    "Mon, 02 Aug 2010 05:51:26 GMT", into a datetime object.
+
+    Dates in the fixed layout used by web archives are converted by slicing
+    the string rather than with `datetime.strptime`, which is slow and
+    depends on the locale. Anything else is handed to `strptime`, so the
+    same dates are accepted, and the same ValueErrors raised, as before.
+    """
+
+    if _rfc1123_layout.fullmatch(mdt_string) and mdt_string[:3] in _weekdays:
+
+        month = _months.get(mdt_string[8:11])
+
+        if month is not None:
+
+            try:
+                return datetime(
+                    int(mdt_string[12:16]), month, int(mdt_string[5:7]),
+                    int(mdt_string[17:19]), int(mdt_string[20:22]),
+                    int(mdt_string[23:25])
+                )
+            except ValueError:
+                pass
+
+    return datetime.strptime(mdt_string, memento_datetime_format)
@@ -18,14 +18,23 @@ import csv
 import sys
 
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from datetime import datetime
 from bs4 import BeautifulSoup
 
 from .version import user_agent_string
+from .sessions import get_session
+from .cache import open_cache
+from .html_parsers import check_html_parser
 
 logger = logging.getLogger(__name__)
 
+# Pandora pages are parsed with html5lib unless another parser is chosen,
+# as there are no saved Pandora pages to check that the faster parsers
+# scrape the same data from them
+pandora_html_parser = "html5lib"
+
 
 tep_json_prefix = "https://webarchive.nla.gov.au/bamboo-service/tep/"
 
@@ -37,6 +46,12 @@ pandora_sub_prefix ="http://pandora.nla.gov.au/subject/"
 
 trove_tep_prefix = "https://webarchive.nla.gov.au/tep/"
 
+# the number of TEP JSON documents requested at once
+tep_workers = 8
+
+# the number of subject pages requested and parsed at once
+page_workers = 4
+
 
 class PandoraCollectionException(Exception):
     """An exception class to be used by the functions in this file so that the
@@ -44,9 +59,11 @@ class PandoraCollectionException(Exception):
     """
     pass
 
-def extract_main_collection_data(soup):
+def extract_main_collection_data(soup, session=None):
     """Obtain general collection metadata different types of Trove collections contains using the json response.
     """
+    if session is None:
+        session = get_session()
     data = {}
     try:
         span = soup.find('span', id="selectedTitle")
@@ -66,39 +83,19 @@ def extract_main_collection_data(soup):
     for i in range(0,len(itemlist)):
         uls = itemlist[i].find('ul')
         #*****Sub-collection names?*****
-        for ul in uls:
-            newsoup = BeautifulSoup(str(ul), 'html.parser')
-            lis = newsoup.find_all('li')
-            for li in lis:
-                a_tag = li.find('a')
-                tep_href = a_tag['href']
-                tep_id = tep_href.split("/")[2]
-                tep_url = trove_prefix + tep_href
-                text = li.text
-                tep_ids.append(tep_id)
-                tep[tep_id] = (tep_url,text)
+        for li in uls.find_all('li'):
+            a_tag = li.find('a')
+            tep_href = a_tag['href']
+            tep_id = tep_href.split("/")[2]
+            tep_url = trove_prefix + tep_href
+            text = li.text
+            tep_ids.append(tep_id)
+            tep[tep_id] = (tep_url,text)
     data["tep"] = tep
     #print(tep)
-    seed_uris = []
-    urims = []
-    institution_info = {}
-    main_dic = {}
-    for tep_id in tep_ids:
-        tep_json_uri = tep_json_prefix + tep_id
-        tep_dic = get_metadata_from_tep(requests.get(tep_json_uri),data)
-        seed_uri = tep_dic["seed_uri"]
-        mementos = tep_dic["urims"]
-        agencies = tep_dic["institution_info"]
-        urims.extend(mementos) 
-        seed_uris.append(seed_uri)
-        institution_info.update(agencies)
-        main_dic[tep_id] = tep_dic
-    data["seed_uris"] = seed_uris
-    data["urims"] = urims
-    data["institution_info"] = institution_info
-    #print(urims)
+    add_tep_metadata(data, tep_ids, session)
     return data
-    
+
 
 
 def get_metadata_from_tep(res,data):
@@ -158,13 +155,93 @@ def get_metadata_from_tep(res,data):
 
 
 
+def fetch_tep(tep_id, session):
+    """Fetches the JSON metadata of the TEP `tep_id` over `session`. Returns
+    its metadata from `get_metadata_from_tep` and a description of the error
+    if it could not be acquired, otherwise `None`.
+    """
+    tep_json_uri = tep_json_prefix + tep_id
+    try:
+        res = session.get(tep_json_uri)
+        tep_dic = get_metadata_from_tep(res, {})
+    except (requests.exceptions.RequestException, KeyError) as e:
+        return {"exists": False}, repr(e)
+    if not tep_dic["exists"]:
+        #Some tep urls give server error subject 12, https://webarchive.nla.gov.au/bamboo-service/tep/75101
+        return tep_dic, "no TEP JSON at {}, HTTP status {}".format(tep_json_uri, res.status_code)
+    return tep_dic, None
+
+def submit_teps(executor, tep_ids, session, futures):
+    """Submits `fetch_tep` to `executor` for each TEP in `tep_ids` that is not
+    already in `futures`, a dict mapping TEP IDs to their futures."""
+    for tep_id in tep_ids:
+        if tep_id not in futures:
+            futures[tep_id] = executor.submit(fetch_tep, tep_id, session)
+    return futures
+
+def gather_tep_metadata(tep_ids, futures):
+    """Waits for the futures of the TEPs in `tep_ids`. Returns a dict mapping
+    each TEP ID, in the order of `tep_ids`, to its metadata, and a dict mapping
+    each TEP ID whose metadata could not be acquired to its error.
+    """
+    tep_metadata = {}
+    tep_errors = {}
+    for tep_id in tep_ids:
+        if tep_id in tep_metadata:
+            continue
+        tep_dic, error = futures[tep_id].result()
+        tep_metadata[tep_id] = tep_dic
+        if error is not None:
+            logger.warning("could not acquire metadata for TEP {}: {}".format(tep_id, error))
+            tep_errors[tep_id] = error
+    return tep_metadata, tep_errors
+
+def fetch_tep_metadata(tep_ids, session, max_workers=tep_workers):
+    """Fetches the JSON metadata of each TEP in `tep_ids` with `max_workers`
+    concurrent requests over `session`, returning the results of
+    `gather_tep_metadata`.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = submit_teps(executor, tep_ids, session, {})
+        return gather_tep_metadata(tep_ids, futures)
+
+def merge_tep_metadata(data, tep_ids, tep_metadata, tep_errors):
+    """Adds the seed URIs, mementos, and institutions of the TEPs in `tep_ids`
+    to `data` in the order of `tep_ids`, along with the errors of any TEPs
+    that could not be acquired.
+    """
+    seed_uris = []
+    urims = []
+    institution_info = {}
+    for tep_id in tep_ids:
+        if tep_id in tep_errors:
+            continue
+        tep_dic = tep_metadata[tep_id]
+        urims.extend(tep_dic["urims"])
+        seed_uris.append(tep_dic["seed_uri"])
+        institution_info.update(tep_dic.get("institution_info", {}))
+    data["seed_uris"] = seed_uris
+    data["urims"] = urims
+    data["institution_info"] = institution_info
+    data["tep_errors"] = tep_errors
+
+def add_tep_metadata(data, tep_ids, session):
+    """Fetches the metadata of the TEPs in `tep_ids` and merges it into `data`
+    with `merge_tep_metadata`.
+    """
+    tep_metadata, tep_errors = fetch_tep_metadata(tep_ids, session)
+    merge_tep_metadata(data, tep_ids, tep_metadata, tep_errors)
+
+
 class PandoraCollection:
     """Organizes all information acquired about the Pandora collection."""
 
-    def __init__(self, collection_id, session=requests.Session(), logger=None):
+    def __init__(self, collection_id, session=None, logger=None, parser=None, cache=None):
 
         self.collection_id = str(collection_id)
-        self.session = session
+        self.session = session if session is not None else get_session()
+        self.parser = check_html_parser(parser, default=pandora_html_parser)
+        self.cache = open_cache(cache)
         self.metadata_loaded = False
         self.seed_metadata_loaded = False
         self.metadata = {}
@@ -173,22 +250,53 @@ class PandoraCollection:
         self.exists = None
 
         self.collection_uri = "{}{}".format(pandora_col_prefix, collection_id)
-        self.firstpage_response = self.session.get(self.collection_uri) 
+        self._firstpage_response = None
 
         self.logger = logger or logging.getLogger(__name__)  
 
+    @property
+    def firstpage_response(self):
+        """The response for the collection page, requested on first use."""
+
+        return self.fetch_firstpage()
+
+    def fetch_firstpage(self):
+        """Requests the collection page, unless it already has been, and
+        returns its response."""
+
+        if self._firstpage_response is None:
+            self._firstpage_response = self.session.get(self.collection_uri)
+
+        return self._firstpage_response
+
     def load_collection_metadata(self):
-        """Loads collection metadata from an existing directory, if possible.
-        If the existing directory does not exist, it will then download the
-        collection and process its metadata.
+        """Loads collection metadata from the cache, if it is fresh there.
+        Otherwise it downloads the collection and processes its metadata,
+        storing it in the cache unless the collection was not found, which
+        may only be for now, or the metadata of a TEP could not be acquired.
         """
         #print(self.collection_tep_uri)
         if not self.metadata_loaded:
-            soup = BeautifulSoup(self.firstpage_response.text, 'html5lib')
-            self.metadata["main"] = extract_main_collection_data(soup)
+            main = self.cache.load("pandora-collection", self.collection_id, "metadata")
+            if main is None:
+                soup = BeautifulSoup(self.firstpage_response.text, self.parser)
+                main = extract_main_collection_data(soup, session=self.session)
+                if main["exists"] and not main.get("tep_errors"):
+                    self.cache.store("pandora-collection", self.collection_id, "metadata", main)
+            self.metadata["main"] = main
             #self.metadata["optional"] = extract_optional_collection_data(self.session.get(self.collection_json_uri))
             self.metadata_loaded = True
 
+    def invalidate_cache(self):
+        """Removes the metadata of this collection from its cache, and forgets
+        what has been loaded, so that it is acquired again from the archive."""
+
+        self.cache.invalidate("pandora-collection", self.collection_id)
+
+        self.metadata_loaded = False
+        self.metadata = {}
+        self._firstpage_response = None
+
     def does_exist(self):
         """Returns `True` if the collection actually exists and requests for
         its data did not result in HTTP 500*."""
@@ -228,26 +336,48 @@ class PandoraCollection:
         #print(self.metadata["main"]["urims"])
         return self.metadata["main"]["institution_info"]
 
+    def get_tep_errors(self):
+        """Maps each TEP whose metadata could not be acquired to its error."""
+
+        self.load_collection_metadata()
+        return self.metadata["main"].get("tep_errors", {})
+
 def get_list_from_ul(uls,pandora_prefix):
+    """Maps the identifier linked from each item of the `ul` element `uls`
+    to its URL under `pandora_prefix` and its text, walking the items in
+    the tree that has already been parsed.
+    """
     dic = {}
-    for ul in uls:
-        ids = []
-        newsoup = BeautifulSoup(str(ul), 'html.parser')
-        lis = newsoup.find_all('li')
-        for li in lis:
-            a_tag = li.find('a')
-            href = a_tag['href']
-            id = href.split("/")[2]
-            url = pandora_prefix + id
-            text = li.text
-            ids.append(id)
-            dic[id] = (url,text)
+    for li in uls.find_all('li'):
+        a_tag = li.find('a')
+        href = a_tag['href']
+        id = href.split("/")[2]
+        url = pandora_prefix + id
+        text = li.text
+        dic[id] = (url,text)
     return dic
 
 
-def extract_main_subject_data(soup,subject_id):
+def get_teps_from_subject_page(pag_url, session, has_collections, parser=pandora_html_parser):
+    """Fetches the subject page at `pag_url` and lists its TEPs, which are
+    in the second itemlist if the subject's first page `has_collections`.
+    The page is parsed with the BeautifulSoup parser `parser`.
+    """
+    page_response = session.get(pag_url)
+    page_soup = BeautifulSoup(page_response.text, parser)
+    items = page_soup.find_all('div', {"class": "itemlist"})
+    if has_collections:
+        teps = items[1].find('ul')
+    else:
+        teps = items[0].find('ul')
+    return get_list_from_ul(teps,trove_tep_prefix)
+
+
+def extract_main_subject_data(soup,subject_id, session=None, parser=pandora_html_parser):
     """Obtain general collection metadata different types of Trove collections contains using the json response.
     """
+    if session is None:
+        session = get_session()
     data = {}
     try:
         title_list = soup.find_all('span', {"class": "selectedTitle"})
@@ -291,66 +421,38 @@ def extract_main_subject_data(soup,subject_id):
     a_tags = div_nav[1].find_all('a', {"class": "alphabetical"})
     n_pages = len(a_tags) + 2 #Taking the first page and start of list index is 0 into account
     pag_url_prefix = pandora_sub_prefix + subject_id + "/"
-    for i in range(2,n_pages):
-        pag_url = pag_url_prefix + str(i)
-        #print(pag_url)
-        page_response = requests.get(pag_url)
-        page_soup = BeautifulSoup(page_response.text, "html5lib")
-        items = page_soup.find_all('div', {"class": "itemlist"})
-        if len(itemlist) > 1:
-            teps = items[1].find('ul')
-        else:
-            teps = items[0].find('ul')
-        #print(teps)
-        new_tep_dic = get_list_from_ul(teps,trove_tep_prefix)
-        #print(new_tep_dic)
-        tep_dic_all.update(new_tep_dic)
-    #print(tep_dic_all)
-    data["tep"] = tep_dic_all
-    seed_uris = []
-    urims = []
-    institution_info = {}
-    main_dic = {}
-    for tep_id in tep_dic_all:
-        #print(tep_id)
-        tep_json_uri = tep_json_prefix + tep_id
-        #print(tep_json_uri)
-        # try:
-        tep_dic = get_metadata_from_tep(requests.get(tep_json_uri),data)
-        #print(tep_json_uri)
-        #Some tep urls give server error subject 12, https://webarchive.nla.gov.au/bamboo-service/tep/75101
-        # except:
-        #     print(tep_json_uri)
-        #     tep_dic = {}
-
-        try:
-            seed_uri = tep_dic["seed_uri"]
-            mementos = tep_dic["urims"]
-            agencies = tep_dic["institution_info"]
-        except:
-            seed_uri = []
-            mementos = []
-            agencies = []
-        urims.extend(mementos) 
-        seed_uris.append(seed_uri)        
-        institution_info.update(agencies)
-        main_dic[tep_id] = tep_dic
-        #print("done: "+tep_id)
-    #print(main_dic)
-    data["seed_uris"] = seed_uris
-    data["urims"] = urims
-    data["institution_info"] = institution_info
-    #print(urims)
+    #TEP metadata is requested as soon as each page lists its TEPs
+    with ThreadPoolExecutor(max_workers=tep_workers) as tep_executor, \
+        ThreadPoolExecutor(max_workers=page_workers) as page_executor:
+        tep_futures = submit_teps(tep_executor, tep_dic_all, session, {})
+        page_futures = {}
+        for i in range(2,n_pages):
+            pag_url = pag_url_prefix + str(i)
+            page_futures[page_executor.submit(get_teps_from_subject_page,
+                pag_url, session, len(itemlist) > 1, parser)] = i
+        page_tep_dics = {}
+        for future in as_completed(page_futures):
+            new_tep_dic = future.result()
+            page_tep_dics[page_futures[future]] = new_tep_dic
+            submit_teps(tep_executor, new_tep_dic, session, tep_futures)
+        #pages are merged in order, whichever finished first
+        for i in sorted(page_tep_dics):
+            tep_dic_all.update(page_tep_dics[i])
+        data["tep"] = tep_dic_all
+        tep_metadata, tep_errors = gather_tep_metadata(list(tep_dic_all), tep_futures)
+    merge_tep_metadata(data, list(tep_dic_all), tep_metadata, tep_errors)
     return data
 
 
 class PandoraSubject:
     """Organizes all information acquired about the Pandora subject."""
 
-    def __init__(self, subject_id, session=requests.Session(), logger=None):
+    def __init__(self, subject_id, session=None, logger=None, parser=None, cache=None):
 
         self.subject_id = str(subject_id)
-        self.session = session
+        self.session = session if session is not None else get_session()
+        self.parser = check_html_parser(parser, default=pandora_html_parser)
+        self.cache = open_cache(cache)
         self.metadata_loaded = False
         self.seed_metadata_loaded = False
         self.metadata = {}
@@ -359,23 +461,55 @@ class PandoraSubject:
         self.exists = None
 
         self.subject_uri = "{}{}".format(pandora_sub_prefix, subject_id)
-        self.firstpage_response = self.session.get(self.subject_uri) 
+        self._firstpage_response = None
 
         self.logger = logger or logging.getLogger(__name__)  
         #self.session.close()
 
+    @property
+    def firstpage_response(self):
+        """The response for the first subject page, requested on first use."""
+
+        return self.fetch_firstpage()
+
+    def fetch_firstpage(self):
+        """Requests the first subject page, unless it already has been, and
+        returns its response."""
+
+        if self._firstpage_response is None:
+            self._firstpage_response = self.session.get(self.subject_uri)
+
+        return self._firstpage_response
+
     def load_subject_metadata(self):
-        """Loads collection metadata from an existing directory, if possible.
-        If the existing directory does not exist, it will then download the
-        collection and process its metadata.
+        """Loads subject metadata from the cache, if it is fresh there.
+        Otherwise it downloads the subject's pages and processes their
+        metadata, storing it in the cache unless the subject was not found,
+        which may only be for now, or the metadata of a TEP could not be
+        acquired.
         """
         #print(self.collection_tep_uri)
         if not self.metadata_loaded:
-            soup = BeautifulSoup(self.firstpage_response.text, 'html5lib')
-            self.metadata["main"] = extract_main_subject_data(soup,self.subject_id)
+            main = self.cache.load("pandora-subject", self.subject_id, "metadata")
+            if main is None:
+                soup = BeautifulSoup(self.firstpage_response.text, self.parser)
+                main = extract_main_subject_data(soup,self.subject_id, session=self.session, parser=self.parser)
+                if main["exists"] and not main.get("tep_errors"):
+                    self.cache.store("pandora-subject", self.subject_id, "metadata", main)
+            self.metadata["main"] = main
             #self.metadata["optional"] = extract_optional_collection_data(self.session.get(self.collection_json_uri))
             self.metadata_loaded = True
 
+    def invalidate_cache(self):
+        """Removes the metadata of this subject from its cache, and forgets
+        what has been loaded, so that it is acquired again from the archive."""
+
+        self.cache.invalidate("pandora-subject", self.subject_id)
+
+        self.metadata_loaded = False
+        self.metadata = {}
+        self._firstpage_response = None
+
     def does_exist(self):
         """Returns `True` if the collection actually exists and requests for
         its data did not result in HTTP 500*."""
@@ -427,4 +561,10 @@ class PandoraSubject:
 
         self.load_subject_metadata()
         #print(self.metadata["main"]["urims"])
-        return self.metadata["main"]["institution_info"]
\ No newline at end of file
+        return self.metadata["main"]["institution_info"]
+
+    def get_tep_errors(self):
+        """Maps each TEP whose metadata could not be acquired to its error."""
+
+        self.load_subject_metadata()
+        return self.metadata["main"].get("tep_errors", {})
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.sessions
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module creates the `requests` sessions used to talk to the archives,
+with connection pools sized for each archive host so that connections are
+kept alive and reused across requests.
+"""
+
+import logging
+import threading
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+try:
+    # requests_cache.install_cache replaces requests.Session with a caching
+    # subclass, but keeps the class it replaced
+    from requests_cache.core import OriginalSession as UncachedSession
+except ImportError:
+    UncachedSession = requests.Session
+
+from .version import user_agent_string
+
+logger = logging.getLogger(__name__)
+
+# the number of connections kept alive to each archive host
+archive_pool_sizes = {
+    "wayback.archive-it.org": 64,
+    "archive-it.org": 16,
+    "partner.archive-it.org": 4,
+    "webarchive.nla.gov.au": 32,
+    "pandora.nla.gov.au": 16
+}
+
+default_pool_size = 10
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+def create_session(pool_sizes=None, default_pool_size=default_pool_size):
+    """This function creates a `requests.Session` that keeps up to
+    `pool_sizes[host]` connections alive to each host listed in
+    `pool_sizes`, defaulting to `archive_pool_sizes`, and up to
+    `default_pool_size` connections to any other host.
+    """
+
+    return _create_session(requests.Session, pool_sizes, default_pool_size)
+
+def create_uncached_session(pool_sizes=None, default_pool_size=default_pool_size):
+    """This function creates a session like `create_session`, but one that
+    bypasses any cache installed by `requests_cache.install_cache`, for
+    downloads whose bodies must be read exactly as sent, such as raw
+    mementos.
+    """
+
+    return _create_session(UncachedSession, pool_sizes, default_pool_size)
+
+def _create_session(session_class, pool_sizes, default_pool_size):
+
+    if pool_sizes is None:
+        pool_sizes = archive_pool_sizes
+
+    session = session_class()
+    session.headers['user-agent'] = user_agent_string
+
+    default_adapter = HTTPAdapter(pool_maxsize=default_pool_size)
+    session.mount('http://', default_adapter)
+    session.mount('https://', default_adapter)
+
+    for host in pool_sizes:
+
+        adapter = HTTPAdapter(pool_maxsize=pool_sizes[host])
+
+        for scheme in ('http', 'https'):
+            session.mount('{}://{}/'.format(scheme, host), adapter)
+
+    return session
+
+def get_session():
+    """This function returns the session shared by every part of aiu that
+    is not given a session of its own, creating it with `create_session`
+    on first use.
+    """
+
+    global _shared_session
+
+    with _shared_session_lock:
+
+        if _shared_session is None:
+            logger.debug("creating shared session")
+            _shared_session = create_session()
+
+        return _shared_session
+
+def connection_statistics(session):
+    """This function returns a `dict` mapping each host that `session` has
+    connected to, as `scheme://host:port`, to a `dict` counting the
+    `connections` opened to it and the `requests` sent over them. Every
+    request beyond the first on a connection reused it.
+
+    Counts are kept by each connection pool, so they only cover pools the
+    session still holds.
+    """
+
+    statistics = {}
+    adapters = set(session.adapters.values())
+
+    for adapter in adapters:
+
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+
+            pool = pools.get(key)
+
+            if pool is None:
+                continue
+
+            host = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+            counts = statistics.setdefault(host, { "connections": 0, "requests": 0 })
+
+            counts["connections"] += pool.num_connections
+            counts["requests"] += pool.num_requests
+
+    return statistics
@@ -7,11 +7,32 @@ otmt.timemap
 This module allows one to parse a link-format TimeMap.
 """
 
-from datetime import datetime
+import os
+import re
+import gzip
+import codecs
+import multiprocessing
+
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+from .memento_datetime import parse_memento_datetime
+from .compact_timemap import CompactTimeMap, datetime_to_epoch, epoch_to_datetime
 
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
 
+# outcomes of scanning a single link entry with _scan_link_entry
+_NO_ENTRY = 0           # only whitespace remains in the text
+_ENTRY_COMPLETE = 1     # the entry ended with a comma
+_ENTRY_AT_END = 2       # the entry ended with the text
+_ENTRY_INCOMPLETE = 3   # the text ended in the middle of the entry
+_ENTRY_MALFORMED = 4    # the entry does not follow the link format
+
+_non_whitespace = re.compile(r'\S')
+_unquoted_value_end = re.compile(r'[;,"]')
+
 class MalformedLinkFormatTimeMap(Exception):
     """
         This class exists to indicate errors while processing TimeMaps in
@@ -19,88 +40,221 @@ class MalformedLinkFormatTimeMap(Exception):
     """
     pass
 
-def convert_LinkTimeMap_to_dict(timemap_text, skipErrors=False, debug=False, noquotes=False):
+def _process_local_dict(local_dict, working_dict, debug=False):
+    """
+        Adds the relation described by `local_dict`, a mapping of one URI
+        to its link attributes, to the TimeMap dictionary `working_dict`.
     """
-        A function to convert the link format TimeMap text into a Python 
-        dictionary that closely resembles the JSON specified at:
-        http://mementoweb.org/guide/timemap-json/
 
-        There is one difference: the value of the datetime attribute is
-        an actual Python datetime object.
+    if debug == True:
+        print("local dict:")
+        pp.pprint(local_dict)
 
-        One can set skipErrors to True in order to skip errors in processing
-        the TimeMap, but use with caution as it can lead to unpredictable
-        behavior.
+    first = False
+    last = False
+
+    for uri in local_dict:
+
+        relation = local_dict[uri]["rel"]
+
+        local_memento_dict = {}
+
+        if relation == "original":
+            working_dict["original_uri"] = uri
+
+        elif relation == "timegate":
+            working_dict["timegate_uri"] = uri
+
+        elif relation == "self":
+            working_dict.setdefault( "timemap_uri", {} )
+            working_dict["timemap_uri"]["link_format"] = uri
+
+        elif relation == "timemap":
+            working_dict.setdefault( "timemap_uri", {} )
+
+            if local_dict[uri]["type"] == "application/link-format":
+                working_dict["timemap_uri"]["link_format"] = uri
+            elif local_dict[uri]["type"] == "application/json":
+                working_dict["timemap_uri"]["json_format"] = uri
+
+        elif "memento" in relation:
+            working_dict.setdefault("mementos", {})
+
+            if "first" in relation:
+                working_dict["mementos"]["first"] = {}
+                working_dict["mementos"]["first"]["uri"] = uri
+                first = True
+
+            if "last" in relation:
+                working_dict["mementos"]["last"] = {}
+                working_dict["mementos"]["last"]["uri"] = uri
+                last = True
+
+            working_dict["mementos"].setdefault("list", [])
+
+            local_memento_dict["datetime"] = None
+            local_memento_dict["uri"] = uri
+
+        if "datetime" in local_dict[uri] and "memento" in relation:
+
+            mdt = parse_memento_datetime(local_dict[uri]["datetime"])
+
+            local_memento_dict["datetime"] = mdt
+
+            working_dict["mementos"]["list"].append(local_memento_dict)
+
+            if first:
+                working_dict["mementos"]["first"]["datetime"] = mdt
+
+            if last:
+                working_dict["mementos"]["last"]["datetime"] = mdt
+
+    return working_dict
+
+def _skip_whitespace(text, pos):
+    """
+        Returns the position of the first non-whitespace character in `text`
+        at or after `pos`, or the length of `text` if there is none.
+    """
+
+    match = _non_whitespace.search(text, pos)
+
+    if match is None:
+        return len(text)
+
+    return match.start()
+
+def _scan_link_entry(text, pos, noquotes=False):
+    """
+        Scans the link entry, e.g., `<uri>; rel="memento"; datetime="..."`,
+        starting at position `pos` of `text`, jumping between delimiters
+        with `str.find` rather than visiting each character.
+
+        Returns a tuple of (outcome, uri, attributes, end position). Only
+        entries written exactly as the character-by-character state
+        machine expects them are reported as complete, so that both engines
+        produce the same result for the same input.
     """
 
-    def process_local_dict(local_dict, working_dict):
+    textlen = len(text)
+    start = _skip_whitespace(text, pos)
 
-        if debug == True:
-            print("local dict:")
-            pp.pprint(local_dict)
+    if start == textlen:
+        return _NO_ENTRY, None, None, start
 
-        first = False
-        last = False
+    if text[start] != '<':
+        return _ENTRY_MALFORMED, None, None, start
 
-        for uri in local_dict:
+    uri_end = text.find('>', start + 1)
 
-            relation = local_dict[uri]["rel"]
+    if uri_end == -1:
+        return _ENTRY_INCOMPLETE, None, None, start
 
-            local_memento_dict = {}
+    uri = text[start + 1:uri_end].strip()
+    attributes = {}
 
-            if relation == "original":
-                working_dict["original_uri"] = uri
+    separator = _skip_whitespace(text, uri_end + 1)
 
-            elif relation == "timegate":
-                working_dict["timegate_uri"] = uri
+    if separator == textlen:
+        return _ENTRY_INCOMPLETE, None, None, start
 
-            elif relation == "self":
-                working_dict.setdefault( "timemap_uri", {} )
-                working_dict["timemap_uri"]["link_format"] = uri
+    if text[separator] != ';':
+        return _ENTRY_MALFORMED, None, None, start
+
+    while True:
+
+        equals = text.find('=', separator + 1)
+
+        if equals == -1:
+            return _ENTRY_INCOMPLETE, None, None, start
+
+        key = text[separator + 1:equals].strip()
+        value_start = _skip_whitespace(text, equals + 1)
+
+        if value_start == textlen:
+            return _ENTRY_INCOMPLETE, None, None, start
+
+        if text[value_start] == '"':
 
-            elif relation == "timemap":
-                working_dict.setdefault( "timemap_uri", {} )
+            value_end = text.find('"', value_start + 1)
 
-                if local_dict[uri]["type"] == "application/link-format":
-                    working_dict["timemap_uri"]["link_format"] = uri
-                elif local_dict[uri]["type"] == "application/json":
-                    working_dict["timemap_uri"]["json_format"] = uri
+            if value_end == -1:
+                return _ENTRY_INCOMPLETE, None, None, start
 
-            elif "memento" in relation:
-                working_dict.setdefault("mementos", {})
+            attributes[key] = text[value_start + 1:value_end].strip()
+            separator = _skip_whitespace(text, value_end + 1)
 
-                if "first" in relation:
-                    working_dict["mementos"]["first"] = {}
-                    working_dict["mementos"]["first"]["uri"] = uri
-                    first = True
+            if separator == textlen:
+                return _ENTRY_AT_END, uri, attributes, separator
 
-                if "last" in relation:
-                    working_dict["mementos"]["last"] = {}
-                    working_dict["mementos"]["last"]["uri"] = uri
-                    last = True
+        elif noquotes == True:
 
-                working_dict["mementos"].setdefault("list", [])
+            # an unquoted value at the very end of the text is never stored
+            # by the state machine, so it is treated as incomplete here
+            match = _unquoted_value_end.search(text, value_start)
 
-                local_memento_dict["datetime"] = None
-                local_memento_dict["uri"] = uri
+            if match is None:
+                return _ENTRY_INCOMPLETE, None, None, start
 
-            if "datetime" in local_dict[uri] and "memento" in relation:
+            separator = match.start()
 
-                mdt = datetime.strptime(local_dict[uri]["datetime"],
-                    "%a, %d %b %Y %H:%M:%S GMT")
+            if text[separator] == '"':
+                return _ENTRY_MALFORMED, None, None, start
 
-                local_memento_dict["datetime"] = mdt
+            attributes[key] = text[value_start:separator].strip()
 
-                working_dict["mementos"]["list"].append(local_memento_dict)
+        else:
+            return _ENTRY_MALFORMED, None, None, start
+
+        if text[separator] == ',':
+            return _ENTRY_COMPLETE, uri, attributes, separator + 1
+
+        if text[separator] != ';':
+            return _ENTRY_MALFORMED, None, None, start
+
+def _convert_with_tokenizer(timemap_text, debug=False, noquotes=False, compact=False, template_urims=False):
+    """
+        Converts `timemap_text` one whole link entry at a time. Returns
+        `None` if the text contains anything the tokenizer does not
+        recognize, leaving it to the state machine to handle (or report) it.
+    """
+
+    if compact:
+        timemap = CompactTimeMap(template_urims=template_urims)
+        add_link = timemap.add_link
+    else:
+        timemap = {}
+        add_link = lambda uri, attributes: _process_local_dict(
+            { uri: attributes }, timemap, debug=debug)
+
+    textlen = len(timemap_text)
+    pos = 0
+
+    while True:
+
+        outcome, uri, attributes, pos = _scan_link_entry(
+            timemap_text, pos, noquotes=noquotes)
+
+        if outcome == _NO_ENTRY:
+            return timemap
+
+        if outcome not in (_ENTRY_COMPLETE, _ENTRY_AT_END):
+            return None
 
-                if first:
-                    working_dict["mementos"]["first"]["datetime"] = mdt
+        # the state machine processes the last entry twice if the text
+        # ends directly after a comma, so leave that case to it
+        if outcome == _ENTRY_COMPLETE and pos == textlen:
+            return None
 
-                if last:
-                    working_dict["mementos"]["last"]["datetime"] = mdt
-                
-        return working_dict
+        add_link(uri, attributes)
 
+        if outcome == _ENTRY_AT_END:
+            return timemap
+
+def _convert_with_statemachine(timemap_text, skipErrors=False, debug=False, noquotes=False):
+    """
+        Converts `timemap_text` one character at a time.
+    """
 
     dict_timemap = {}
 
@@ -187,7 +341,7 @@ def convert_LinkTimeMap_to_dict(timemap_text, skipErrors=False, debug=False, noq
                     key = ""
                     value = ""
 
-                    process_local_dict(local_dict, dict_timemap)
+                    _process_local_dict(local_dict, dict_timemap, debug=debug)
 
                 else:
                     value += character
@@ -199,7 +353,7 @@ def convert_LinkTimeMap_to_dict(timemap_text, skipErrors=False, debug=False, noq
                 elif character == ',':
                     state = 0
 
-                    process_local_dict(local_dict, dict_timemap)
+                    _process_local_dict(local_dict, dict_timemap, debug=debug)
 
                 elif character == '"':
                     state = 5
@@ -226,11 +380,371 @@ def convert_LinkTimeMap_to_dict(timemap_text, skipErrors=False, debug=False, noq
                 value += character
 
         else:
-            
+
             if not skipErrors:
                 raise MalformedLinkFormatTimeMap(
                     "discovered unknown state while processing TimeMap")
 
-    process_local_dict(local_dict, dict_timemap)
+    _process_local_dict(local_dict, dict_timemap, debug=debug)
+
+    return dict_timemap
+
+def convert_LinkTimeMap_to_dict(timemap_text, skipErrors=False, debug=False, noquotes=False, engine="tokenizer", compact=False, template_urims=False):
+    """
+        A function to convert the link format TimeMap text into a Python
+        dictionary that closely resembles the JSON specified at:
+        http://mementoweb.org/guide/timemap-json/
+
+        There is one difference: the value of the datetime attribute is
+        an actual Python datetime object.
+
+        One can set skipErrors to True in order to skip errors in processing
+        the TimeMap, but use with caution as it can lead to unpredictable
+        behavior.
+
+        The `engine` argument selects the parser. The default, "tokenizer",
+        scans whole link entries at a time and hands any text it does not
+        recognize to the original character-by-character "statemachine"
+        engine, so both engines return the same dictionary.
+
+        If `compact` is True, a `CompactTimeMap` is returned instead. It
+        can be read in the same way as the dictionary, but keeps memento
+        datetimes and URI-Ms in arrays, using far less memory for TimeMaps
+        with many mementos.
+
+        If `template_urims` is True, a CompactTimeMap is returned that keeps
+        only the 14-digit timestamp of each URI-M that follows the patterns
+        of `archive_information.archive_mappings`, rebuilding the URI-M when
+        it is accessed.
+    """
+
+    compact = compact or template_urims
+
+    if engine == "tokenizer":
+
+        timemap = _convert_with_tokenizer(timemap_text, debug=debug,
+            noquotes=noquotes, compact=compact, template_urims=template_urims)
+
+        if timemap is not None:
+            return timemap
+
+    elif engine != "statemachine":
+        raise ValueError("unknown TimeMap parser engine {}".format(engine))
+
+    dict_timemap = _convert_with_statemachine(timemap_text,
+        skipErrors=skipErrors, debug=debug, noquotes=noquotes)
+
+    if compact:
+        return CompactTimeMap.from_dict(dict_timemap, template_urims=template_urims)
 
     return dict_timemap
+
+def _iter_text_chunks(stream, chunk_size=65536, encoding=None):
+    """
+        Generates text from `stream`, which may be a `requests` response,
+        a file object, or an iterable of chunks. Chunks of bytes are decoded
+        incrementally so that no character is split between two chunks.
+    """
+
+    def read_chunks():
+
+        while True:
+
+            chunk = stream.read(chunk_size)
+
+            if not chunk:
+                return
+
+            yield chunk
+
+    if hasattr(stream, "iter_content"):
+        encoding = encoding or stream.encoding
+        chunks = stream.iter_content(chunk_size=chunk_size)
+    elif hasattr(stream, "read"):
+        chunks = read_chunks()
+    else:
+        chunks = stream
+
+    decoder = None
+
+    for chunk in chunks:
+
+        if not chunk:
+            continue
+
+        if isinstance(chunk, bytes):
+
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(
+                    encoding or "utf-8")(errors="replace")
+
+            chunk = decoder.decode(chunk)
+
+        yield chunk
+
+    if decoder is not None:
+        yield decoder.decode(b"", final=True)
+
+def _link_record(uri, attributes):
+    """
+        Builds the record generated by `iter_LinkTimeMap` for the link entry
+        of `uri` with `attributes`.
+    """
+
+    record = dict(attributes)
+    record["uri"] = uri
+
+    if "datetime" in record and "memento" in record.get("rel", ""):
+        record["datetime"] = parse_memento_datetime(record["datetime"])
+
+    return record
+
+def iter_LinkTimeMap(stream, skipErrors=False, noquotes=False, chunk_size=65536, encoding=None):
+    """
+        A generator that parses a link format TimeMap incrementally from
+        `stream` and yields one record per link entry, so that a TimeMap
+        never needs to be held in memory all at once.
+
+        The `stream` may be a `requests` response (ideally requested with
+        `stream=True`), a file object opened in text or binary mode, or any
+        iterable of `str` or `bytes` chunks, such as the output of
+        `response.iter_content()`. Bytes are decoded with `encoding`, which
+        defaults to the response's encoding, or UTF-8.
+
+        Each record is a dictionary holding the attributes of the link
+        entry, such as `rel` and `type`, plus its URI in `uri`. As with
+        `convert_LinkTimeMap_to_dict`, the `datetime` of a memento is an
+        actual Python datetime object.
+
+        One can set skipErrors to True in order to skip link entries that
+        cannot be parsed rather than raising MalformedLinkFormatTimeMap.
+    """
+
+    buffer = ""
+    pos = 0
+    charcount = 0
+
+    def handle_malformed(entry_start):
+
+        if not skipErrors:
+            raise MalformedLinkFormatTimeMap(
+                "issue at character {} while looking for the next link "
+                "entry".format(charcount + entry_start + 1))
+
+        # resume at the next URI, dropping what cannot be parsed
+        next_uri = buffer.find('<', entry_start + 1)
+
+        if next_uri == -1:
+            return len(buffer)
+
+        return next_uri
+
+    for chunk in _iter_text_chunks(stream, chunk_size=chunk_size, encoding=encoding):
+
+        charcount += pos
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+        while True:
+
+            outcome, uri, attributes, end = _scan_link_entry(
+                buffer, pos, noquotes=noquotes)
+
+            if outcome == _ENTRY_COMPLETE:
+                yield _link_record(uri, attributes)
+                pos = end
+
+            elif outcome == _ENTRY_MALFORMED:
+                pos = handle_malformed(end)
+
+            else:
+                # the entry may continue in the next chunk
+                break
+
+    while True:
+
+        outcome, uri, attributes, end = _scan_link_entry(
+            buffer, pos, noquotes=noquotes)
+
+        if outcome in (_ENTRY_COMPLETE, _ENTRY_AT_END):
+            yield _link_record(uri, attributes)
+            pos = end
+
+        elif outcome == _ENTRY_MALFORMED:
+            pos = handle_malformed(end)
+
+        elif outcome == _ENTRY_INCOMPLETE:
+
+            if not skipErrors:
+                raise MalformedLinkFormatTimeMap(
+                    "TimeMap ended in the middle of the link entry at "
+                    "character {}".format(charcount + end + 1))
+
+            break
+
+        else:
+            break
+
+def _parse_timemap_item(item, is_path, skipErrors=False, template_urims=True):
+    """
+        Parses one entry of `parse_timemaps_parallel`, reading it from the
+        file `item` if `is_path`. This runs in the worker processes, so it
+        reads any files itself rather than having their text pickled over
+        from the parent.
+    """
+
+    if is_path:
+
+        filename = os.fspath(item)
+
+        if filename.endswith(".json.gz"):
+            with gzip.open(filename, 'rt') as f:
+                return CompactTimeMap.load(f)
+
+        with open(filename, encoding='utf8', errors='replace') as f:
+            item = f.read()
+
+    return convert_LinkTimeMap_to_dict(item, skipErrors=skipErrors,
+        template_urims=template_urims, compact=True)
+
+def parse_timemaps_parallel(texts_or_paths, workers=None, skipErrors=False, template_urims=True, paths=False):
+    """
+        Parses many link format TimeMaps across `workers` processes,
+        defaulting to one per CPU, and returns a list of `CompactTimeMap`
+        objects in the same order as `texts_or_paths`.
+
+        Each entry of `texts_or_paths` is either the text of a TimeMap or
+        an `os.PathLike` path of a file holding one, such as those written
+        to the `capture/timemaps` directory by
+        `process_timemaps_for_mementos`. If `paths` is True, every entry,
+        string or not, is a path. Files ending in `.json.gz` are loaded as
+        stored CompactTimeMaps.
+
+        Like `convert_LinkTimeMap_to_dict`, a malformed TimeMap raises
+        `MalformedLinkFormatTimeMap` unless `skipErrors` is True.
+
+        CompactTimeMaps are returned because they are far cheaper to send
+        back from the workers than the equivalent dictionaries.
+    """
+
+    items = list(texts_or_paths)
+    is_paths = [ paths or isinstance(item, os.PathLike) for item in items ]
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    workers = min(workers, len(items))
+
+    if workers <= 1:
+        return [ _parse_timemap_item(item, is_path, skipErrors, template_urims)
+            for item, is_path in zip(items, is_paths) ]
+
+    chunksize = max(1, len(items) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_timemap_item, items, is_paths,
+            [skipErrors] * len(items), [template_urims] * len(items),
+            chunksize=chunksize))
+
+class TimeMap:
+    """
+        Answers datetime queries over the mementos of a TimeMap parsed by
+        `convert_LinkTimeMap_to_dict`, either as a dictionary or as a
+        `CompactTimeMap`, without issuing any requests.
+
+        Mementos are kept sorted by datetime, with duplicate entries for the
+        same URI-M and datetime (e.g., a "first memento" also listed as a
+        "memento") removed, so that each query is a binary search.
+    """
+
+    def __init__(self, timemap):
+
+        self.original_uri = timemap.get("original_uri")
+
+        if isinstance(timemap, CompactTimeMap):
+            epochs = timemap.datetimes
+            uris = timemap.uris
+        else:
+            mementos = timemap.get("mementos", {}).get("list", [])
+            epochs = [ datetime_to_epoch(memento["datetime"]) for memento in mementos ]
+            uris = [ memento["uri"] for memento in mementos ]
+
+        self.epochs = array('q')
+        self.uris = []
+
+        for i in sorted(range(len(epochs)), key=lambda i: (epochs[i], uris[i])):
+
+            if len(self.uris) > 0 and self.epochs[-1] == epochs[i] and \
+                self.uris[-1] == uris[i]:
+                continue
+
+            self.epochs.append(epochs[i])
+            self.uris.append(uris[i])
+
+    def __len__(self):
+
+        return len(self.uris)
+
+    def __iter__(self):
+
+        for i in range(len(self.uris)):
+            yield self.memento(i)
+
+    def memento(self, index):
+        """Returns the memento at position `index` in datetime order as a
+        dictionary of its `datetime` and `uri`."""
+
+        return {
+            "datetime": epoch_to_datetime(self.epochs[index]),
+            "uri": self.uris[index]
+        }
+
+    def nearest(self, mdt):
+        """Returns the memento closest to the datetime `mdt`, preferring the
+        earlier memento when two are equally close, or `None` if there are
+        no mementos."""
+
+        if len(self.uris) == 0:
+            return None
+
+        seconds = datetime_to_epoch(mdt)
+        index = bisect_left(self.epochs, seconds)
+
+        if index == len(self.epochs):
+            return self.memento(index - 1)
+
+        if index > 0 and seconds - self.epochs[index - 1] <= self.epochs[index] - seconds:
+            return self.memento(index - 1)
+
+        return self.memento(index)
+
+    def before(self, mdt):
+        """Returns the latest memento with a datetime before `mdt`, or `None`
+        if there is none."""
+
+        index = bisect_left(self.epochs, datetime_to_epoch(mdt))
+
+        if index == 0:
+            return None
+
+        return self.memento(index - 1)
+
+    def after(self, mdt):
+        """Returns the earliest memento with a datetime after `mdt`, or
+        `None` if there is none."""
+
+        index = bisect_right(self.epochs, datetime_to_epoch(mdt))
+
+        if index == len(self.epochs):
+            return None
+
+        return self.memento(index)
+
+    def range(self, start, end):
+        """Returns the list of mementos with datetimes from `start` through
+        `end`, inclusive."""
+
+        first = bisect_left(self.epochs, datetime_to_epoch(start))
+        last = bisect_right(self.epochs, datetime_to_epoch(end))
+
+        return [ self.memento(i) for i in range(first, last) ]
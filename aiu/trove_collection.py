@@ -23,6 +23,8 @@ from datetime import datetime
 from bs4 import BeautifulSoup
 
 from .version import user_agent_string
+from .cache import open_cache
+from .sessions import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -37,9 +39,11 @@ class TroveCollectionException(Exception):
     """
     pass
 
-def extract_main_collection_data(res,collection_id):
+def extract_main_collection_data(res,collection_id, session=None):
     """Obtain general collection metadata different types of Trove collections contains using the json response.
     """
+    if session is None:
+        session = get_session()
     data = {}
     
     try:
@@ -47,7 +51,7 @@ def extract_main_collection_data(res,collection_id):
         data["exists"] = True             
     except Exception as e:
         try:
-            response = requests.get("https://webarchive.nla.gov.au/collection/" + collection_id)
+            response = session.get("https://webarchive.nla.gov.au/collection/" + collection_id)
             #print(response.text)
             if "It looks like we don’t have a page for this collection." in response.text:
                 data["exists"] = False
@@ -129,10 +133,11 @@ def extract_main_collection_data(res,collection_id):
 class TroveCollection:
     """Organizes all information acquired about the NLA Trove collection."""
 
-    def __init__(self, collection_id, session=requests.Session(), logger=None):
+    def __init__(self, collection_id, session=None, logger=None, cache=None):
 
         self.collection_id = str(collection_id)
-        self.session = session
+        self.session = session if session is not None else get_session()
+        self.cache = open_cache(cache)
         self.metadata_loaded = False
         self.seed_metadata_loaded = False
         self.metadata = {}
@@ -141,22 +146,53 @@ class TroveCollection:
         self.exists = None
 
         self.collection_json_uri = "{}/{}".format(collection_json_prefix, collection_id)
- 
+        self._firstpage_response = None
 
         self.logger = logger or logging.getLogger(__name__)  
         #self.session.close()
 
+    @property
+    def firstpage_response(self):
+        """The response for the collection JSON, requested on first use."""
+
+        return self.fetch_firstpage()
+
+    def fetch_firstpage(self):
+        """Requests the collection JSON, unless it already has been, and
+        returns its response."""
+
+        if self._firstpage_response is None:
+            self._firstpage_response = self.session.get(self.collection_json_uri)
+
+        return self._firstpage_response
+
     def load_collection_metadata(self):
-        """Loads collection metadata from an existing directory, if possible.
-        If the existing directory does not exist, it will then download the
-        collection and process its metadata.
+        """Loads collection metadata from the cache, if it is fresh there.
+        Otherwise it downloads the collection JSON and processes its
+        metadata, storing it in the cache unless the collection was not
+        found, which may only be for now.
         """
 
         if not self.metadata_loaded:
-            self.metadata["main"] = extract_main_collection_data(self.session.get(self.collection_json_uri), self.collection_id)
+            main = self.cache.load("trove", self.collection_id, "metadata")
+            if main is None:
+                main = extract_main_collection_data(self.firstpage_response, self.collection_id, session=self.session)
+                if main["exists"]:
+                    self.cache.store("trove", self.collection_id, "metadata", main)
+            self.metadata["main"] = main
             #self.metadata["optional"] = extract_optional_collection_data(self.session.get(self.collection_json_uri))
             self.metadata_loaded = True
 
+    def invalidate_cache(self):
+        """Removes the metadata of this collection from its cache, and forgets
+        what has been loaded, so that it is acquired again from the archive."""
+
+        self.cache.invalidate("trove", self.collection_id)
+
+        self.metadata_loaded = False
+        self.metadata = {}
+        self._firstpage_response = None
+
     def does_exist(self):
         """Returns `True` if the collection actually exists and requests for
         its data did not result in HTTP 500*."""
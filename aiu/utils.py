@@ -17,18 +17,25 @@ import multiprocessing
 import csv
 import json
 import hashlib
-import random
+import gzip
+
+from contextlib import contextmanager
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED, ThreadPoolExecutor
 
 from requests_futures.sessions import FuturesSession
-from requests.exceptions import ConnectionError, TooManyRedirects
+from requests.exceptions import ConnectionError, TooManyRedirects, RequestException
 
 from .archive_information import generate_raw_urim
-from .timemap import convert_LinkTimeMap_to_dict
+from .timemap import convert_LinkTimeMap_to_dict, parse_timemaps_parallel
+from .sessions import create_session
 from .version import user_agent_string
 
 logger = logging.getLogger(__name__)
 cpu_count = multiprocessing.cpu_count()
 
+# the number of collection first pages requested at once by `prefetch`
+prefetch_workers = 16
+
 def get_head_responses(session, uris):
     """This function creates a futures object for each URI-M in `uris,
     using an existing `session` object from requests-futures. Only HEAD
@@ -65,6 +72,104 @@ def get_uri_responses(session, raw_uris):
 
     return futures
 
+def _iter_windowed_responses(submit, uris, window):
+    """This function calls `submit` on each of `uris` to create a future,
+    keeping no more than `window` futures outstanding, and generates a
+    `(uri, future)` tuple for each future as it completes. Duplicate URIs
+    are only submitted once.
+    """
+
+    if window is None:
+        window = cpu_count * 4
+
+    if window < 1:
+        raise ValueError("the request window must be at least 1, not {}".format(window))
+
+    uris = iter(uris)
+    submitted = set()
+    pending = {}
+
+    def submit_next():
+
+        for uri in uris:
+
+            if uri not in submitted:
+                submitted.add(uri)
+                pending[submit(uri)] = uri
+                return
+
+    for i in range(window):
+        submit_next()
+
+    while len(pending) > 0:
+
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+
+            uri = pending.pop(future)
+            submit_next()
+
+            yield uri, future
+
+def iter_head_responses(session, uris, window=None):
+    """This function issues HEAD requests for the URI-Ms in `uris` using an
+    existing `session` object from requests-futures, like
+    `get_head_responses`, but keeps at most `window` requests in flight,
+    defaulting to four per CPU, and generates a `(uri, future)` tuple for
+    each request as it completes.
+    """
+
+    def submit(uri):
+
+        logger.debug("issuing HEAD on uri {}".format(uri))
+
+        return session.head(uri,
+            headers={'user-agent': user_agent_string},
+            allow_redirects=True)
+
+    return _iter_windowed_responses(submit, uris, window)
+
+def iter_uri_responses(session, raw_uris, window=None):
+    """This function issues GET requests for the URI-Ms in `raw_uris` using
+    an existing `session` object from requests-futures, like
+    `get_uri_responses`, but keeps at most `window` requests in flight,
+    defaulting to four per CPU, and generates a `(uri, future)` tuple for
+    each request as it completes.
+
+    The responses are streamed, so each should be read or closed before
+    the next is requested to release its connection.
+    """
+
+    def submit(uri):
+
+        logger.debug("issuing GET on uri {}".format(uri))
+
+        return session.get(uri,
+            headers={'user-agent': user_agent_string},
+            stream=True)
+
+    return _iter_windowed_responses(submit, raw_uris, window)
+
+@contextmanager
+def _futures_session(session, max_workers):
+    """This function yields a `FuturesSession` that issues its requests
+    over `session` from `max_workers` threads. If `session` is None, a
+    session from `create_session` is used, and closed afterwards.
+    """
+
+    owned = session is None
+
+    if owned:
+        session = create_session()
+
+    try:
+        with FuturesSession(session=session, max_workers=max_workers) as futures_session:
+            yield futures_session
+    finally:
+        if owned:
+            session.close()
+
 def generate_archiveit_urits(cid, seed_uris):
     """This function generates TimeMap URIs (URI-Ts) for a list of `seed_uris`
     from an Archive-It colleciton specified by `cid`.
@@ -81,72 +186,142 @@ def generate_archiveit_urits(cid, seed_uris):
 
     return urit_list
 
-def discover_raw_urims(urimlist, futures=None):
+def _find_raw_urim(urim, future):
+    """This function examines the completed HEAD request in `future` for
+    URI-M `urim`, returning a tuple of its raw URI-M and any error.
+    """
+
+    logger.debug("searching for raw version of URI-M {}".format(urim))
+
+    try:
+
+        response = future.result()
+
+        if "memento-datetime" in response.headers:
+
+            if len(response.history) == 0:
+                raw_urim = generate_raw_urim(urim)
+            else:
+                raw_urim = generate_raw_urim(response.url)
+
+            logger.debug("added raw URI-M {} associated with URI-M {}"
+                " to the list to be downloaded".format(raw_urim, urim))
+
+            return raw_urim, None
+
+        else:
+
+            warn_msg = "No Memento-Datetime in Response Headers for " \
+                "URI-M {}".format(urim)
+
+            logger.warning(warn_msg)
+
+            return None, warn_msg
+
+    except ConnectionError as e:
+        logger.warning("While acquiring memento at {} there was an error of {}, "
+            "this event is being recorded".format(urim, repr(e)))
+        return None, repr(e)
+
+    except TooManyRedirects as e:
+        logger.warning("While acquiring memento at {} there was an error of {},"
+            "this event is being recorded".format(urim, repr(e)))
+        return None, repr(e)
+
+def iter_raw_urims(urimlist, futures=None, max_workers=None, window=None, session=None):
     """This function checks that the URI-Ms in `urimlist` are valid mementos,
     following all redirects and checking for a Memento-Datetime header.
-    """
 
-    raw_urimdata = {}
-    errordata = {}
+    It generates a `(urim, raw_urim, error)` tuple for each URI-M as soon as
+    its HEAD request completes, where one of `raw_urim` or `error` is None,
+    so that raw mementos can be downloaded while other URI-Ms are still
+    being checked.
+
+    If `futures` is not given, the HEAD requests are issued over `session`,
+    defaulting to one from `create_session`, with `max_workers` threads,
+    defaulting to the number of CPUs, keeping no more than `window` of them
+    in flight, defaulting to four per thread.
+    """
 
     if futures == None:
-        with FuturesSession(max_workers=cpu_count) as session:
-            futures = get_head_responses(session, urimlist)
 
-    working_uri_list = list(futures.keys())
+        if max_workers is None:
+            max_workers = cpu_count
 
-    completed_urims = []
+        if window is None:
+            window = max_workers * 4
 
-    # for urim in list_generator(working_uri_list):
-    while len(completed_urims) < len(list(working_uri_list)):
+        with _futures_session(session, max_workers) as futures_session:
 
-        urim = random.choice(
-            list(set(working_uri_list) - set(completed_urims))
-        )
+            for urim, future in iter_head_responses(futures_session, urimlist,
+                window=window):
 
-        logger.debug("checking if URI-M {} is done downloading".format(urim))
+                raw_urim, error = _find_raw_urim(urim, future)
 
-        if futures[urim].done():
+                yield urim, raw_urim, error
 
-            logger.debug("searching for raw version of URI-M {}".format(urim))
+        return
 
-            try:
+    future_urims = { futures[urim]: urim for urim in futures }
 
-                response = futures[urim].result()
+    for future in as_completed(future_urims):
 
-                if "memento-datetime" in response.headers:
+        urim = future_urims[future]
+        raw_urim, error = _find_raw_urim(urim, future)
 
-                    if len(response.history) == 0:
-                        raw_urimdata[urim] = generate_raw_urim(urim)
-                    else:
-                        raw_urimdata[urim] = generate_raw_urim(response.url)
+        yield urim, raw_urim, error
 
-                    logger.debug("added raw URI-M {} associated with URI-M {}"
-                        " to the list to be downloaded".format(raw_urimdata[urim], urim))
+def discover_raw_urims(urimlist, futures=None, max_workers=None, window=None, session=None):
+    """This function checks that the URI-Ms in `urimlist` are valid mementos,
+    following all redirects and checking for a Memento-Datetime header.
 
-                else:
+    It returns a `dict` mapping each valid URI-M to its raw URI-M and a
+    `dict` mapping each other URI-M to its error. See `iter_raw_urims` to
+    receive these results as they arrive.
+    """
 
-                    warn_msg = "No Memento-Datetime in Response Headers for " \
-                        "URI-M {}".format(urim)
+    raw_urimdata = {}
+    errordata = {}
 
-                    logger.warning(warn_msg)
-                    errordata[urim] = warn_msg
+    for urim, raw_urim, error in iter_raw_urims(urimlist, futures=futures,
+        max_workers=max_workers, window=window, session=session):
 
-            except ConnectionError as e:
-                logger.warning("While acquiring memento at {} there was an error of {}, "
-                    "this event is being recorded".format(urim, repr(e)))
-                errordata[urim] = repr(e)
+        if error is None:
+            raw_urimdata[urim] = raw_urim
+        else:
+            errordata[urim] = error
 
-            except TooManyRedirects as e:
-                logger.warning("While acquiring memento at {} there was an error of {},"
-                    "this event is being recorded".format(urim, repr(e)))
-                errordata[urim] = repr(e)
+    return raw_urimdata, errordata
 
-            finally:
-                logger.debug("Removing URI-M {} from the processing list".format(urim))
-                completed_urims.append(urim)
+def prefetch(collections, max_workers=prefetch_workers):
+    """This function requests the first page of each of `collections`,
+    which may be any mix of `ArchiveItCollection`, `PandoraCollection`,
+    `PandoraSubject` and `TroveCollection` objects, with `max_workers`
+    requests in flight at once. Their metadata can then be loaded without
+    waiting on the archive for each in turn.
 
-    return raw_urimdata, errordata
+    It returns a `dict` mapping each collection whose first page could not
+    be requested to the exception raised. Such a collection will request
+    its first page again when its metadata is needed.
+    """
+
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        futures = { executor.submit(collection.fetch_firstpage): collection
+            for collection in collections }
+
+        for future in as_completed(futures):
+
+            try:
+                future.result()
+            except RequestException as e:
+                logger.warning("failed to prefetch a collection's first page, "
+                    "there was an error of {}".format(repr(e)))
+                errors[futures[future]] = e
+
+    return errors
 
 def list_generator(input_list):
     """This function generates the next item in a list. It is useful for lists
@@ -161,11 +336,63 @@ def list_generator(input_list):
             logger.debug("yielding {}".format(item))
             yield item
 
-def process_timemaps_for_mementos(urit_list, working_directory):
+def store_timemap(urit, timemap_content, output_directory, storage="raw"):
+    """This function parses the TimeMap text `timemap_content` downloaded
+    from `urit` and stores it in `output_directory` as described for
+    `process_timemaps_for_mementos`, returning a tuple of the name of the
+    file written and the parsed TimeMap.
+    """
+
+    uritfilename = hashlib.sha256(urit.encode('utf8')).hexdigest()
+
+    if storage == "compact":
+
+        uritfilename = "{}.json.gz".format(uritfilename)
+
+        timemap = convert_LinkTimeMap_to_dict(
+            timemap_content, skipErrors=True, template_urims=True)
+
+        with gzip.open("{}/{}".format(
+            output_directory, uritfilename), 'wt') as tmout:
+            timemap.dump(tmout)
+
+    else:
+
+        with open("{}/{}".format(
+            output_directory, uritfilename), 'w') as tmout:
+            tmout.write(timemap_content)
+
+        timemap = convert_LinkTimeMap_to_dict(
+            timemap_content, skipErrors=True)
+
+    return uritfilename, timemap
+
+def process_timemaps_for_mementos(urit_list, working_directory, storage="raw", max_workers=None, window=None, session=None):
     """This function acquires a list of mementos from a list of TimeMaps URIs.
     The TimeMaps are stored in `working_directory`.
+
+    The TimeMaps are downloaded over `session`, defaulting to one from
+    `create_session`, by `max_workers` threads, defaulting to the
+    number of CPUs, with no more than `window` downloads in flight,
+    defaulting to four per thread, and
+    each one is stored and parsed as soon as its download completes.
+
+    With the default `storage` of "raw", each TimeMap is stored as it was
+    downloaded and parsed into a `dict`. With a `storage` of "compact",
+    each TimeMap is parsed into a `CompactTimeMap` with templated URI-Ms,
+    which is stored as gzipped JSON, taking a fraction of the memory and
+    disk space.
     """
 
+    if storage not in ("raw", "compact"):
+        raise ValueError("unknown TimeMap storage {}".format(storage))
+
+    if max_workers is None:
+        max_workers = cpu_count
+
+    if window is None:
+        window = max_workers * 4
+
     timemap_data = {}
 
     output_directory = "{}/capture/timemaps".format(working_directory)
@@ -173,95 +400,153 @@ def process_timemaps_for_mementos(urit_list, working_directory):
     if not os.path.isdir(output_directory):
         os.makedirs(output_directory)
 
-    with FuturesSession(max_workers=cpu_count) as session:
-        futures = get_uri_responses(session, urit_list)
+    with open("{}/manifest.tsv".format(output_directory), 'w') as manifestout, \
+        open("{}/errors.jsonl".format(output_directory), 'w') as errorsout, \
+        _futures_session(session, max_workers) as futures_session:
 
-    working_uri_list = list(futures.keys())
+        fieldnames = [ "URI-T", "Filename"]
 
-    with open("{}/manifest.tsv".format(output_directory), 'w') as manifestout:
+        manifestwriter = csv.DictWriter(manifestout, fieldnames, delimiter='\t')
+        manifestwriter.writeheader()
 
-        with open("{}/errors.jsonl".format(output_directory), 'w') as errorsout:
+        for urit, future in iter_uri_responses(futures_session, urit_list, window=window):
 
-            fieldnames = [ "URI-T", "Filename"]
+            logger.debug("URI-T {} is done, extracting content".format(urit))
 
-            manifestwriter = csv.DictWriter(manifestout, fieldnames, delimiter='\t')
-            manifestwriter.writeheader()
+            try:
+                response = future.result()
 
-            for urit in list_generator(working_uri_list):
+                http_status = response.status_code
 
-                logger.debug("checking if URI-T {} is done downloading".format(urit))
+                if http_status == 200:
 
-                if futures[urit].done():
+                    logger.info("adding TimeMap content for URI-T {}".format(
+                        urit))
 
-                    logger.debug("URI-T {} is done, extracting content".format(urit))
+                    uritfilename, timemap_data[urit] = store_timemap(
+                        urit, response.text, output_directory, storage=storage)
 
-                    try:
-                        response = futures[urit].result()
+                    manifestwriter.writerow({
+                        'URI-T': urit,
+                        'Filename': uritfilename
+                    })
 
-                        http_status = response.status_code
+                else:
+                    errorsout.write("{}\n".format(json.dumps(
+                        {
+                            "URI-T": urit,
+                            "status": http_status,
+                            "headers": dict(response.headers)
+                        }
+                    )))
 
-                        if http_status == 200:
+            except ConnectionError as e:
 
-                            timemap_content = response.text
+                logger.warning("There was a connection error while attempting "
+                    "to download URI-T {}".format(urit))
 
-                            logger.info("adding TimeMap content for URI-T {}".format(
-                                urit))
+                errorsout.write("{}\n".format(json.dumps(
+                    {
+                        "URI-T": urit,
+                        "error": repr(e)
+                    }
+                )))
 
-                            uritfilename = hashlib.sha256(urit.encode('utf8')).hexdigest()
+            except TooManyRedirects as e:
 
-                            with open("{}/{}".format(
-                                output_directory, uritfilename), 'w') as tmout:
-                                tmout.write(timemap_content)
+                logger.warning("There were too many redirects while attempting "
+                    "to download URI-T {}".format(urit))
 
-                            timemap_data[urit] = convert_LinkTimeMap_to_dict(
-                                timemap_content, skipErrors=True)
+                errorsout.write("{}\n".format(json.dumps(
+                    {
+                        "URI-T": urit,
+                        "error": repr(e)
+                    }
+                )))
 
-                            manifestwriter.writerow({
-                                'URI-T': urit,
-                                'Filename': uritfilename
-                            })
+    return timemap_data
 
-                        else:
-                            errorsout.write("{}\n".format(json.dumps(
-                                {
-                                    "URI-T": urit,
-                                    "status": http_status,
-                                    "headers": dict(response.headers)
-                                }
-                            )))
+def fetch_timemaps(urit_list, max_workers=None, window=None, session=None):
+    """This function downloads and parses the TimeMaps at `urit_list`, like
+    `process_timemaps_for_mementos`, but without storing them, and returns
+    a `dict` mapping each URI-T to its parsed TimeMap and a `dict` mapping
+    each URI-T that could not be acquired to its error.
 
-                        # TODO: else store connection errors
-                        working_uri_list.remove(urit)
-                    
-                    except ConnectionError as e:
+    The TimeMaps are downloaded over `session`, defaulting to one from
+    `create_session`, so that connections to each archive host are drawn
+    from its pool.
 
-                        logger.warning("There was a connection error while attempting "
-                            "to download URI-T {}".format(urit))
+    An error is either `{"type": "http_error", "data": {...}}`, with the
+    status, headers and content of a non-200 response, or
+    `{"type": "exception", "data": e}` with the exception raised.
+    """
 
-                        errorsout.write(json.dumps(
-                            {
-                                "URI-T": urit,
-                                "error": repr(e)
-                            }
-                        ))
+    if max_workers is None:
+        max_workers = cpu_count
 
-                        # TODO: store connection errors in CollectionModel
-                        working_uri_list.remove(urit)
+    if window is None:
+        window = max_workers * 4
 
-                    except TooManyRedirects as e:
+    timemap_data = {}
+    errors_data = {}
 
-                        logger.warning("There were too many redirects while attempting "
-                            "to download URI-T {}".format(urit))
+    with _futures_session(session, max_workers) as futures_session:
 
-                        errorsout.write(json.dumps(
-                            {
-                                "URI-T": urit,
-                                "error": repr(e)
-                            }
-                        ))
+        for urit, future in iter_uri_responses(futures_session, urit_list, window=window):
 
-                        # TODO: store connection errors in CollectionModel
-                        working_uri_list.remove(urit)
+            logger.debug("URI-T {} is done, extracting content".format(urit))
 
-    return timemap_data
+            try:
+                response = future.result()
+
+                if response.status_code == 200:
+
+                    logger.info("adding TimeMap content for URI-T {}".format(
+                        urit))
+
+                    timemap_data[urit] = convert_LinkTimeMap_to_dict(
+                        response.text, skipErrors=True)
+
+                else:
+
+                    logger.error("got a non-200 response for {}".format(urit))
+
+                    errors_data[urit] = {
+                        "type": "http_error",
+                        "data": {
+                            "message": "non-200 HTTP status",
+                            "response_headers": dict(response.headers),
+                            "response_status": response.status_code,
+                            "response_content": response.text
+                        }
+                    }
+
+            except RequestException as e:
+
+                logger.warning("There was an error of {} while attempting "
+                    "to download URI-T {}".format(repr(e), urit))
+
+                errors_data[urit] = {
+                    "type": "exception",
+                    "data": e
+                }
+
+    return timemap_data, errors_data
+
+def load_captured_timemaps(working_directory, workers=None):
+    """This function parses the TimeMaps stored in `working_directory` by
+    `process_timemaps_for_mementos`, spreading the work across `workers`
+    processes, and returns a `dict` mapping each URI-T to a `CompactTimeMap`.
+    """
+
+    timemap_directory = "{}/capture/timemaps".format(working_directory)
+
+    with open("{}/manifest.tsv".format(timemap_directory)) as manifestin:
+        rows = list(csv.DictReader(manifestin, delimiter='\t'))
+
+    # the TimeMaps were stored skipping malformed entries, so they are again
+    timemaps = parse_timemaps_parallel(
+        [ "{}/{}".format(timemap_directory, row['Filename']) for row in rows ],
+        workers=workers, skipErrors=True, paths=True)
 
+    return dict(zip([ row['URI-T'] for row in rows ], timemaps))
@@ -0,0 +1,954 @@
+# -*- coding: utf-8 -*-
+
+"""
+aiu.warc
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module downloads raw mementos and writes them to WARCs. Downloads run
+on a pool of threads and are handed, as each completes, through a bounded
+queue to the thread that writes the WARC records, or on to a number of
+writer processes that each compress their own series of WARCs. A CDX index
+of the records written is kept alongside the WARCs, and, if given, a
+`DedupIndex` lets later runs skip what is already archived.
+
+`export_mementos_to_warc` is the entry point used by `seeds2warc` and
+`tm2warc`.
+"""
+
+import os
+import io
+import re
+import json
+import heapq
+import pickle
+import shutil
+import queue
+import socket
+import getpass
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+from datetime import datetime
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+from warcio.utils import Digester
+from warcio.warcwriter import WARCWriter
+from warcio.statusandheaders import StatusAndHeaders
+
+from .timemap import convert_LinkTimeMap_to_dict, MalformedLinkFormatTimeMap
+from .memento_datetime import parse_memento_datetime
+from .dedup import DedupIndex, open_dedup_index
+from .sessions import create_uncached_session
+from .utils import discover_raw_urims
+from .version import user_agent_string
+
+logger = logging.getLogger(__name__)
+
+# the number of raw mementos downloaded at once
+default_download_workers = 16
+
+# the number of downloaded raw mementos that may wait for the writer
+default_queue_size = 64
+
+# payloads larger than this many bytes are buffered on disk rather than in memory
+payload_spool_size = 1024 * 1024
+
+# the size in bytes after which a new WARC is started
+default_rollover_size = 100000000
+
+# the number of processes writing WARCs, 1 writing them in this process
+default_writer_processes = 1
+
+cdx_header = " CDX N b a m s k r M S V g"
+
+class ConsumedRawStreamException(Exception):
+    """Raised when the body of a raw memento has already been read, and
+    decoded, before `read_payload` could read it as sent. This happens when
+    it is downloaded with a session that caches responses."""
+    pass
+
+class RawMemento:
+    """A raw memento downloaded by `iter_raw_mementos`, its `payload` a
+    file as returned by `read_payload`. If it could not be downloaded, or
+    its original resource could not be found, `error` describes why and
+    the other attributes may be None.
+
+    When pickled, as on its way to a writer process, the payload is sent
+    as bytes and spooled again on arrival, unless `spool_payload` has moved
+    it to a file, in which case only the file's name is sent, and the file
+    is removed when the unpickled memento is closed.
+    """
+
+    def __init__(self, raw_urim, urims, status_code=None, headers=None,
+        payload=None, urir=None, error=None):
+
+        self.raw_urim = raw_urim
+        self.urims = urims
+        self.status_code = status_code
+        self.headers = headers
+        self.payload = payload
+        self.urir = urir
+        self.error = error
+        self.payload_filename = None
+        self.owns_payload_file = False
+
+    def close(self):
+
+        if self.payload is not None:
+            self.payload.close()
+
+        if self.owns_payload_file:
+            os.remove(self.payload_filename)
+            self.owns_payload_file = False
+
+    def spool_payload(self, directory):
+        """Moves a payload larger than `payload_spool_size` bytes to a file
+        in `directory`, so that pickling sends its filename rather than
+        reading it into memory."""
+
+        if self.payload is None or self.payload_filename is not None:
+            return
+
+        self.payload.seek(0, io.SEEK_END)
+
+        if self.payload.tell() <= payload_spool_size:
+            return
+
+        self.payload.seek(0)
+
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".payload",
+            delete=False) as payload_file:
+            shutil.copyfileobj(self.payload, payload_file)
+
+        self.payload.close()
+        self.payload = open(payload_file.name, 'rb')
+        self.payload_filename = payload_file.name
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state["owns_payload_file"] = False
+
+        if self.payload_filename is not None:
+            state["payload"] = None
+
+        elif self.payload is not None:
+            self.payload.seek(0)
+            state["payload"] = self.payload.read()
+
+        return state
+
+    def __setstate__(self, state):
+
+        payload = state["payload"]
+
+        if state["payload_filename"] is not None:
+            state["payload"] = open(state["payload_filename"], 'rb')
+            state["owns_payload_file"] = True
+
+        elif payload is not None:
+            state["payload"] = tempfile.SpooledTemporaryFile(max_size=payload_spool_size)
+            state["payload"].write(payload)
+            state["payload"].seek(0)
+
+        self.__dict__.update(state)
+
+def find_original_uri(session, headers, sample_urim):
+    """Returns the URI-R from the original relation in the Link header in
+    `headers`, or, failing that, in the Link header of `sample_urim`, one
+    of the URI-Ms leading to the raw memento. Returns None if neither has
+    one."""
+
+    try:
+        return convert_LinkTimeMap_to_dict(headers["link"])["original_uri"]
+    except (KeyError, MalformedLinkFormatTimeMap):
+        logger.warning("no original relation in the Link header for raw memento, "
+            "attempting to acquire it from URI-M {}".format(sample_urim))
+
+    r = session.get(sample_urim)
+
+    try:
+        return convert_LinkTimeMap_to_dict(r.headers["link"])["original_uri"]
+    except (KeyError, MalformedLinkFormatTimeMap):
+        return None
+
+def read_payload(response):
+    """Returns a file holding the body of the streamed `response` exactly
+    as it was sent, without undoing any content encoding. It is kept in
+    memory unless larger than `payload_spool_size` bytes.
+
+    Raises `ConsumedRawStreamException` if the body has already been read,
+    as by requests_cache, whose content no longer matches the
+    Content-Encoding of the response."""
+
+    if response._content_consumed or getattr(response, "from_cache", False):
+        raise ConsumedRawStreamException("the body of {} was read before its raw "
+            "payload, download raw mementos with an uncached session".format(response.url))
+
+    payload = tempfile.SpooledTemporaryFile(max_size=payload_spool_size)
+
+    try:
+        chunk = response.raw.read(65536, decode_content=False)
+
+        while chunk:
+            payload.write(chunk)
+            chunk = response.raw.read(65536, decode_content=False)
+
+    except (TypeError, RuntimeError) as e:
+        # raised by urllib3 once the body has been read and decoded
+        payload.close()
+        raise ConsumedRawStreamException("could not read the raw payload of {}: {}".format(
+            response.url, repr(e))) from e
+
+    except BaseException:
+        payload.close()
+        raise
+
+    payload.seek(0)
+
+    return payload
+
+def fetch_raw_memento(session, raw_urim, urims):
+    """Downloads the raw memento at `raw_urim`, which the URI-Ms in `urims`
+    lead to, returning a `RawMemento` holding its payload."""
+
+    try:
+
+        with session.get(raw_urim, stream=True) as response:
+            headers = response.raw.headers
+
+            if "memento-datetime" not in headers:
+                return RawMemento(raw_urim, urims, error="no Memento-Datetime in response "
+                    "headers for raw memento at {}, status {}".format(raw_urim, response.status_code))
+
+            payload = read_payload(response)
+
+        urir = find_original_uri(session, headers, urims[0])
+
+    except RequestException as e:
+        logger.warning("could not download raw memento at {}: {}".format(raw_urim, repr(e)))
+        return RawMemento(raw_urim, urims, error=repr(e))
+
+    if urir is None:
+        payload.close()
+        return RawMemento(raw_urim, urims, error="could not process raw memento at {}, "
+            "no original relation in Link header at sample memento {} either".format(
+                raw_urim, urims[0]))
+
+    return RawMemento(raw_urim, urims, response.status_code, headers, payload, urir)
+
+def iter_raw_mementos(raw_urims_to_urims, session=None,
+    max_workers=default_download_workers, queue_size=default_queue_size):
+    """This function downloads each raw URI-M in the `dict`
+    `raw_urims_to_urims`, which maps it to the URI-Ms leading to it, on
+    `max_workers` threads, and generates a `RawMemento` for each as soon
+    as its download completes.
+
+    At most `queue_size` downloaded raw mementos wait to be generated, so
+    downloads pause, rather than fill memory, when the consumer falls
+    behind. The consumer blocks, without polling, while none are ready.
+
+    `session` defaults to one made by `create_uncached_session`. If it
+    caches responses, `ConsumedRawStreamException` is raised rather than
+    raw mementos with bodies that no longer match their headers generated.
+    """
+
+    if session is None:
+        session = create_uncached_session()
+
+    completed = queue.Queue(maxsize=queue_size)
+    stopping = threading.Event()
+
+    def download(raw_urim):
+
+        if stopping.is_set():
+            return
+
+        try:
+            memento = fetch_raw_memento(session, raw_urim, raw_urims_to_urims[raw_urim])
+        except ConsumedRawStreamException as e:
+            # every download with this session would fail the same way
+            memento = e
+        except Exception as e:
+            logger.exception("unexpected error downloading raw memento at {}".format(raw_urim))
+            memento = RawMemento(raw_urim, raw_urims_to_urims[raw_urim], error=repr(e))
+
+        while not stopping.is_set():
+            try:
+                completed.put(memento, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+
+        for raw_urim in raw_urims_to_urims:
+            executor.submit(download, raw_urim)
+
+        for i in range(len(raw_urims_to_urims)):
+
+            memento = completed.get()
+
+            if isinstance(memento, ConsumedRawStreamException):
+                raise memento
+
+            yield memento
+
+    finally:
+        # lets any download blocked on a full queue give up if the
+        # consumer stops early
+        stopping.set()
+        executor.shutdown(wait=True)
+
+def cdx_urlkey(uri):
+    """Returns the SURT-ordered key under which `uri` is sorted in a CDX,
+    such as `com,example)/path?a=1&b=2` for
+    `http://www.example.com/path?b=2&a=1`."""
+
+    parts = urlsplit(uri.strip().lower())
+
+    host = re.sub(r'^www\d*\.', '', parts.hostname or '')
+    urlkey = ",".join(reversed(host.split(".")))
+
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+
+    if port is not None and (parts.scheme, port) not in (('http', 80), ('https', 443)):
+        urlkey = "{}:{}".format(urlkey, port)
+
+    urlkey = "{}){}".format(urlkey, parts.path or "/")
+
+    if parts.query:
+        urlkey = "{}?{}".format(urlkey, "&".join(sorted(parts.query.split("&"))))
+
+    return urlkey
+
+def cdx_line(record, filename, offset, length):
+    """Returns the CDX line for the response or revisit `record`, written
+    to the WARC `filename` at `offset` and taking `length` bytes."""
+
+    target_uri = record.rec_headers.get_header('WARC-Target-URI')
+    http_headers = record.http_headers
+
+    if record.rec_type == 'revisit':
+        mime = 'warc/revisit'
+    else:
+        mime = http_headers.get_header('Content-Type', '-').split(';')[0].strip() or '-'
+
+    status = '-'
+    redirect = '-'
+
+    if http_headers is not None:
+        status = http_headers.get_statuscode()
+
+        if status.startswith('3'):
+            redirect = http_headers.get_header('Location', '-')
+
+    digest = record.rec_headers.get_header('WARC-Payload-Digest', '-')
+
+    if digest.startswith('sha1:'):
+        digest = digest[len('sha1:'):]
+
+    return " ".join([
+        cdx_urlkey(target_uri),
+        re.sub(r'\D', '', record.rec_headers.get_header('WARC-Date'))[:14],
+        target_uri,
+        mime.replace(" ", ""),
+        status,
+        digest,
+        redirect,
+        '-',
+        str(length),
+        str(offset),
+        filename
+    ])
+
+def write_cdx(cdx_filename, lines):
+    """Writes a CDX with the sorted `lines` to `cdx_filename`, merged with
+    the lines of the CDX already there, from an earlier run, if any."""
+
+    earlier = open(cdx_filename) if os.path.exists(cdx_filename) else None
+
+    try:
+        if earlier is not None:
+            earlier.readline()
+            lines = heapq.merge(lines, ( line.rstrip("\n") for line in earlier ))
+
+        with open("{}.tmp".format(cdx_filename), 'w') as f:
+            f.write("{}\n".format(cdx_header))
+
+            for line in lines:
+                f.write("{}\n".format(line))
+
+    finally:
+        if earlier is not None:
+            earlier.close()
+
+    os.replace("{}.tmp".format(cdx_filename), cdx_filename)
+
+def merge_cdx(cdx_filenames, cdx_filename):
+    """Merges the sorted CDXs `cdx_filenames` into one sorted CDX at
+    `cdx_filename`, reading each a line at a time."""
+
+    files = [ open(filename) for filename in cdx_filenames ]
+
+    try:
+        for f in files:
+            f.readline()
+
+        write_cdx(cdx_filename, ( line.rstrip("\n") for line in heapq.merge(*files) ))
+
+    finally:
+        for f in files:
+            f.close()
+
+class RollingWARCWriter:
+    """Writes WARC records to a series of WARCs named
+    `<filename_stem>-<n>.warc.gz`, or `.warc` if not `gzip`, starting the
+    next once the current one exceeds `rollover_size` bytes. Each WARC
+    begins with a warcinfo record made from the `dict` `warcinfo`. The CDX
+    lines of the response and revisit records written are kept in
+    `cdx_lines`. A series left by an earlier run is continued, never
+    overwritten.
+    """
+
+    def __init__(self, filename_stem, warcinfo, rollover_size=default_rollover_size, gzip=True):
+
+        self.filename_stem = filename_stem
+        self.warcinfo = warcinfo
+        self.rollover_size = rollover_size
+        self.gzip = gzip
+        self.filenames = []
+        self.cdx_lines = []
+        self.next_number = 0
+
+        self.output = None
+        self.writer = None
+        self.records = 0
+
+    def _open_next(self):
+
+        self.close()
+
+        while True:
+
+            filename = "{}-{}.{}".format(self.filename_stem, self.next_number,
+                "warc.gz" if self.gzip else "warc")
+            self.next_number += 1
+
+            if not os.path.exists(filename):
+                break
+
+        logger.info("creating new WARC at {}".format(filename))
+
+        self.output = open(filename, 'xb')
+        self.writer = WARCWriter(self.output, gzip=self.gzip)
+        self.filenames.append(filename)
+        self.records = 0
+
+        self.writer.write_record(self.writer.create_warcinfo_record(
+            os.path.basename(filename), self.warcinfo))
+
+    def write_record(self, record):
+        """Writes `record`, returning the name of the WARC it was written
+        to, its offset in that WARC, and its length."""
+
+        if self.output is None or \
+            (self.records > 0 and self.output.tell() > self.rollover_size):
+            self._open_next()
+
+        # each record is its own gzip member, so it can be read from its offset
+        offset = self.output.tell()
+
+        self.writer.write_record(record)
+        self.records += 1
+
+        filename = os.path.basename(self.filenames[-1])
+        length = self.output.tell() - offset
+
+        if record.rec_type in ('response', 'revisit'):
+            self.cdx_lines.append(cdx_line(record, filename, offset, length))
+
+        return filename, offset, length
+
+    def create_warc_record(self, *args, **kwargs):
+
+        if self.writer is None:
+            self._open_next()
+
+        return self.writer.create_warc_record(*args, **kwargs)
+
+    def create_revisit_record(self, *args, **kwargs):
+
+        if self.writer is None:
+            self._open_next()
+
+        return self.writer.create_revisit_record(*args, **kwargs)
+
+    def flush(self):
+
+        if self.output is not None:
+            self.output.flush()
+
+    def close(self):
+
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+            self.writer = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+def payload_digest(payload):
+    """Returns the digest of the file `payload` as warcio writes it in
+    WARC-Payload-Digest, leaving the file at its start."""
+
+    digester = Digester('sha1')
+
+    payload.seek(0)
+
+    for chunk in iter(lambda: payload.read(65536), b''):
+        digester.update(chunk)
+
+    payload.seek(0)
+
+    return str(digester)
+
+def write_raw_memento(writer, memento, dedup=None):
+    """Writes the `RawMemento` `memento` with `writer` as a response record
+    for the first URI-M leading to it, and a revisit record, pointing to
+    the response by its payload digest, for each of the others.
+
+    With the `DedupIndex` `dedup`, a memento whose URI-R and
+    memento-datetime are already in the index is not written at all, and
+    one whose payload is already in the index gets only revisit records,
+    pointing to the earlier response. The record written, and the URI-Ms
+    leading to it, are then added to the index.
+    """
+
+    # sometimes, via redirects, the different URI-Ms end up at the
+    # same raw URI-M
+    logger.info("There are {} URI-Ms leading to raw URI-M {}".format(
+        len(memento.urims), memento.raw_urim))
+
+    http_headers = StatusAndHeaders(str(memento.status_code),
+        memento.headers.items(), protocol="HTTP/1.1")
+
+    #TODO: don't we want the MDT of the URI-M, not the raw URI-M discovered at the end of the redirect chain?
+    mdt = parse_memento_datetime(memento.headers['memento-datetime']).strftime(
+        "%Y-%m-%dT%H:%M:%SZ")
+    nowdate = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def warc_headers_dict(urim):
+
+        return {
+            "WARC-Date": mdt,
+            "WARC-Creation-Date": nowdate,
+            "WARC-Source-URI": memento.raw_urim,
+            "WARC-Source-URI-Orig": urim
+        }
+
+    previous = None
+    response_headers = warc_headers_dict(memento.urims[0])
+
+    if dedup is not None:
+
+        if dedup.lookup_memento(memento.urir, mdt) is not None:
+            logger.info("the memento of {} at {} is already archived, skipping raw URI-M {}".format(
+                memento.urir, mdt, memento.raw_urim))
+            dedup.add_urims(memento.urims, memento.urir, mdt)
+            return
+
+        # warcio does not digest a payload again if given its digest
+        response_headers["WARC-Payload-Digest"] = payload_digest(memento.payload)
+        previous = dedup.lookup_payload(response_headers["WARC-Payload-Digest"])
+
+    if previous is None:
+
+        logger.info("writing out WARC response record for URI-M {}".format(memento.urims[0]))
+
+        # with the length known, warcio digests the payload in place rather
+        # than copying it to a buffer of its own
+        length = memento.payload.seek(0, io.SEEK_END)
+        memento.payload.seek(0)
+
+        record = writer.create_warc_record(memento.urir, 'response',
+            payload=memento.payload, length=length, http_headers=http_headers,
+            warc_headers_dict=response_headers)
+
+        location = writer.write_record(record)
+
+        digest = record.rec_headers.get_header('WARC-Payload-Digest')
+        refers_to = (memento.urir, mdt, record.rec_headers.get_header('WARC-Record-ID'))
+        revisit_urims = memento.urims[1:]
+
+    else:
+
+        logger.info("the payload of raw URI-M {} is already archived as {}".format(
+            memento.raw_urim, previous["record_id"]))
+
+        digest = previous["digest"]
+        refers_to = (previous["urir"], previous["memento_datetime"], previous["record_id"])
+        revisit_urims = memento.urims
+
+    for index, urim in enumerate(revisit_urims):
+
+        logger.info("writing out WARC revisit record for URI-M {}".format(urim))
+
+        revisit_headers = warc_headers_dict(urim)
+        revisit_headers["WARC-Refers-To"] = refers_to[2]
+
+        revisit = writer.create_revisit_record(memento.urir, digest,
+            refers_to[0], refers_to[1], http_headers=http_headers,
+            warc_headers_dict=revisit_headers)
+
+        revisit_location = writer.write_record(revisit)
+
+        # without a response, the index points to the first revisit
+        if previous is not None and index == 0:
+            record, location = revisit, revisit_location
+
+    if dedup is not None:
+        dedup.add_record(memento.urir, mdt, digest, record.rec_type,
+            record.rec_headers.get_header('WARC-Record-ID'), *location)
+        dedup.add_urims(memento.urims, memento.urir, mdt)
+
+def write_warc_series(mementos, filename_stem, warcinfo,
+    rollover_size=default_rollover_size, gzip=True, dedup=None):
+    """Writes each `RawMemento` from the iterable `mementos` with a
+    `RollingWARCWriter`, then a sorted CDX of the records written to
+    `<filename_stem>.cdx`. The `DedupIndex` `dedup`, if given, is consulted
+    and committed after each memento, once its records are flushed.
+
+    It returns the filenames of the WARCs written and a list of
+    (URI-M, raw URI-M, error) for the raw mementos that could not be.
+    """
+
+    errors = []
+
+    with RollingWARCWriter(filename_stem, warcinfo,
+        rollover_size=rollover_size, gzip=gzip) as writer:
+
+        for memento in mementos:
+
+            try:
+                write_raw_memento(writer, memento, dedup=dedup)
+
+                if dedup is not None:
+                    writer.flush()
+                    dedup.commit()
+
+            except Exception as e:
+                logger.exception("could not write raw memento at {}, skipping...".format(
+                    memento.raw_urim))
+                errors.append((memento.urims[0], memento.raw_urim, repr(e)))
+            finally:
+                memento.close()
+
+    write_cdx("{}.cdx".format(filename_stem), sorted(writer.cdx_lines))
+
+    return writer.filenames, errors
+
+def _warc_writer_process(worker, mementos, filename_stem, warcinfo,
+    rollover_size, gzip, dedup_path, results):
+
+    # each process needs a connection of its own to the index
+    dedup = None if dedup_path is None else DedupIndex(dedup_path)
+
+    try:
+        outcome = write_warc_series(map(pickle.loads, iter(mementos.get, None)), filename_stem,
+            warcinfo, rollover_size=rollover_size, gzip=gzip, dedup=dedup)
+    finally:
+        if dedup is not None:
+            dedup.close()
+
+    results.put((worker, outcome))
+
+def _check_writers(processes):
+
+    for process in processes:
+        if process.exitcode not in (None, 0):
+            raise RuntimeError("WARC writer process {} exited with code {}".format(
+                process.name, process.exitcode))
+
+def write_warc_series_in_processes(mementos, filename_stem, warcinfo,
+    writer_processes, rollover_size=default_rollover_size, gzip=True,
+    queue_size=default_queue_size, dedup=None):
+    """Hands each `RawMemento` from the iterable `mementos` to one of
+    `writer_processes` processes, through a queue holding at most
+    `queue_size`, so that WARCs are compressed in parallel. Worker `w`
+    writes its own series of WARCs, `<filename_stem>-<w>-<n>.warc.gz`, and
+    their CDXs are merged into `<filename_stem>.cdx`. Each process opens
+    the database of the `DedupIndex` `dedup`, if given, for itself.
+
+    The processes are started before `mementos` is first iterated, so that
+    they are not forked while the download threads of `iter_raw_mementos`
+    hold locks.
+
+    Each memento is pickled before it is queued, and its payload closed.
+    A payload of up to `payload_spool_size` bytes is queued as bytes, so
+    the queue holds at most `queue_size` times that in memory. A larger
+    payload is moved to a temporary file, which the writer process reads
+    and removes.
+
+    It returns the filenames of the WARCs written and a list of
+    (URI-M, raw URI-M, error) for the raw mementos that could not be.
+    """
+
+    memento_queue = multiprocessing.Queue(maxsize=queue_size)
+    results = multiprocessing.Queue()
+
+    processes = [ multiprocessing.Process(target=_warc_writer_process,
+        args=(worker, memento_queue, "{}-{}".format(filename_stem, worker),
+            warcinfo, rollover_size, gzip,
+            None if dedup is None else dedup.path, results),
+        name="aiu-warc-writer-{}".format(worker), daemon=True)
+        for worker in range(writer_processes) ]
+
+    for process in processes:
+        process.start()
+
+    def put(item):
+
+        while True:
+
+            try:
+                memento_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                _check_writers(processes)
+
+    outcomes = {}
+    spool_directory = tempfile.mkdtemp(prefix="aiu-payloads-")
+
+    try:
+        for memento in mementos:
+
+            try:
+                memento.spool_payload(spool_directory)
+                put(pickle.dumps(memento))
+            finally:
+                memento.close()
+
+        for process in processes:
+            put(None)
+
+        while len(outcomes) < writer_processes:
+
+            try:
+                worker, outcome = results.get(timeout=1)
+                outcomes[worker] = outcome
+            except queue.Empty:
+                _check_writers(processes)
+
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+
+    finally:
+        for process in processes:
+            process.join()
+
+        # holds the payloads of any mementos a writer did not get to
+        shutil.rmtree(spool_directory, ignore_errors=True)
+
+    filenames = []
+    errors = []
+
+    for worker in range(writer_processes):
+        filenames.extend(outcomes[worker][0])
+        errors.extend(outcomes[worker][1])
+
+    partial_cdx_filenames = [ "{}-{}.cdx".format(filename_stem, worker)
+        for worker in range(writer_processes) ]
+
+    merge_cdx(partial_cdx_filenames, "{}.cdx".format(filename_stem))
+
+    for filename in partial_cdx_filenames:
+        os.remove(filename)
+
+    return filenames, errors
+
+def fetch_mementos_and_write_warcs(raw_urimdata, warc_filename_stem, warcinfo,
+    error_directory, session=None, max_workers=default_download_workers,
+    queue_size=default_queue_size, rollover_size=default_rollover_size, gzip=True,
+    writer_processes=default_writer_processes, dedup=None):
+    """This function downloads the raw mementos in `raw_urimdata`, which
+    maps URI-Ms to their raw URI-Ms as returned by `discover_raw_urims`,
+    and writes them to WARCs named `<warc_filename_stem>-<n>.warc.gz`, or
+    `.warc` if not `gzip`, with a `RollingWARCWriter`. If
+    `writer_processes` is more than 1, each of that many processes writes
+    its own series, `<warc_filename_stem>-<worker>-<n>.warc.gz`. A sorted
+    CDX of all of them is written to `<warc_filename_stem>.cdx`. Raw
+    mementos that could not be written are recorded in `errors.jsonl` in
+    `error_directory`. Mementos already in `dedup`, a `DedupIndex` or the
+    path of its database, are written as revisit records or not at all.
+
+    It returns the filenames of the WARCs written.
+    """
+
+    raw_urims_to_urims = {}
+
+    for urim in raw_urimdata:
+        raw_urims_to_urims.setdefault(raw_urimdata[urim], []).append(urim)
+
+    logger.info("Issuing requests for {} raw mementos".format(len(raw_urims_to_urims)))
+
+    dedup_index = open_dedup_index(dedup)
+
+    with open("{}/errors.jsonl".format(error_directory), 'a') as errorsout:
+
+        def record_error(urim, raw_urim, error):
+
+            errorsout.write("{}\n".format(json.dumps(
+                {
+                    "URI-M": urim,
+                    "Raw URI-M": raw_urim,
+                    "Error": error
+                }
+            )))
+
+        def downloaded_mementos():
+
+            for memento in iter_raw_mementos(raw_urims_to_urims, session=session,
+                max_workers=max_workers, queue_size=queue_size):
+
+                if memento.error is None:
+                    logger.info("Raw URI-M {} is done".format(memento.raw_urim))
+                    yield memento
+
+                else:
+                    logger.warning("could not process raw memento at {}, skipping...".format(
+                        memento.raw_urim))
+                    record_error(memento.urims[0], memento.raw_urim, memento.error)
+
+        try:
+            if writer_processes > 1:
+                filenames, errors = write_warc_series_in_processes(downloaded_mementos(),
+                    warc_filename_stem, warcinfo, writer_processes,
+                    rollover_size=rollover_size, gzip=gzip, queue_size=queue_size,
+                    dedup=dedup_index)
+            else:
+                filenames, errors = write_warc_series(downloaded_mementos(),
+                    warc_filename_stem, warcinfo, rollover_size=rollover_size, gzip=gzip,
+                    dedup=dedup_index)
+        finally:
+            if dedup_index is not dedup:
+                dedup_index.close()
+
+        for urim, raw_urim, error in errors:
+            record_error(urim, raw_urim, error)
+
+    return filenames
+
+def export_mementos_to_warc(timemap_data, output_directory, filename_prefix=None,
+    warcinfo=None, session=None, max_workers=default_download_workers,
+    queue_size=default_queue_size, rollover_size=default_rollover_size, gzip=True,
+    writer_processes=default_writer_processes, dedup=None):
+    """This function writes every memento in `timemap_data`, which maps
+    URI-Ts to TimeMaps parsed by `process_timemaps_for_mementos` or
+    `fetch_timemaps`, to WARCs in `<output_directory>/archives`, named
+    `<filename_prefix>-<n>.warc.gz`, and indexes them in
+    `<filename_prefix>.cdx`.
+
+    URI-Ms are first checked, and resolved to their raw URI-Ms, with
+    `max_workers` threads. The raw mementos are then downloaded with
+    `session`, `max_workers` at a time, and written as they arrive, with
+    at most `queue_size` waiting for the writer. A new WARC is started
+    after each `rollover_size` bytes, and WARCs are gzipped unless `gzip`
+    is False. Each WARC begins with a warcinfo record made from the `dict`
+    `warcinfo`, which defaults to describing this host and user. With
+    more than one of `writer_processes`, each process compresses its own
+    series of WARCs, `<filename_prefix>-<worker>-<n>.warc.gz`.
+
+    With `dedup`, a `DedupIndex` or the path of its database, URI-Ms that
+    led to a memento already in the index are not downloaded, and payloads
+    archived before are written as revisit records, so that exporting a
+    growing collection again only fetches its new mementos.
+
+    URI-Ms and raw mementos that could not be written are recorded in
+    `<output_directory>/capture/memento_errors/errors.jsonl`. The
+    filenames of the WARCs written are returned.
+    """
+
+    archive_directory = "{}/archives".format(output_directory)
+    error_directory = "{}/capture/memento_errors".format(output_directory)
+
+    for directory in (archive_directory, error_directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    if filename_prefix is None:
+        filename_prefix = "AIU-{}".format(socket.gethostname())
+
+    if warcinfo is None:
+        warcinfo = {
+            'software': user_agent_string,
+            'hostname': socket.gethostname(),
+            'operator': getpass.getuser()
+        }
+
+    dedup_index = open_dedup_index(dedup)
+
+    try:
+        urims = []
+        archived = 0
+
+        for urit in timemap_data:
+
+            try:
+                for memento in timemap_data[urit]["mementos"]["list"]:
+
+                    # the index records the URI-Ms themselves, as the URI-R
+                    # and memento-datetime of the raw memento may differ
+                    # from those in the TimeMap
+                    if dedup_index is not None and \
+                        dedup_index.lookup_urim(memento["uri"]) is not None:
+                        archived += 1
+                        continue
+
+                    urims.append(memento["uri"])
+            except Exception as e:
+                logger.error("Error encountered processing TimeMap at {}".format(urit))
+                logger.error("TimeMap Object: {}".format(timemap_data[urit]))
+                raise e
+
+        if archived > 0:
+            logger.info("skipping {} mementos already archived, {} left to archive".format(
+                archived, len(urims)))
+
+        raw_urimdata, errordata = discover_raw_urims(urims, max_workers=max_workers)
+
+        with open("{}/errors.jsonl".format(error_directory), 'w') as errorsout:
+            for urim in errordata:
+                errorsout.write("{}\n".format(json.dumps(
+                    {
+                        "URI-M": urim,
+                        "Error": errordata[urim]
+                    }
+                )))
+
+        return fetch_mementos_and_write_warcs(raw_urimdata,
+            "{}/{}".format(archive_directory, filename_prefix), warcinfo,
+            error_directory, session=session, max_workers=max_workers,
+            queue_size=queue_size, rollover_size=rollover_size, gzip=gzip,
+            writer_processes=writer_processes, dedup=dedup_index)
+
+    finally:
+        if dedup_index is not dedup:
+            dedup_index.close()
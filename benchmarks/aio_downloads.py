@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downloads TimeMaps from a local stub archive that answers each request
+after a fixed delay, comparing the thread-based
+`aiu.utils.process_timemaps_for_mementos` with its asyncio version in
+`aiu.aio`. Requires aiohttp.
+
+Usage: python benchmarks/aio_downloads.py [number of TimeMaps] [delay in ms]
+"""
+
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+
+from aiohttp import web
+
+from timemap_parsing import generate_timemap
+
+from aiu import aio
+from aiu import process_timemaps_for_mementos
+
+timemap_body = generate_timemap(200)
+
+def run_stub_archive(delay, started):
+    """Serves `timemap_body` after `delay` seconds from an event loop in
+    this thread, reporting the port through `started`."""
+
+    async def handle(request):
+
+        await asyncio.sleep(delay)
+
+        return web.Response(text=timemap_body, content_type="application/link-format")
+
+    async def serve():
+
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handle)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+
+        site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+        await site.start()
+
+        started.append(site._server.sockets[0].getsockname()[1])
+
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+def measure(label, function):
+
+    start = time.perf_counter()
+    function()
+
+    print("{:>28}: {:.3f}s".format(label, time.perf_counter() - start))
+
+if __name__ == '__main__':
+
+    timemap_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 100) / 1000
+
+    started = []
+    threading.Thread(target=run_stub_archive, args=(delay, started), daemon=True).start()
+
+    while len(started) == 0:
+        time.sleep(0.01)
+
+    urit_list = [ "http://127.0.0.1:{}/timemap/{}".format(started[0], i)
+        for i in range(timemap_count) ]
+
+    print("{} TimeMaps, {:.0f}ms per response".format(timemap_count, delay * 1000))
+
+    for max_workers in sorted({ multiprocessing.cpu_count(), 64 }):
+
+        with tempfile.TemporaryDirectory() as working_directory:
+            measure("threads, {} workers".format(max_workers),
+                lambda: process_timemaps_for_mementos(urit_list, working_directory,
+                    max_workers=max_workers))
+
+    for limit_per_host in (100, 1000):
+
+        async def run():
+
+            async with aio.create_session(limit=1000, limit_per_host=limit_per_host) as session:
+                await aio.process_timemaps_for_mementos(urit_list, working_directory,
+                    session=session)
+
+        with tempfile.TemporaryDirectory() as working_directory:
+            measure("asyncio, {} per host".format(limit_per_host),
+                lambda: asyncio.run(run()))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the BeautifulSoup parsers accepted by the collection classes by
+scraping the saved Archive-It pages in `tests/testdata`, checking that
+each parser scrapes the same data as html5lib, both from the whole page
+and from only the regions kept by `results_page_regions`. The peak memory
+allocated while parsing the largest page is reported for each.
+
+Usage: python benchmarks/html_parsers.py [repetitions]
+"""
+
+import os
+import sys
+import glob
+import timeit
+import zipfile
+import tracemalloc
+
+from aiu.html_parsers import html_parsers, parse_html
+from aiu.archiveit_collection import scrape_main_collection_data, \
+    scrape_optional_collection_data, scrape_seed_metadata, scrape_page_count, \
+    scrape_result_count, scrape_next_page_number, results_page_regions
+
+testdata_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+    "..", "tests", "testdata")
+
+def saved_pages():
+    """Returns the text of each saved Archive-It results page, and whether
+    it is the first page of its collection, which holds the collection
+    metadata."""
+
+    pages = []
+
+    for filename in sorted(glob.glob(os.path.join(testdata_directory, "ac*.zip"))):
+        with zipfile.ZipFile(filename) as zf:
+            for name in zf.namelist():
+                if name.endswith(".html"):
+                    pages.append( (zf.read(name).decode('utf8'),
+                        name.endswith("/1.html")) )
+
+    return pages
+
+def scrape(page, parser, parse_only=None):
+
+    text, first_page = page
+    soup = parse_html(text, parser, parse_only=parse_only)
+
+    data = [ scrape_seed_metadata(soup), scrape_page_count(soup),
+        scrape_result_count(soup), scrape_next_page_number(soup) ]
+
+    if first_page:
+        data.extend([ scrape_main_collection_data(soup),
+            scrape_optional_collection_data(soup) ])
+
+    return data
+
+if __name__ == '__main__':
+
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    pages = saved_pages()
+
+    print("{} saved pages, {} characters".format(len(pages), sum(len(text) for text, first_page in pages)))
+
+    expected = [ scrape(page, "html5lib") for page in pages ]
+
+    largest = max(pages, key=lambda page: len(page[0]))
+
+    for parser in html_parsers:
+
+        for parse_only, label in ( (None, "whole page"), (results_page_regions, "regions") ):
+
+            if parse_only is not None and parser == "html5lib":
+                continue
+
+            matches = [ scrape(page, parser, parse_only) for page in pages ] == expected
+
+            seconds = min(timeit.repeat(
+                lambda: [ scrape(page, parser, parse_only) for page in pages ],
+                number=1, repeat=repetitions))
+
+            tracemalloc.start()
+            soup = parse_html(largest[0], parser, parse_only=parse_only)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del soup
+
+            print("{:>12}, {:>10}: {:.3f}s, {:.1f} MiB peak, {}".format(
+                parser, label, seconds, peak / 2 ** 20,
+                "same data as html5lib" if matches else "DIFFERENT data from html5lib"))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares `datetime.strptime` with `parse_memento_datetime`, with and
+without its cache, on the Memento-Datetimes of a synthetic TimeMap.
+
+Usage: python benchmarks/memento_datetime_parsing.py [number of datetimes]
+"""
+
+import sys
+import timeit
+
+from datetime import datetime, timedelta
+
+from aiu import parse_memento_datetime
+from aiu.memento_datetime import memento_datetime_format
+
+if __name__ == '__main__':
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    mdt = datetime(2008, 1, 1)
+    mdt_strings = []
+
+    for i in range(count):
+        mdt_strings.append(mdt.strftime(memento_datetime_format))
+        mdt += timedelta(hours=7, seconds=13)
+
+    def with_strptime():
+        for mdt_string in mdt_strings:
+            datetime.strptime(mdt_string, memento_datetime_format)
+
+    def uncached():
+        for mdt_string in mdt_strings:
+            parse_memento_datetime.__wrapped__(mdt_string)
+
+    def cached():
+        for mdt_string in mdt_strings:
+            parse_memento_datetime(mdt_string)
+
+    # warm the cache with the most recent datetimes, as when the same
+    # headers are processed again
+    cached()
+
+    print("{} Memento-Datetimes".format(count))
+
+    for name, function in (("strptime", with_strptime),
+            ("parse_memento_datetime (uncached)", uncached),
+            ("parse_memento_datetime (cached)", cached)):
+
+        seconds = min(timeit.repeat(function, number=1, repeat=3))
+
+        print("{:>34}: {:.3f}s".format(name, seconds))
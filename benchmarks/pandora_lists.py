@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares listing the TEPs of a large synthetic Pandora subject page by
+walking the parsed tree, as `get_list_from_ul` does, with serializing each
+item of the list and parsing it again, as it used to. No large Pandora
+subject page has been saved, so the page is synthesized with the markup
+of a real one. Each list is checked against the one re-parsed from the
+html.parser tree, ignoring whitespace: BeautifulSoup collapses runs of
+whitespace between tags except under html5lib, so walking the html5lib
+tree keeps the indentation within each item, which re-parsing it lost.
+
+Usage: python benchmarks/pandora_lists.py [teps] [repetitions]
+"""
+
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from aiu.html_parsers import html_parsers
+from aiu.pandora_collection import get_list_from_ul, trove_tep_prefix
+
+def generate_subject_page(teps):
+    """Returns a Pandora subject page listing `teps` TEPs."""
+
+    items = "\n".join(
+        '<li class="item">\n  <a href="/tep/{0}">Title entry page number {0}</a>\n'
+        '  <span class="date">1997 - 2021</span>\n</li>'.format(100000 + i)
+        for i in range(teps) )
+
+    return """<html><head><title>Pandora Subject</title></head><body>
+        <div id="content">
+        <span class="selectedTitle">Arts</span>
+        <div class="itemlist"><ul>
+        {}
+        </ul></div>
+        </div>
+        </body></html>""".format(items)
+
+def reparse_list_from_ul(uls, pandora_prefix):
+    """The former `get_list_from_ul`, which parsed each item again."""
+
+    dic = {}
+
+    for ul in uls:
+        newsoup = BeautifulSoup(str(ul), 'html.parser')
+        for li in newsoup.find_all('li'):
+            id = li.find('a')['href'].split("/")[2]
+            dic[id] = (pandora_prefix + id, li.text)
+
+    return dic
+
+def normalize(dic):
+    """Collapses the whitespace in the text of each item of `dic`."""
+
+    return { id: (url, " ".join(text.split())) for id, (url, text) in dic.items() }
+
+if __name__ == '__main__':
+
+    teps = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    page = generate_subject_page(teps)
+
+    print("{} TEPs, {} characters".format(teps, len(page)))
+
+    def find_ul(parser):
+        return BeautifulSoup(page, parser).find('div', {"class": "itemlist"}).find('ul')
+
+    expected = normalize(reparse_list_from_ul(find_ul("html.parser"), trove_tep_prefix))
+
+    for parser in html_parsers:
+
+        ul = find_ul(parser)
+
+        for label, function in ( ("re-parse", reparse_list_from_ul), ("tree walk", get_list_from_ul) ):
+
+            matches = normalize(function(ul, trove_tep_prefix)) == expected
+
+            seconds = min(timeit.repeat(lambda: function(ul, trove_tep_prefix),
+                number=1, repeat=repetitions))
+
+            print("{:>12}, {:>9}: {:.3f}s, {}".format(parser, label, seconds,
+                "same list" if matches else "DIFFERENT list"))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downloads TimeMaps from a local stub archive that answers each request
+after a fixed delay, comparing the former busy-wait polling of futures
+with `process_timemaps_for_mementos`, which handles each TimeMap as its
+download completes. CPU time shows the cost of polling.
+
+Usage: python benchmarks/timemap_downloads.py [number of TimeMaps] [delay in ms]
+"""
+
+import sys
+import time
+import tempfile
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from requests_futures.sessions import FuturesSession
+
+from timemap_parsing import generate_timemap
+
+from aiu import process_timemaps_for_mementos
+from aiu.utils import get_uri_responses, list_generator
+
+timemap_body = generate_timemap(200).encode('utf8')
+delay = 0.05
+
+class StubArchiveHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        time.sleep(delay)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/link-format")
+        self.send_header("Content-Length", str(len(timemap_body)))
+        self.end_headers()
+        self.wfile.write(timemap_body)
+
+    def log_message(self, format, *args):
+        pass
+
+def poll_futures(urit_list, max_workers):
+    """Waits on the downloads the way `process_timemaps_for_mementos` used
+    to, by cycling through the outstanding futures until all are done."""
+
+    with FuturesSession(max_workers=max_workers) as session:
+
+        futures = get_uri_responses(session, urit_list)
+        working_uri_list = list(futures.keys())
+
+        for urit in list_generator(working_uri_list):
+            if futures[urit].done():
+                futures[urit].result().text
+                working_uri_list.remove(urit)
+
+def measure(label, function):
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    function()
+
+    print("{:>24}: {:.3f}s wall, {:.3f}s CPU".format(label,
+        time.perf_counter() - wall, time.process_time() - cpu))
+
+if __name__ == '__main__':
+
+    timemap_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubArchiveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    urit_list = [ "http://127.0.0.1:{}/timemap/{}".format(server.server_port, i)
+        for i in range(timemap_count) ]
+
+    print("{} TimeMaps, {:.0f}ms per response".format(timemap_count, delay * 1000))
+
+    for max_workers in (4, 16, 64):
+
+        measure("polling, {} workers".format(max_workers),
+            lambda: poll_futures(urit_list, max_workers))
+
+        with tempfile.TemporaryDirectory() as working_directory:
+            measure("as_completed, {} workers".format(max_workers),
+                lambda: process_timemaps_for_mementos(urit_list, working_directory,
+                    max_workers=max_workers))
+
+    server.shutdown()
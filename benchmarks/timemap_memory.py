@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the memory used by the dictionary returned by
+`convert_LinkTimeMap_to_dict` with that used by a `CompactTimeMap`, with
+and without templated URI-Ms, for the same synthetic Archive-It TimeMap,
+along with the size of each on disk.
+
+Usage: python benchmarks/timemap_memory.py [number of mementos]
+"""
+
+import sys
+import io
+import gc
+import gzip
+import tracemalloc
+
+from aiu import convert_LinkTimeMap_to_dict, parse_memento_datetime
+
+from timemap_parsing import generate_timemap
+
+def measure(function):
+    """Returns the result of `function` and the bytes it still holds."""
+
+    parse_memento_datetime.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, size
+
+if __name__ == '__main__':
+
+    memento_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    timemap_text = generate_timemap(memento_count)
+
+    print("TimeMap with {} mementos".format(memento_count))
+
+    for name, kwargs in (("dict", {}), ("CompactTimeMap", {"compact": True}),
+            ("templated", {"template_urims": True})):
+
+        timemap, size = measure(
+            lambda: convert_LinkTimeMap_to_dict(timemap_text, **kwargs))
+
+        print("{:>14}: {:>8.1f} MiB, {:.0f} bytes per memento".format(
+            name, size / 2 ** 20, size / memento_count))
+
+        if name == "dict":
+            disk_size = len(timemap_text.encode('utf8'))
+        else:
+            output = io.BytesIO()
+
+            with gzip.open(output, 'wt') as f:
+                timemap.dump(f)
+
+            disk_size = len(output.getvalue())
+
+        print("{:>14}  {:>8.1f} KiB on disk".format(
+            "", disk_size / 2 ** 10))
+
+        del timemap
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares parsing a directory of stored TimeMaps in a single process with
+`parse_timemaps_parallel` across all CPUs.
+
+Usage: python benchmarks/timemap_parallel_parsing.py [number of TimeMaps] [mementos per TimeMap]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+from timemap_parsing import generate_timemap
+
+from aiu import parse_timemaps_parallel
+
+if __name__ == '__main__':
+
+    timemap_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    memento_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        filenames = []
+
+        for i in range(timemap_count):
+
+            filename = os.path.join(tmpdir, "timemap-{}".format(i))
+
+            with open(filename, 'w') as f:
+                f.write(generate_timemap(memento_count,
+                    urir="http://example.com/{}/".format(i)))
+
+            filenames.append(filename)
+
+        print("{} TimeMaps with {} mementos each".format(timemap_count, memento_count))
+
+        for workers in sorted({1, multiprocessing.cpu_count()}):
+
+            start = time.perf_counter()
+            parse_timemaps_parallel(filenames, workers=workers, paths=True)
+            seconds = time.perf_counter() - start
+
+            print("{:>3} workers: {:.3f}s".format(workers, seconds))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the TimeMap parser engines of `convert_LinkTimeMap_to_dict` on a
+synthetic Archive-It TimeMap.
+
+Usage: python benchmarks/timemap_parsing.py [number of mementos]
+"""
+
+import sys
+import timeit
+
+from datetime import datetime, timedelta
+
+from aiu import convert_LinkTimeMap_to_dict
+
+def generate_timemap(memento_count, urir="http://example.com/"):
+    """Generates a link-format TimeMap with `memento_count` mementos."""
+
+    entries = [
+        '<{}>; rel="original"'.format(urir),
+        '<http://wayback.archive-it.org/1068/timemap/link/{}>; rel="self"; '
+            'type="application/link-format"'.format(urir),
+        '<http://wayback.archive-it.org/1068/{}>; rel="timegate"'.format(urir)
+    ]
+
+    mdt = datetime(2008, 1, 1)
+
+    for i in range(memento_count):
+
+        if i == 0:
+            rel = "first memento"
+        elif i == memento_count - 1:
+            rel = "last memento"
+        else:
+            rel = "memento"
+
+        entries.append(
+            '<http://wayback.archive-it.org/1068/{}/{}>; rel="{}"; datetime="{}"'.format(
+                mdt.strftime("%Y%m%d%H%M%S"), urir, rel,
+                mdt.strftime("%a, %d %b %Y %H:%M:%S GMT")
+            )
+        )
+
+        mdt += timedelta(hours=7, seconds=13)
+
+    return ",\n".join(entries) + "\n"
+
+if __name__ == '__main__':
+
+    memento_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    timemap_text = generate_timemap(memento_count)
+
+    print("TimeMap with {} mementos, {} characters".format(
+        memento_count, len(timemap_text)))
+
+    for engine in ("statemachine", "tokenizer"):
+
+        seconds = min(timeit.repeat(
+            lambda: convert_LinkTimeMap_to_dict(timemap_text, engine=engine),
+            number=1, repeat=3))
+
+        print("{:>12}: {:.3f}s".format(engine, seconds))
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downloads raw mementos from a local stub archive that answers each request
+after a fixed delay and writes them to WARCs, comparing the loop formerly
+in `bin/seeds2warc` and `bin/tm2warc`, which picked outstanding raw URI-Ms
+at random and rebuilt the list of leftovers on every pass, with
+`aiu.warc.fetch_mementos_and_write_warcs`, which writes each raw memento
+as its download completes. CPU time shows the cost of polling.
+
+Usage: python benchmarks/warc_pipeline.py [number of mementos] [delay in ms]
+"""
+
+import io
+import sys
+import time
+import random
+import tempfile
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from requests_futures.sessions import FuturesSession
+from warcio.warcwriter import WARCWriter
+from warcio.statusandheaders import StatusAndHeaders
+
+from aiu import create_session
+from aiu.utils import get_uri_responses
+from aiu.warc import fetch_mementos_and_write_warcs
+
+memento_body = b"<html><body>" + b"memento " * 4000 + b"</body></html>"
+delay = 0.05
+
+class StubArchiveHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        time.sleep(delay)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Memento-Datetime", "Thu, 01 Jan 2009 00:00:00 GMT")
+        self.send_header("Link", '<http://example.com{}>; rel="original"'.format(self.path))
+        self.send_header("Content-Length", str(len(memento_body)))
+        self.end_headers()
+        self.wfile.write(memento_body)
+
+    def log_message(self, format, *args):
+        pass
+
+def poll_futures(raw_urimdata, directory, max_workers):
+    """Writes the raw mementos the way the scripts used to, by picking
+    outstanding raw URI-Ms at random until all have been written. The
+    session stays open while polling, as requests-futures now cancels
+    pending downloads when it is closed."""
+
+    raw_urims = list(set(raw_urimdata.values()))
+
+    with FuturesSession(max_workers=max_workers) as session, \
+        open("{}/POLL-0.warc.gz".format(directory), 'wb') as output:
+
+        futures = get_uri_responses(session, raw_urims)
+
+        completed_raw_urims = []
+        leftovers = list(set(raw_urims) - set(completed_raw_urims))
+
+        writer = WARCWriter(output, gzip=True)
+
+        while len(leftovers) > 0:
+
+            raw_urim = random.choice(leftovers)
+
+            if futures[raw_urim].done():
+
+                response = futures[raw_urim].result()
+
+                http_headers = StatusAndHeaders(str(response.status_code),
+                    response.raw.headers.items(), protocol="HTTP/1.1")
+
+                writer.write_record(writer.create_warc_record(raw_urim, 'response',
+                    payload=io.BytesIO(response.content), http_headers=http_headers))
+
+                completed_raw_urims.append(raw_urim)
+
+            leftovers = list(set(raw_urims) - set(completed_raw_urims))
+
+def measure(label, function):
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    function()
+
+    print("{:>26}: {:.3f}s wall, {:.3f}s CPU".format(label,
+        time.perf_counter() - wall, time.process_time() - cpu))
+
+if __name__ == '__main__':
+
+    memento_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubArchiveHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    raw_urimdata = { "http://127.0.0.1:{0}/memento/{1}".format(server.server_port, i):
+        "http://127.0.0.1:{0}/raw/{1}".format(server.server_port, i)
+        for i in range(memento_count) }
+
+    print("{} raw mementos of {} bytes, {:.0f}ms per response".format(
+        memento_count, len(memento_body), delay * 1000))
+
+    for max_workers in (4, 16):
+
+        with tempfile.TemporaryDirectory() as directory:
+            measure("polling, {} workers".format(max_workers),
+                lambda: poll_futures(raw_urimdata, directory, max_workers))
+
+        with tempfile.TemporaryDirectory() as directory:
+            measure("pipeline, {} workers".format(max_workers),
+                lambda: fetch_mementos_and_write_warcs(raw_urimdata,
+                    "{}/PIPELINE".format(directory), { "software": "benchmark" },
+                    directory, session=create_session(), max_workers=max_workers))
+
+    server.shutdown()
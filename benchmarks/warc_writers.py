@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Writes already downloaded raw mementos to gzipped WARCs, comparing
+`aiu.warc.write_warc_series`, which compresses every record in this
+process, with `aiu.warc.write_warc_series_in_processes` and a number of
+writer processes that compress in parallel. Writing is kept apart from
+downloading so that compression is what is measured; wall time can only
+fall with more writer processes on a machine with more than one core.
+
+Usage: python benchmarks/warc_writers.py [number of mementos] [writer processes ...]
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import tempfile
+
+from requests.structures import CaseInsensitiveDict
+
+from aiu.warc import RawMemento, write_warc_series, write_warc_series_in_processes
+
+def make_payloads(memento_count):
+
+    words = [ "memento", "archive", "collection", "seed", "timemap", "crawl" ]
+    rng = random.Random(0)
+
+    return [ " ".join( rng.choice(words) for j in range(20000) ).encode('utf8')
+        for i in range(memento_count) ]
+
+def iter_mementos(payloads):
+
+    headers = CaseInsensitiveDict({
+        "Content-Type": "text/html",
+        "Memento-Datetime": "Thu, 01 Jan 2009 00:00:00 GMT"
+    })
+
+    for i, payload in enumerate(payloads):
+
+        yield RawMemento("http://archive.example.com/raw/{}".format(i),
+            [ "http://archive.example.com/memento/{}".format(i) ], status_code=200,
+            headers=headers, payload=io.BytesIO(payload), urir="http://example.com/{}".format(i))
+
+def measure(label, function):
+
+    wall = time.perf_counter()
+
+    filenames, errors = function()
+
+    size = sum( os.path.getsize(filename) for filename in filenames )
+
+    print("{:>22}: {:.3f}s wall, {} WARCs, {} bytes".format(label,
+        time.perf_counter() - wall, len(filenames), size))
+
+if __name__ == '__main__':
+
+    memento_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    process_counts = [ int(arg) for arg in sys.argv[2:] ] or [ 2, 4 ]
+
+    payloads = make_payloads(memento_count)
+
+    print("{} raw mementos on {} CPUs".format(memento_count, os.cpu_count()))
+
+    warcinfo = { "software": "benchmark" }
+
+    with tempfile.TemporaryDirectory() as directory:
+        measure("this process", lambda: write_warc_series(iter_mementos(payloads),
+            "{}/SERIES".format(directory), warcinfo, rollover_size=10000000))
+
+    for writer_processes in process_counts:
+
+        with tempfile.TemporaryDirectory() as directory:
+            measure("{} writer processes".format(writer_processes),
+                lambda: write_warc_series_in_processes(iter_mementos(payloads),
+                    "{}/SERIES".format(directory), warcinfo, writer_processes,
+                    rollover_size=10000000))
@@ -47,10 +47,14 @@ setup(
         'requests_futures',
         'warcio',
         'requests',
-        'bs4',
+        'beautifulsoup4>=4.13',
         'html5lib',
+        'lxml',
         'requests_cache==0.5.2' # this must be this version for our test cases to work
     ],
+    extras_require={
+        'aio': ['aiohttp']
+    },
     # setup_requires=['nltk'],
     test_suite="tests",
     zip_safe=True,
@@ -0,0 +1,130 @@
+import unittest
+import os
+import csv
+import time
+import asyncio
+import tempfile
+import threading
+
+from http.server import ThreadingHTTPServer
+
+from . import utils_test
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+class SlowStubArchiveHandler(utils_test.StubArchiveHandler):
+    """Answers requests for /slow/* after a second."""
+
+    def do_GET(self):
+
+        if self.path.startswith("/slow/"):
+            time.sleep(1)
+
+        utils_test.StubArchiveHandler.do_GET(self)
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncio(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowStubArchiveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        self.base_uri = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_process_timemaps_for_mementos(self):
+
+        from aiu import aio
+
+        urits = [ "{}/timemap/{}".format(self.base_uri, i) for i in range(20) ]
+        missing_urit = "{}/missing".format(self.base_uri)
+
+        with tempfile.TemporaryDirectory() as working_directory:
+
+            timemap_data = asyncio.run(aio.process_timemaps_for_mementos(
+                urits + [ missing_urit ], working_directory, storage="compact"))
+
+            self.assertEqual(sorted(timemap_data), sorted(urits))
+            self.assertEqual(
+                timemap_data[urits[0]].to_dict()["mementos"]["first"]["uri"],
+                "http://wayback.archive-it.org/1068/20090101000000/http://example.com/")
+
+            with open(os.path.join(working_directory, "capture", "timemaps", "manifest.tsv")) as f:
+                rows = list(csv.DictReader(f, delimiter='\t'))
+
+            self.assertEqual(sorted(row["URI-T"] for row in rows), sorted(urits))
+
+    def test_discover_raw_urims(self):
+
+        from aiu import aio
+
+        urims = [ "{}/memento/{}".format(self.base_uri, i) for i in range(5) ]
+        redirect_urim = "{}/redirect/5".format(self.base_uri)
+        missing_urim = "{}/notamemento".format(self.base_uri)
+
+        async def discover():
+
+            async with aio.create_session(limit=4, limit_per_host=2) as session:
+                return await aio.discover_raw_urims(
+                    urims + [ redirect_urim, missing_urim ], session=session)
+
+        raw_urimdata, errordata = asyncio.run(discover())
+
+        expected_raw_urimdata = { urim: urim for urim in urims }
+        expected_raw_urimdata[redirect_urim] = "{}/memento/5".format(self.base_uri)
+
+        self.assertEqual(raw_urimdata, expected_raw_urimdata)
+        self.assertEqual(list(errordata), [ missing_urim ])
+
+    def test_get_uri_responses(self):
+
+        from aiu import aio
+
+        urits = [ "{}/timemap/{}".format(self.base_uri, i) for i in range(3) ]
+
+        async def get():
+
+            async with aio.create_session() as session:
+                return await aio.get_uri_responses(session, urits + [ "http://127.0.0.1:1/" ])
+
+        responses = asyncio.run(get())
+
+        for urit in urits:
+            self.assertEqual(responses[urit].status_code, 200)
+            self.assertEqual(responses[urit].text, utils_test.timemap_text)
+
+        self.assertIsInstance(responses["http://127.0.0.1:1/"], aiohttp.ClientError)
+
+    def test_iter_responses_closed_early(self):
+
+        from aiu import aio
+
+        urits = [ "{}/timemap/1".format(self.base_uri) ] + \
+            [ "{}/slow/{}".format(self.base_uri, i) for i in range(5) ]
+
+        async def first_response():
+
+            async with aio.create_session() as session:
+
+                responses = aio.iter_responses(session, urits)
+                uri, response, error = await responses.__anext__()
+                await responses.aclose()
+
+                # no request is left running without an owner
+                return uri, [ task for task in asyncio.all_tasks()
+                    if task is not asyncio.current_task() ]
+
+        uri, tasks = asyncio.run(first_response())
+
+        self.assertEqual(uri, urits[0])
+        self.assertEqual(tasks, [])
@@ -7,13 +7,19 @@ import os
 import shutil
 import zipfile
 import pprint
+import tempfile
 
 import requests
 import requests_cache
 
 from datetime import datetime
+from bs4 import BeautifulSoup
 
 from aiu import ArchiveItCollection
+from aiu import prefetch
+from aiu.html_parsers import parse_html
+from aiu.archiveit_collection import scrape_main_collection_data, \
+    scrape_seed_metadata, scrape_page_count, results_page_regions
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -306,4 +312,203 @@ class TestArchiveItCollection(unittest.TestCase):
         )
 
         self.assertFalse(aic.is_private())
-        self.assertTrue(aic.does_exist())
\ No newline at end of file
+        self.assertTrue(aic.does_exist())
+
+testdata_directory = "{}/testdata".format(os.path.dirname(os.path.realpath(__file__)))
+
+class SavedPageResponse:
+
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+
+class SavedPageSession:
+    """Answers requests for the pages of Archive-It collection 5728 from
+    tests/testdata/ac5728.zip, recording the URIs requested."""
+
+    def __init__(self):
+
+        self.requested_uris = []
+
+        with zipfile.ZipFile("{}/ac5728.zip".format(testdata_directory)) as zf:
+            self.pages = {
+                "https://archive-it.org/collections/5728": zf.read("5728/pages/1.html").decode('utf8'),
+                "https://archive-it.org/collections/5728/?page=2&totalResultCount=104": zf.read("5728/pages/2.html").decode('utf8'),
+                "seed_report": zf.read("5728/pages/seed_report.xt").decode('utf8')
+            }
+
+    def get(self, uri, headers=None):
+
+        self.requested_uris.append(uri)
+
+        if uri.startswith("https://partner.archive-it.org/api/seed?"):
+            return SavedPageResponse(self.pages["seed_report"])
+
+        return SavedPageResponse(self.pages[uri])
+
+class NotFoundSession(SavedPageSession):
+    """Answers every request with Archive-It's page for a collection that
+    cannot be found, recording the URIs requested."""
+
+    def __init__(self):
+
+        self.requested_uris = []
+
+    def get(self, uri, headers=None):
+
+        self.requested_uris.append(uri)
+
+        return SavedPageResponse('<html><body><div class="entity-meta">'
+            '<h2>Not Found</h2></div></body></html>')
+
+class FailingSession:
+    """Fails every request as if the archive could not be reached."""
+
+    def get(self, uri, headers=None):
+
+        raise requests.exceptions.ConnectionError("could not connect to {}".format(uri))
+
+class TestArchiveItCollectionSavedPages(unittest.TestCase):
+
+    def test_cache_5728(self):
+
+        directory = tempfile.mkdtemp()
+
+        try:
+
+            session = SavedPageSession()
+            aic = ArchiveItCollection(5728, session=session, cache=directory)
+            seed_metadata = aic.return_seed_metadata_dict()["seed_metadata"]
+            collection_metadata = aic.return_collection_metadata_dict()
+            del collection_metadata["metadata_timestamp"]
+
+            session = SavedPageSession()
+            aic = ArchiveItCollection(5728, session=session, cache=directory)
+            cached_seed_metadata = aic.return_seed_metadata_dict()["seed_metadata"]
+            cached_collection_metadata = aic.return_collection_metadata_dict()
+            del cached_collection_metadata["metadata_timestamp"]
+
+            self.assertEqual(session.requested_uris, [])
+            self.assertEqual(cached_seed_metadata, seed_metadata)
+            self.assertEqual(cached_collection_metadata, collection_metadata)
+
+            aic.invalidate_cache()
+            self.assertEqual(aic.get_collection_name(), "Social Media")
+            self.assertEqual(session.requested_uris, [ "https://archive-it.org/collections/5728" ])
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_not_found_is_not_cached(self):
+
+        directory = tempfile.mkdtemp()
+
+        try:
+
+            for i in range(2):
+
+                session = NotFoundSession()
+                aic = ArchiveItCollection(1, session=session, cache=directory)
+
+                self.assertFalse(aic.does_exist())
+                self.assertEqual(session.requested_uris, [ "https://archive-it.org/collections/1" ])
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_prefetch_5728(self):
+
+        sessions = [ SavedPageSession() for i in range(3) ]
+        collections = [ ArchiveItCollection(5728, session=session) for session in sessions ]
+        failing = ArchiveItCollection(5728, session=FailingSession())
+
+        for session in sessions:
+            self.assertEqual(session.requested_uris, [])
+
+        errors = prefetch(collections + [ failing ], max_workers=2)
+
+        self.assertEqual(list(errors), [ failing ])
+        self.assertIsInstance(errors[failing], requests.exceptions.ConnectionError)
+
+        for session, collection in zip(sessions, collections):
+            self.assertEqual(session.requested_uris, [ "https://archive-it.org/collections/5728" ])
+            self.assertEqual(collection.get_collection_name(), "Social Media")
+            self.assertEqual(len(session.requested_uris), 1)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            failing.get_collection_name()
+
+    def test_load_seed_metadata_5728(self):
+
+        session = SavedPageSession()
+        aic = ArchiveItCollection(5728, session=session)
+
+        expected_uris = []
+
+        for page in ("https://archive-it.org/collections/5728",
+            "https://archive-it.org/collections/5728/?page=2&totalResultCount=104"):
+            expected_uris.extend( item["uri"] for item in
+                scrape_seed_metadata(BeautifulSoup(session.pages[page], 'html5lib')) )
+
+        seed_uris = aic.list_seed_uris()
+
+        self.assertEqual(len(seed_uris), 104)
+        self.assertEqual(list(aic.seed_metadata["seeds"])[:len(set(expected_uris))],
+            list(dict.fromkeys(expected_uris)))
+        self.assertEqual(
+            aic.seed_metadata["seeds"]["https://www.facebook.com/The-Bistro-Willamette-69821090981/"]["seed_report"]["group"],
+            "Facebook")
+        self.assertEqual(len([ uri for uri in session.requested_uris
+            if uri.startswith("https://partner.archive-it.org/") ]), 1)
+
+    def test_html_parsers_5728(self):
+
+        seed_metadata = {}
+        collection_metadata = {}
+
+        for parser in ("lxml", "html.parser", "html5lib"):
+
+            aic = ArchiveItCollection(5728, session=SavedPageSession(), parser=parser)
+            aic.load_seed_metadata()
+
+            seed_metadata[parser] = aic.seed_metadata["seeds"]
+            collection_metadata[parser] = aic.metadata
+
+        self.assertEqual(seed_metadata["lxml"], seed_metadata["html5lib"])
+        self.assertEqual(seed_metadata["html.parser"], seed_metadata["html5lib"])
+        self.assertEqual(collection_metadata["lxml"], collection_metadata["html5lib"])
+        self.assertEqual(collection_metadata["html.parser"], collection_metadata["html5lib"])
+
+        with self.assertRaises(ValueError):
+            ArchiveItCollection(5728, session=SavedPageSession(), parser="xml")
+
+    def test_results_page_regions_5728(self):
+
+        session = SavedPageSession()
+
+        for page in session.pages:
+
+            if not page.startswith("https://archive-it.org/"):
+                continue
+
+            for parser in ("lxml", "html.parser"):
+
+                whole = parse_html(session.pages[page], parser)
+                regions = parse_html(session.pages[page], parser,
+                    parse_only=results_page_regions)
+
+                self.assertEqual(scrape_seed_metadata(regions), scrape_seed_metadata(whole))
+                self.assertEqual(scrape_page_count(regions), scrape_page_count(whole))
+
+                if page == "https://archive-it.org/collections/5728":
+                    self.assertEqual(scrape_main_collection_data(regions),
+                        scrape_main_collection_data(whole))
+
+        aic = ArchiveItCollection(5728, session=session)
+        aic.load_seed_metadata()
+        soup = aic.firstpage_soup
+
+        self.assertIsNotNone(soup)
+        aic.load_collection_metadata()
+        self.assertIs(aic.firstpage_soup, soup)
+        self.assertEqual(aic.get_collection_name(), "Social Media")
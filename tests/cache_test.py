@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+from aiu.cache import MetadataCache, open_cache, cache_format_version
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+
+        cache = MetadataCache(self.directory)
+
+        value = {
+            "tep": { "1": ("https://webarchive.nla.gov.au/tep/1", "TEP 1") },
+            "timestamps": { "seed_metadata_timestamp": datetime(2020, 3, 4, 5, 6, 7) },
+            "urims": [ "a", "b" ],
+            "exists": True
+        }
+
+        self.assertIsNone(cache.load("pandora-collection", "1", "metadata"))
+
+        cache.store("pandora-collection", "1", "metadata", value)
+
+        self.assertEqual(cache.load("pandora-collection", "1", "metadata"), value)
+        self.assertEqual(os.listdir(os.path.join(self.directory, "pandora-collection", "1")),
+            [ "metadata.json" ])
+
+    def test_ttl(self):
+
+        cache = MetadataCache(self.directory, ttl=60)
+
+        cache.store("trove", "1", "metadata", { "name": "fresh" })
+        cache.store("trove", "2", "metadata", { "name": "expired" }, ttl=-1)
+
+        self.assertEqual(cache.load("trove", "1", "metadata"), { "name": "fresh" })
+        self.assertIsNone(cache.load("trove", "2", "metadata"))
+
+        cache.ttl = None
+        cache.store("trove", "4", "metadata", { "name": "forever" })
+
+        with open(cache.entry_path("trove", "4", "metadata")) as f:
+            self.assertIsNone(json.load(f)["expires"])
+
+        self.assertEqual(cache.load("trove", "4", "metadata"), { "name": "forever" })
+
+    def test_version_and_corruption(self):
+
+        cache = MetadataCache(self.directory)
+
+        cache.store("archiveit", "5728", "metadata", { "main": {} })
+        path = cache.entry_path("archiveit", "5728", "metadata")
+
+        with open(path) as f:
+            entry = json.load(f)
+
+        entry["version"] = cache_format_version + 1
+
+        with open(path, 'w') as f:
+            json.dump(entry, f)
+
+        self.assertIsNone(cache.load("archiveit", "5728", "metadata"))
+
+        with open(path, 'w') as f:
+            f.write('{"version": ')
+
+        self.assertIsNone(cache.load("archiveit", "5728", "metadata"))
+
+    def test_invalidate(self):
+
+        cache = MetadataCache(self.directory)
+
+        cache.store("archiveit", "5728", "metadata", { "main": {} })
+        cache.store("archiveit", "5728", "seed_metadata", { "seeds": {} })
+        cache.store("archiveit", "7000", "metadata", { "main": {} })
+
+        cache.invalidate("archiveit", "5728", "seed_metadata")
+        self.assertIsNone(cache.load("archiveit", "5728", "seed_metadata"))
+        self.assertIsNotNone(cache.load("archiveit", "5728", "metadata"))
+
+        cache.invalidate("archiveit", "5728")
+        self.assertIsNone(cache.load("archiveit", "5728", "metadata"))
+        self.assertIsNotNone(cache.load("archiveit", "7000", "metadata"))
+
+        cache.invalidate("archiveit", "8000")
+
+    def test_no_directory(self):
+
+        cache = open_cache(None)
+
+        cache.store("trove", "1", "metadata", { "name": "x" })
+        self.assertIsNone(cache.load("trove", "1", "metadata"))
+
+        self.assertIs(open_cache(cache), cache)
+        self.assertEqual(open_cache(self.directory).directory, self.directory)
@@ -0,0 +1,116 @@
+import unittest
+import io
+import pickle
+import datetime
+
+from aiu import convert_LinkTimeMap_to_dict, CompactTimeMap
+from aiu.compact_timemap import JoinedURIStore, TemplatedURIStore
+
+timemap_text = """    <http://a.example.org>;rel="original",
+    <http://arxiv.example.net/timemap/http://a.example.org>
+      ; rel="self";type="application/link-format",
+    <http://arxiv.example.net/timegate/http://a.example.org>
+      ; rel="timegate",
+    <http://arxiv.example.net/web/20000620180259/http://a.example.org>
+      ; rel="first memento";datetime="Tue, 20 Jun 2000 18:02:59 GMT",
+    <http://arxiv.example.net/web/20091027204954/http://a.example.org/é>
+       ; rel="last memento";datetime="Tue, 27 Oct 2009 20:49:54 GMT",
+    <http://arxiv.example.net/web/19691231235959/http://a.example.org>
+      ; rel="memento";datetime="Wed, 31 Dec 1969 23:59:59 GMT"
+      """
+
+class TestCompactTimeMap(unittest.TestCase):
+
+    def test_to_dict(self):
+
+        expected_timemap = convert_LinkTimeMap_to_dict(timemap_text)
+
+        for engine in ("tokenizer", "statemachine"):
+
+            compact_timemap = convert_LinkTimeMap_to_dict(timemap_text,
+                compact=True, engine=engine)
+
+            self.assertIsInstance(compact_timemap, CompactTimeMap)
+            self.assertEqual(compact_timemap.to_dict(), expected_timemap)
+            self.assertEqual(compact_timemap, expected_timemap)
+
+        self.assertEqual(CompactTimeMap.from_dict(expected_timemap).to_dict(), expected_timemap)
+
+    def test_memento_views(self):
+
+        compact_timemap = convert_LinkTimeMap_to_dict(timemap_text, compact=True)
+
+        mementos = compact_timemap["mementos"]["list"]
+
+        self.assertEqual(len(mementos), 3)
+        self.assertEqual(compact_timemap.memento_count(), 3)
+
+        self.assertEqual(mementos[1], {
+            "datetime": datetime.datetime(2009, 10, 27, 20, 49, 54),
+            "uri": "http://arxiv.example.net/web/20091027204954/http://a.example.org/é"
+        })
+
+        self.assertEqual(mementos[-1]["datetime"], datetime.datetime(1969, 12, 31, 23, 59, 59))
+        self.assertEqual([ m["uri"] for m in mementos[:1] ],
+            [ "http://arxiv.example.net/web/20000620180259/http://a.example.org" ])
+
+        with self.assertRaises(IndexError):
+            mementos[3]
+
+        self.assertEqual(compact_timemap["mementos"]["first"]["datetime"],
+            datetime.datetime(2000, 6, 20, 18, 2, 59))
+        self.assertEqual(compact_timemap["original_uri"], "http://a.example.org")
+        self.assertFalse("mementos" in convert_LinkTimeMap_to_dict(
+            '<http://a.example.org>;rel="original"', compact=True))
+
+    def test_pickle(self):
+
+        compact_timemap = convert_LinkTimeMap_to_dict(timemap_text, compact=True)
+
+        self.assertEqual(pickle.loads(pickle.dumps(compact_timemap)).to_dict(),
+            compact_timemap.to_dict())
+
+    def test_templated_urims(self):
+
+        timemap_text = '<http://ogp.me:80/>; rel="original", <https://web.archive.org/web/20100802055126/http://ogp.me:80/>; rel="first memento"; datetime="Mon, 02 Aug 2010 05:51:26 GMT", <https://web.archive.org/web/20101211091635id_/http://ogp.me/>; rel="memento"; datetime="Sat, 11 Dec 2010 09:16:35 GMT", <https://perma.cc/7YXW-UFQ3>; rel="memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT", <https://web.archive.org/web/20210106030214/https://ogp.me/>; rel="last memento"; datetime="Wed, 06 Jan 2021 03:02:10 GMT"'
+
+        expected_timemap = convert_LinkTimeMap_to_dict(timemap_text)
+        compact_timemap = convert_LinkTimeMap_to_dict(timemap_text, template_urims=True)
+
+        self.assertIsInstance(compact_timemap, CompactTimeMap)
+        self.assertEqual(compact_timemap.to_dict(), expected_timemap)
+        self.assertEqual(len(compact_timemap.uris.templates), 3)
+        self.assertEqual(compact_timemap.uris.untemplated_uris, { 2: "https://perma.cc/7YXW-UFQ3" })
+
+        for template_urims in (False, True):
+
+            compact_timemap = convert_LinkTimeMap_to_dict(timemap_text,
+                compact=True, template_urims=template_urims)
+
+            output = io.StringIO()
+            compact_timemap.dump(output)
+            output.seek(0)
+
+            self.assertEqual(CompactTimeMap.load(output).to_dict(), expected_timemap)
+
+    def test_negative_indexes(self):
+
+        uris = [ "http://arxiv.example.net/web/20000620180259/http://a.example.org",
+            "https://perma.cc/7YXW-UFQ3",
+            "http://arxiv.example.net/web/20091027204954/http://a.example.org/é" ]
+
+        for store in (JoinedURIStore(), TemplatedURIStore()):
+
+            for uri in uris:
+                store.append(uri)
+
+            self.assertEqual(store[-1], store[len(store) - 1])
+            self.assertEqual([ store[-i] for i in range(1, 4) ], uris[::-1])
+
+            self.assertRaises(IndexError, store.__getitem__, len(store))
+            self.assertRaises(IndexError, store.__getitem__, -len(store) - 1)
+
+        compact_timemap = convert_LinkTimeMap_to_dict(timemap_text, compact=True)
+
+        self.assertEqual(compact_timemap["mementos"]["list"][-1],
+            compact_timemap["mementos"]["list"][2])
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from datetime import datetime
+
+from aiu.dedup import DedupIndex, open_dedup_index
+
+class TestDedupIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "dedup.sqlite")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+
+        with DedupIndex(self.path) as dedup:
+
+            self.assertIsNone(dedup.lookup_memento("http://example.com/", datetime(2009, 1, 1)))
+
+            dedup.add_record("http://example.com/", datetime(2009, 1, 1), "sha1:AAAA",
+                "response", "<urn:uuid:1>", "TEST-0.warc.gz", 0, 100)
+            dedup.add_record("http://example.com/", "2010-01-01T00:00:00Z", "sha1:AAAA",
+                "revisit", "<urn:uuid:2>", "TEST-0.warc.gz", 100, 50)
+
+            self.assertEqual(dedup.lookup_memento("http://example.com/", "2009-01-01T00:00:00Z"), {
+                "urir": "http://example.com/",
+                "memento_datetime": "2009-01-01T00:00:00Z",
+                "digest": "sha1:AAAA",
+                "record_type": "response",
+                "record_id": "<urn:uuid:1>",
+                "filename": "TEST-0.warc.gz",
+                "offset": 0,
+                "length": 100
+            })
+
+            self.assertEqual(len(dedup), 2)
+            self.assertEqual(dedup.lookup_payload("sha1:AAAA")["record_id"], "<urn:uuid:1>")
+            self.assertIsNone(dedup.lookup_payload("sha1:BBBB"))
+
+        # entries persist across runs
+        with open_dedup_index(self.path) as dedup:
+            self.assertEqual(dedup.lookup_memento("http://example.com/",
+                datetime(2010, 1, 1))["record_type"], "revisit")
+
+    def test_urims(self):
+
+        with DedupIndex(self.path) as dedup:
+
+            dedup.add_record("http://example.com/", datetime(2009, 1, 1), "sha1:AAAA",
+                "response", "<urn:uuid:1>", "TEST-0.warc.gz", 0, 100)
+            dedup.add_urims([ "http://archive.example.com/1", "http://archive.example.com/2" ],
+                "http://example.com/", datetime(2009, 1, 1))
+
+            self.assertEqual(dedup.lookup_urim("http://archive.example.com/2")["record_id"],
+                "<urn:uuid:1>")
+            self.assertIsNone(dedup.lookup_urim("http://archive.example.com/3"))
+
+    def test_uncommitted(self):
+
+        dedup = DedupIndex(self.path)
+        other = DedupIndex(self.path)
+
+        dedup.add_record("http://example.com/", datetime(2009, 1, 1), "sha1:AAAA",
+            "response", "<urn:uuid:1>", "TEST-0.warc.gz", 0, 100)
+
+        self.assertIsNone(other.lookup_payload("sha1:AAAA"))
+
+        dedup.commit()
+
+        self.assertIsNotNone(other.lookup_payload("sha1:AAAA"))
+
+        dedup.close()
+        other.close()
+
+    def test_open_dedup_index(self):
+
+        self.assertIsNone(open_dedup_index(None))
+
+        with DedupIndex(self.path) as dedup:
+            self.assertIs(open_dedup_index(dedup), dedup)
@@ -0,0 +1,33 @@
+import unittest
+import datetime
+
+from aiu import parse_memento_datetime
+
+class TestMementoDatetimeParser(unittest.TestCase):
+
+    def test_rfc1123_dates(self):
+
+        for mdt_string in [
+            "Mon, 02 Aug 2010 05:51:26 GMT",
+            "Sun, 29 Feb 2004 23:59:59 GMT",
+            "Thu, 01 Jan 1970 00:00:00 GMT",
+            # layouts left to strptime
+            "Mon, 2 Aug 2010 05:51:26 GMT",
+            "mon, 02 AUG 2010 05:51:26 GMT"
+        ]:
+            self.assertEqual(
+                parse_memento_datetime(mdt_string),
+                datetime.datetime.strptime(mdt_string, "%a, %d %b %Y %H:%M:%S GMT")
+            )
+
+    def test_invalid_dates(self):
+
+        for mdt_string in [
+            "Mon, 30 Feb 2010 05:51:26 GMT",
+            "Mon, 02 Foo 2010 05:51:26 GMT",
+            "Mon, 02 Aug 2010 05:51:26 EST",
+            "2010-08-02T05:51:26Z",
+            ""
+        ]:
+            with self.assertRaises(ValueError):
+                parse_memento_datetime(mdt_string)
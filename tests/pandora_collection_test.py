@@ -6,12 +6,16 @@ import logging.config
 import os
 import shutil
 import zipfile
+import tempfile
+import json
+import time
 import pprint
 import requests
 import requests_cache
 import aiu
 
 from datetime import datetime
+from bs4 import BeautifulSoup
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -152,3 +156,187 @@ class TestPandoraSubject(unittest.TestCase):
         self.assertEqual(collections, ['8900'])        
         #self.assertEqual(tep, {'140868': ('https://webarchive.nla.gov.au/tep/140868', 'A Good Life'), '182426': ('https://webarchive.nla.gov.au/tep/182426', 'Academy of the Social Sciences in Australia'), '13197': ('https://webarchive.nla.gov.au/tep/13197', 'Altitude : a journal of emerging humanities work'), '137391': ('https://webarchive.nla.gov.au/tep/137391', 'An Otago Storeman in Solomon Islands'), '152874': ('https://webarchive.nla.gov.au/tep/152874', 'AOASG : Australasian Open Access Strategy Group'), '130697': ('https://webarchive.nla.gov.au/tep/130697', 'ARC - Indigenous research and improving opportunities'), '153836': ('https://webarchive.nla.gov.au/tep/153836', 'ARC Centre of Excellence for the Dynamics of Language'), '89506': ('https://webarchive.nla.gov.au/tep/89506', 'Archives of the Australian Museum'), '129862': ('https://webarchive.nla.gov.au/tep/129862', 'Australasian Association for Digital Humanities'), '157572': ('https://webarchive.nla.gov.au/tep/157572', 'Australian Association for Professional & Applied Ethics'), '154034': ('https://webarchive.nla.gov.au/tep/154034', 'Australian Council for Human Rights Education'), '102545': ('https://webarchive.nla.gov.au/tep/102545', 'Australian critical race and whiteness studies association '), '177673': ('https://webarchive.nla.gov.au/tep/177673', 'Australian Environmental Humanities Hub'), '150427': ('https://webarchive.nla.gov.au/tep/150427', 'Australian Medievalists'), '157435': ('https://webarchive.nla.gov.au/tep/157435', 'Australian Studies'), '148182': ('https://webarchive.nla.gov.au/tep/148182', 'Border Crossing Observatory'), '30280': ('https://webarchive.nla.gov.au/tep/30280', 'Borderlands e-journal'), '124708': ('https://webarchive.nla.gov.au/tep/124708', 'Brett Clifton'), '178074': ('https://webarchive.nla.gov.au/tep/178074', 'Centre for Critical Creative Practice'), '149180': ('https://webarchive.nla.gov.au/tep/149180', 'Charterblog'), '165395': ('https://webarchive.nla.gov.au/tep/165395', 'Choose Love, Vote Yes (The Greens)'), '109261': ('https://webarchive.nla.gov.au/tep/109261', 'Cities of Albury and Wodonga community profile'), '36183': ('https://webarchive.nla.gov.au/tep/36183', 'Conferences - Self Research Centre'), '152747': ('https://webarchive.nla.gov.au/tep/152747', 'Cooperative Research Centres Association'), '181828': ('https://webarchive.nla.gov.au/tep/181828', 'COVID-19 information (Australian Human Rights Commission)'), '108041': ('https://webarchive.nla.gov.au/tep/108041', 'Ex Plus Ultra: a postgraduate ejournal of colonial history and post colonial theory'), '152538': ('https://webarchive.nla.gov.au/tep/152538', 'Federal Budget Response (Australian Human Rights Commission)'), '124173': ('https://webarchive.nla.gov.au/tep/124173', 'Fully (sic)'), '155253': ('https://webarchive.nla.gov.au/tep/155253', 'HFESA (Human Factor & Ergonomics Society of Australia)'), '147898': ('https://webarchive.nla.gov.au/tep/147898', 'Human Rights Audit on the Conditions of Detention of Women at the Alexander Maconochie Centre'), '127871': ('https://webarchive.nla.gov.au/tep/127871', 'Human Rights Law Centre'), '144458': ('https://webarchive.nla.gov.au/tep/144458', 'Humanitarian Research Partners'), '155992': ('https://webarchive.nla.gov.au/tep/155992', 'Humanities and Social Sciences SA'), '36190': ('https://webarchive.nla.gov.au/tep/36190', 'Humanities research'), '131978': ('https://webarchive.nla.gov.au/tep/131978', 'Humanities researcher'), '178208': ('https://webarchive.nla.gov.au/tep/178208', 'International Australian Studies Association'), '102501': ('https://webarchive.nla.gov.au/tep/102501', 'International Journal of Critical Indigenous Studies'), '145938': ('https://webarchive.nla.gov.au/tep/145938', 'International Mother Language Movement (IMLM)'), '149803': ('https://webarchive.nla.gov.au/tep/149803', 'iPres 2014 : Melbourne 6 - 10 October'), '159453': ('https://webarchive.nla.gov.au/tep/159453', 'JCS Rainbow Project'), '152859': ('https://webarchive.nla.gov.au/tep/152859', 'Journal of Humanitarian Engineering'), '10060': ('https://webarchive.nla.gov.au/tep/10060', 'Journal of ideas'), '89582': ('https://webarchive.nla.gov.au/tep/89582', 'Mammals (Australian Museum)'), '163909': ('https://webarchive.nla.gov.au/tep/163909', 'Marriage Equality (The Greens)'), '154922': ('https://webarchive.nla.gov.au/tep/154922', 'Mysterious Australia'), '42588': ('https://webarchive.nla.gov.au/tep/42588', 'Nebula'), '138251': ('https://webarchive.nla.gov.au/tep/138251', 'Neighbour Day'), '141785': ('https://webarchive.nla.gov.au/tep/141785', 'Neo : journal for higher degree research students in the social sciences and humanities'), '182617': ('https://webarchive.nla.gov.au/tep/182617', 'Our COVID-19 response (Human Rights Law Centre)'), '102546': ('https://webarchive.nla.gov.au/tep/102546', 'Pacificurrents'), '136837': ('https://webarchive.nla.gov.au/tep/136837', 'Past Law, Present Histories'), '150441': ('https://webarchive.nla.gov.au/tep/150441', 'Paul Arthur'), '13869': ('https://webarchive.nla.gov.au/tep/13869', 'Proceedings of the 1998 ALAA Congress'), '134423': ('https://webarchive.nla.gov.au/tep/134423', 'Propaganda : will information out-evolve us'), '151712': ('https://webarchive.nla.gov.au/tep/151712', 'Right To Life Australia'), '147728': ('https://webarchive.nla.gov.au/tep/147728', 'RISE: Refugees survivors & Ex-detainees'), '120647': ('https://webarchive.nla.gov.au/tep/120647', 'School of Anthropology, Geography and Environmental Studies working papers in development'), '120644': ('https://webarchive.nla.gov.au/tep/120644', 'School of Social and Environmental Enquiry working papers in development'), '182428': ('https://webarchive.nla.gov.au/tep/182428', 'Seriously Social (Academy of the Social Sciences in Australia)'), '147681': ('https://webarchive.nla.gov.au/tep/147681', 'Social Policy Connections'), '133349': ('https://webarchive.nla.gov.au/tep/133349', 'Terra Australis'), '157666': ('https://webarchive.nla.gov.au/tep/157666', 'The ANZTLA e-Journal'), '144640': ('https://webarchive.nla.gov.au/tep/144640', "The Aranda's Pepa"), '150495': ('https://webarchive.nla.gov.au/tep/150495', 'The Australian Sociological Association'), '167636': ('https://webarchive.nla.gov.au/tep/167636', 'The World Ethnography'), '152870': ('https://webarchive.nla.gov.au/tep/152870', "Timor-Leste's Bill of Rights: A Preliminary History"), '120384': ('https://webarchive.nla.gov.au/tep/120384', 'University of Melbourne working papers in development'), '177672': ('https://webarchive.nla.gov.au/tep/177672', 'Weathering the city'), '107722': ('https://webarchive.nla.gov.au/tep/107722', 'Wikimedia Australia')})
         session.close() 
+
+class FakeTEPResponse:
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+class FakeTEPSession:
+    """Answers requests for TEP JSON without the network."""
+
+    def get(self, uri):
+
+        tep_id = uri.split("/")[-1]
+
+        if tep_id == "3":
+            return FakeTEPResponse(500, "HTTP ERROR 500 Problem accessing /bamboo-service/tep/3. Reason: Server Error")
+
+        if tep_id == "4":
+            raise requests.exceptions.ConnectionError("connection refused")
+
+        return FakeTEPResponse(200, json.dumps({
+            "name": "TEP {}".format(tep_id),
+            "tepUrl": "/tep/{}".format(tep_id),
+            "url": "http://example.com/{}".format(tep_id),
+            "instances": [ { "snapshotviewurl": "/awa/2001/http://example.com/{}".format(tep_id) } ],
+            "agencies": [ { "name": "Agency {}".format(tep_id), "url": "http://agency.example.com/{}".format(tep_id) } ]
+        }))
+
+def synthetic_subject_page(tep_ids, page_count=3):
+    """Builds a Pandora subject page with one collection and the TEPs in `tep_ids`."""
+
+    return """<html><body>
+        <span class="selectedTitle">Arts</span>
+        <div class="subcategories"><ul><li><a href="/subject/84">Sub</a></li></ul></div>
+        <div class="itemnavigation"></div>
+        <div class="itemnavigation">{}</div>
+        <div class="itemlist"><ul><li><a href="/col/100">Collection</a></li></ul></div>
+        <div class="itemlist"><ul>{}</ul></div>
+        </body></html>""".format(
+            "".join( '<a class="alphabetical" href="/subject/83/{0}">{0}</a>'.format(i) for i in range(2, page_count + 1) ),
+            "".join( '<li><a href="/tep/{0}">TEP {0}</a></li>'.format(tep_id) for tep_id in tep_ids ))
+
+class FakeSubjectSession(FakeTEPSession):
+    """Answers requests for the pages of a subject with TEPs 1 to 9, three
+    per page, and the JSON of those TEPs, without the network."""
+
+    def get(self, uri):
+
+        if uri.startswith(aiu.pandora_collection.pandora_sub_prefix):
+
+            page = int(uri.split("/")[-1])
+
+            # the second page arrives last
+            if page == 2:
+                time.sleep(0.2)
+
+            return FakeTEPResponse(200, synthetic_subject_page(
+                [ str(i) for i in range(page * 3 - 2, page * 3 + 1) ]))
+
+        return FakeTEPSession.get(self, uri)
+
+class FakeCollectionSession(FakeTEPSession):
+    """Answers requests for the page of collection 100, which lists TEPs
+    1, 2 and 5, for the page of a collection that cannot be found, and for
+    the JSON of TEPs, recording the URIs requested."""
+
+    def __init__(self):
+
+        self.requested_uris = []
+
+    def get(self, uri):
+
+        self.requested_uris.append(uri)
+
+        if uri == "{}100".format(aiu.pandora_collection.pandora_col_prefix):
+            return FakeTEPResponse(200, """<html><body>
+                <span id="selectedTitle">Elections</span>
+                <div class="itemlist"><ul>{}</ul></div>
+                </body></html>""".format("".join(
+                    '<li><a href="/tep/{0}">TEP {0}</a></li>'.format(tep_id) for tep_id in ("1", "2", "5") )))
+
+        if uri.startswith(aiu.pandora_collection.pandora_col_prefix):
+            return FakeTEPResponse(404, """<html><body>
+                <div id="content"><h5>THIS PAGE CANNOT BE FOUND</h5></div>
+                </body></html>""")
+
+        return FakeTEPSession.get(self, uri)
+
+class TestPandoraCollectionCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+
+        session = FakeCollectionSession()
+        collection = aiu.PandoraCollection(100, session=session, cache=self.directory)
+
+        self.assertEqual(collection.get_collection_name(), "Elections")
+        seed_uris = collection.list_seed_uris()
+        self.assertEqual(len(session.requested_uris), 4)
+
+        session = FakeCollectionSession()
+        collection = aiu.PandoraCollection(100, session=session, cache=self.directory)
+
+        self.assertEqual(collection.get_collection_name(), "Elections")
+        self.assertEqual(collection.list_seed_uris(), seed_uris)
+        self.assertEqual(collection.get_title_pages()["5"],
+            ("https://webarchive.nla.gov.au/tep/5", "TEP 5"))
+        self.assertEqual(session.requested_uris, [])
+
+    def test_not_found_is_not_cached(self):
+
+        for i in range(2):
+
+            session = FakeCollectionSession()
+            collection = aiu.PandoraCollection(404, session=session, cache=self.directory)
+
+            self.assertFalse(collection.does_exist())
+            self.assertEqual(session.requested_uris,
+                [ "{}404".format(aiu.pandora_collection.pandora_col_prefix) ])
+
+class TestTEPMetadata(unittest.TestCase):
+
+    def test_add_tep_metadata(self):
+
+        tep_ids = [ str(i) for i in range(10, 0, -1) ]
+
+        data = {}
+        aiu.pandora_collection.add_tep_metadata(data, tep_ids, FakeTEPSession())
+
+        good_ids = [ tep_id for tep_id in tep_ids if tep_id not in ("3", "4") ]
+
+        self.assertEqual(data["seed_uris"], [ "http://example.com/{}".format(tep_id) for tep_id in good_ids ])
+        self.assertEqual(data["urims"], [ "https://webarchive.nla.gov.au/awa/2001/http://example.com/{}".format(tep_id)
+            for tep_id in good_ids ])
+        self.assertEqual(list(data["institution_info"]), [ "Agency {}".format(tep_id) for tep_id in good_ids ])
+        self.assertEqual(sorted(data["tep_errors"]), [ "3", "4" ])
+        self.assertIn("ConnectionError", data["tep_errors"]["4"])
+
+    def test_extract_main_subject_data(self):
+
+        tep_ids = [ str(i) for i in range(1, 10) ]
+        good_ids = [ tep_id for tep_id in tep_ids if tep_id not in ("3", "4") ]
+
+        for parser in ("lxml", "html.parser", "html5lib"):
+
+            soup = BeautifulSoup(synthetic_subject_page([ "1", "2", "3" ]), parser)
+
+            data = aiu.pandora_collection.extract_main_subject_data(soup, "83",
+                session=FakeSubjectSession(), parser=parser)
+
+            self.assertEqual(data["name"], "Arts")
+            self.assertEqual(data["subcategories"], [ "84" ])
+            self.assertEqual(data["collections"], [ "100" ])
+            self.assertEqual(list(data["tep"]), tep_ids)
+            self.assertEqual(data["tep"]["5"], ("https://webarchive.nla.gov.au/tep/5", "TEP 5"))
+            self.assertEqual(data["seed_uris"], [ "http://example.com/{}".format(tep_id) for tep_id in good_ids ])
+            self.assertEqual(sorted(data["tep_errors"]), [ "3", "4" ])
+
+    def test_default_parser(self):
+
+        self.assertEqual(aiu.PandoraCollection(1, session=FakeSubjectSession()).parser, "html5lib")
+        self.assertEqual(aiu.PandoraSubject(83, session=FakeSubjectSession()).parser, "html5lib")
+        self.assertEqual(aiu.PandoraSubject(83, session=FakeSubjectSession(), parser="lxml").parser, "lxml")
+
+    def test_get_list_from_ul(self):
+
+        page = synthetic_subject_page([ "7", "8", "9" ])
+
+        for parser in ("lxml", "html.parser", "html5lib"):
+
+            ul = BeautifulSoup(page, parser).find_all('div', {"class": "itemlist"})[1].find('ul')
+
+            self.assertEqual(aiu.pandora_collection.get_list_from_ul(ul, "https://example.com/tep/"), {
+                "7": ("https://example.com/tep/7", "TEP 7"),
+                "8": ("https://example.com/tep/8", "TEP 8"),
+                "9": ("https://example.com/tep/9", "TEP 9")
+            })
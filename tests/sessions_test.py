@@ -0,0 +1,108 @@
+import unittest
+import threading
+
+from http.server import HTTPServer, ThreadingHTTPServer
+
+import requests_cache
+
+from aiu import create_session, create_uncached_session, get_session, connection_statistics, \
+    fetch_timemaps
+
+from . import utils_test
+
+class KeepAliveStubArchiveHandler(utils_test.StubArchiveHandler):
+
+    protocol_version = "HTTP/1.1"
+
+class TestSessions(unittest.TestCase):
+
+    def test_shared_session(self):
+
+        self.assertIs(get_session(), get_session())
+
+    def test_pool_sizes(self):
+
+        session = create_session(pool_sizes={ "example.com": 3 }, default_pool_size=5)
+
+        self.assertEqual(session.get_adapter("https://example.com/a")._pool_maxsize, 3)
+        self.assertEqual(session.get_adapter("http://example.com/a")._pool_maxsize, 3)
+        self.assertEqual(session.get_adapter("https://example.org/a")._pool_maxsize, 5)
+
+        session = create_session()
+
+        self.assertEqual(session.get_adapter(
+            "https://webarchive.nla.gov.au/bamboo-service/tep/1")._pool_maxsize, 32)
+        self.assertEqual(session.get_adapter(
+            "http://pandora.nla.gov.au/col/1")._pool_maxsize, 16)
+
+    def test_uncached_session(self):
+
+        requests_cache.install_cache(backend='memory')
+
+        try:
+            self.assertIsInstance(create_session(), requests_cache.CachedSession)
+            self.assertNotIsInstance(create_uncached_session(), requests_cache.CachedSession)
+        finally:
+            requests_cache.uninstall_cache()
+
+        self.assertEqual(create_uncached_session(pool_sizes={ "example.com": 3 }).get_adapter(
+            "https://example.com/a")._pool_maxsize, 3)
+
+    def test_connection_reuse(self):
+
+        server = HTTPServer(("127.0.0.1", 0), KeepAliveStubArchiveHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        try:
+            session = create_session(pool_sizes={ "127.0.0.1:{}".format(server.server_port): 2 })
+
+            for i in range(5):
+                session.get("http://127.0.0.1:{}/timemap/{}".format(server.server_port, i))
+
+            self.assertEqual(connection_statistics(session), {
+                "http://127.0.0.1:{}".format(server.server_port): {
+                    "connections": 1, "requests": 5
+                }
+            })
+
+            session.close()
+
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_fetch_timemaps_reuses_connections(self):
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveStubArchiveHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        try:
+            host = "127.0.0.1:{}".format(server.server_port)
+            session = create_session(pool_sizes={ host: 2 })
+
+            urits = [ "http://{}/timemap/{}".format(host, i) for i in range(5) ]
+
+            timemap_data, errors_data = fetch_timemaps(urits, max_workers=1, window=1, session=session)
+
+            self.assertEqual(sorted(timemap_data), sorted(urits))
+
+            statistics = connection_statistics(session)
+
+            self.assertEqual(list(statistics), [ "http://{}".format(host) ])
+            self.assertEqual(statistics["http://{}".format(host)]["requests"], 5)
+
+            # a streamed response holds its connection until it is read, and
+            # the next request may be issued meanwhile, needing a second one
+            self.assertLessEqual(statistics["http://{}".format(host)]["connections"], 2)
+
+            self.assertEqual(len(session.get_adapter(urits[0]).poolmanager.pools), 1)
+
+            session.close()
+
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -1,8 +1,14 @@
 import unittest
 import pprint
 import datetime
+import io
+import os
+import gzip
+import pathlib
+import tempfile
 
-from aiu import convert_LinkTimeMap_to_dict
+from aiu import convert_LinkTimeMap_to_dict, iter_LinkTimeMap, MalformedLinkFormatTimeMap, TimeMap, \
+    parse_timemaps_parallel
 
 pp = pprint.PrettyPrinter(indent=4)
 
@@ -128,3 +134,181 @@ class TestTimeMapParser(unittest.TestCase):
         }
         
         self.assertEqual( actual_json_timemap, expected_json_timemap )
+
+    def test_engines_agree(self):
+
+        timemaps = [
+            '<http://ogp.me>; rel="original", <https://perma.cc/7YXW-UFQ3>; rel="memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT"',
+            '<http://ogp.me>; rel="original",\n <https://perma.cc/7YXW-UFQ3>\n ; rel="first last memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT",\n',
+            # trailing comma, the state machine records the last memento twice
+            '<http://ogp.me>; rel="original", <https://perma.cc/7YXW-UFQ3>; rel="memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT",',
+            '',
+            '   \n'
+        ]
+
+        for timemap in timemaps:
+            self.assertEqual(
+                convert_LinkTimeMap_to_dict(timemap, engine="tokenizer"),
+                convert_LinkTimeMap_to_dict(timemap, engine="statemachine")
+            )
+
+        lheader = '<http://ogp.me>; rel=original, <https://perma.cc/7YXW-UFQ3>; rel=memento; datetime="Sun, 04 Oct 2015 23:18:13 GMT"'
+
+        self.assertEqual(
+            convert_LinkTimeMap_to_dict(lheader, noquotes=True, engine="tokenizer"),
+            convert_LinkTimeMap_to_dict(lheader, noquotes=True, engine="statemachine")
+        )
+
+    def test_malformed_timemap(self):
+
+        timemap = '<http://ogp.me>; rel="original", garbage <https://perma.cc/7YXW-UFQ3>; rel="memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT"'
+
+        for engine in ("tokenizer", "statemachine"):
+
+            with self.assertRaises(MalformedLinkFormatTimeMap):
+                convert_LinkTimeMap_to_dict(timemap, engine=engine)
+
+            self.assertEqual(
+                convert_LinkTimeMap_to_dict(timemap, skipErrors=True, engine=engine),
+                {
+                    'mementos': {   'list': [   {   'datetime': datetime.datetime(2015, 10, 4, 23, 18, 13),
+                                            'uri': 'https://perma.cc/7YXW-UFQ3'}]},
+                    'original_uri': 'http://ogp.me'
+                }
+            )
+
+        with self.assertRaises(ValueError):
+            convert_LinkTimeMap_to_dict(timemap, engine="nonexistent")
+
+    def test_iter_LinkTimeMap(self):
+
+        timemap = '<http://ogp.me/é>; rel="original",\n <https://perma.cc/timemap/link/http://ogp.me>; rel="timemap"; type="application/link-format",\n <https://perma.cc/7YXW-UFQ3>; rel="first memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT",\n <https://perma.cc/8ABC-DEF4>; rel="last memento"; datetime="Mon, 05 Oct 2015 01:02:03 GMT"\n'
+
+        expected_records = [
+            {'rel': 'original', 'uri': 'http://ogp.me/é'},
+            {'rel': 'timemap', 'type': 'application/link-format', 'uri': 'https://perma.cc/timemap/link/http://ogp.me'},
+            {'rel': 'first memento', 'datetime': datetime.datetime(2015, 10, 4, 23, 18, 13), 'uri': 'https://perma.cc/7YXW-UFQ3'},
+            {'rel': 'last memento', 'datetime': datetime.datetime(2015, 10, 5, 1, 2, 3), 'uri': 'https://perma.cc/8ABC-DEF4'}
+        ]
+
+        self.assertEqual(list(iter_LinkTimeMap(io.StringIO(timemap))), expected_records)
+
+        # chunks that split link entries and multibyte characters
+        data = timemap.encode('utf8')
+
+        for chunk_size in (1, 2, 7, 64):
+
+            chunks = [ data[i:i + chunk_size] for i in range(0, len(data), chunk_size) ]
+
+            self.assertEqual(list(iter_LinkTimeMap(chunks)), expected_records)
+            self.assertEqual(
+                list(iter_LinkTimeMap(io.BytesIO(data), chunk_size=chunk_size)),
+                expected_records)
+
+    def test_iter_LinkTimeMap_malformed(self):
+
+        timemap = '<http://ogp.me>; rel="original", garbage <https://perma.cc/7YXW-UFQ3>; rel="memento"; datetime="Sun, 04 Oct 2015 23:18:13 GMT", <https://perma.cc/8ABC'
+
+        with self.assertRaises(MalformedLinkFormatTimeMap):
+            list(iter_LinkTimeMap([timemap]))
+
+        self.assertEqual(
+            list(iter_LinkTimeMap([timemap], skipErrors=True)),
+            [
+                {'rel': 'original', 'uri': 'http://ogp.me'},
+                {'rel': 'memento', 'datetime': datetime.datetime(2015, 10, 4, 23, 18, 13), 'uri': 'https://perma.cc/7YXW-UFQ3'}
+            ]
+        )
+
+    def test_timemap_queries(self):
+
+        lheader = '<http://ogp.me:80/>; rel="original", <https://web.archive.org/web/timemap/link/http://ogp.me:80/>; rel="timemap"; type="application/link-format", <https://web.archive.org/web/http://ogp.me:80/>; rel="timegate", <https://web.archive.org/web/20100802055126/http://ogp.me:80/>; rel="first memento"; datetime="Mon, 02 Aug 2010 05:51:26 GMT", <https://web.archive.org/web/20210106030214/https://ogp.me/>; rel="last memento"; datetime="Wed, 06 Jan 2021 03:02:14 GMT", <https://web.archive.org/web/20100802055126/http://ogp.me:80/>; rel="memento"; datetime="Mon, 02 Aug 2010 05:51:26 GMT", <https://web.archive.org/web/20101211091635/http://ogp.me/>; rel="next memento"; datetime="Sat, 11 Dec 2010 09:16:35 GMT"'
+
+        first = { 'datetime': datetime.datetime(2010, 8, 2, 5, 51, 26),
+            'uri': 'https://web.archive.org/web/20100802055126/http://ogp.me:80/' }
+        middle = { 'datetime': datetime.datetime(2010, 12, 11, 9, 16, 35),
+            'uri': 'https://web.archive.org/web/20101211091635/http://ogp.me/' }
+        last = { 'datetime': datetime.datetime(2021, 1, 6, 3, 2, 14),
+            'uri': 'https://web.archive.org/web/20210106030214/https://ogp.me/' }
+
+        for timemap in (
+            TimeMap(convert_LinkTimeMap_to_dict(lheader)),
+            TimeMap(convert_LinkTimeMap_to_dict(lheader, template_urims=True))
+        ):
+
+            self.assertEqual(timemap.original_uri, 'http://ogp.me:80/')
+            self.assertEqual(list(timemap), [ first, middle, last ])
+
+            self.assertEqual(timemap.nearest(datetime.datetime(1999, 1, 1)), first)
+            self.assertEqual(timemap.nearest(datetime.datetime(2010, 12, 11, 9, 16, 35)), middle)
+            self.assertEqual(timemap.nearest(datetime.datetime(2015, 1, 1)), middle)
+            self.assertEqual(timemap.nearest(datetime.datetime(2017, 1, 1)), last)
+            self.assertEqual(timemap.nearest(datetime.datetime(2030, 1, 1)), last)
+
+            self.assertEqual(timemap.before(datetime.datetime(2010, 12, 11, 9, 16, 35)), first)
+            self.assertIsNone(timemap.before(datetime.datetime(2010, 8, 2, 5, 51, 26)))
+            self.assertEqual(timemap.after(datetime.datetime(2010, 12, 11, 9, 16, 35)), last)
+            self.assertIsNone(timemap.after(datetime.datetime(2021, 1, 6, 3, 2, 14)))
+
+            self.assertEqual(timemap.range(datetime.datetime(2010, 8, 2, 5, 51, 26),
+                datetime.datetime(2010, 12, 11, 9, 16, 35)), [ first, middle ])
+            self.assertEqual(timemap.range(datetime.datetime(2011, 1, 1),
+                datetime.datetime(2012, 1, 1)), [])
+
+        self.assertIsNone(TimeMap({}).nearest(datetime.datetime(2010, 1, 1)))
+
+    def test_parse_timemaps_parallel(self):
+
+        lheaders = [
+            '<http://example.com/>; rel="original", <https://wayback.archive-it.org/1068/20090101000000/http://example.com/>; rel="first memento"; datetime="Thu, 01 Jan 2009 00:00:00 GMT"',
+            '<http://example.org/>; rel="original", <https://wayback.archive-it.org/1068/20100101000000/http://example.org/>; rel="memento"; datetime="Fri, 01 Jan 2010 00:00:00 GMT"',
+            '<http://example.net/>; rel="original", <https://wayback.archive-it.org/1068/20110101000000/http://example.net/>; rel="last memento"; datetime="Sat, 01 Jan 2011 00:00:00 GMT"'
+        ]
+
+        expected = [ convert_LinkTimeMap_to_dict(lheader) for lheader in lheaders ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+
+            textfile = os.path.join(tmpdir, "timemap")
+
+            with open(textfile, 'w') as f:
+                f.write(lheaders[1])
+
+            compactfile = os.path.join(tmpdir, "timemap.json.gz")
+
+            with gzip.open(compactfile, 'wt') as f:
+                convert_LinkTimeMap_to_dict(lheaders[2], template_urims=True).dump(f)
+
+            for workers in (1, 2):
+
+                timemaps = parse_timemaps_parallel(
+                    [ lheaders[0], pathlib.Path(textfile), pathlib.Path(compactfile) ], workers=workers)
+
+                self.assertEqual([ timemap.to_dict() for timemap in timemaps ], expected)
+
+                timemaps = parse_timemaps_parallel([ textfile, compactfile ],
+                    workers=workers, paths=True)
+
+                self.assertEqual([ timemap.to_dict() for timemap in timemaps ], expected[1:])
+
+    def test_parse_timemaps_parallel_errors(self):
+
+        malformed = '<http://example.com/>; rel="original", not a link'
+
+        for workers in (1, 2):
+
+            # like convert_LinkTimeMap_to_dict, malformed TimeMaps raise by default
+            with self.assertRaises(MalformedLinkFormatTimeMap):
+                parse_timemaps_parallel([ malformed, malformed ], workers=workers)
+
+            timemaps = parse_timemaps_parallel([ malformed, malformed ],
+                workers=workers, skipErrors=True)
+
+            self.assertEqual(timemaps[0].to_dict(), convert_LinkTimeMap_to_dict(malformed, skipErrors=True))
+
+            # a string is never guessed to be a path
+            with self.assertRaises(MalformedLinkFormatTimeMap):
+                parse_timemaps_parallel([ "timemaps/missing" ], workers=workers)
+
+            with self.assertRaises(FileNotFoundError):
+                parse_timemaps_parallel([ "timemaps/missing" ], workers=workers, paths=True)
@@ -6,6 +6,8 @@ import logging.config
 import os
 import shutil
 import zipfile
+import tempfile
+import json
 import pprint
 import requests
 import requests_cache
@@ -164,4 +166,78 @@ class TestTroveCollection(unittest.TestCase):
         self.assertEqual(seed_uris, ['http://budget.liberal.org.au/', 'http://www.budget.gov.au/2014-15/index.htm'])
         self.assertEqual(memento_urims, ['https://webarchive.nla.gov.au/awa/20170510013313/http://pandora.nla.gov.au/pan/162677/20170510-1133/budget.liberal.org.au/index.html', 'https://webarchive.nla.gov.au/awa/20140513231924/http://pandora.nla.gov.au/pan/126881/20140514-0919/www.budget.gov.au/2014-15/index.htm'])
         self.assertEqual(breadcrumb_ids,[0, 15003, 15052])
-        self.assertEqual(subcollection_ids,[17919, 17922, 17921])
\ No newline at end of file
+        self.assertEqual(subcollection_ids,[17919, 17922, 17921])
+
+class FakeTroveResponse:
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+class FakeTroveSession:
+    """Answers requests for the JSON of collection 100, and for a
+    collection that cannot be found, recording the URIs requested."""
+
+    def __init__(self):
+
+        self.requested_uris = []
+
+    def get(self, uri):
+
+        self.requested_uris.append(uri)
+
+        if uri.startswith(aiu.trove_collection.collection_json_prefix) and uri.endswith("/100"):
+            return FakeTroveResponse(200, json.dumps({
+                "name": "Elections",
+                "collectionUrl": "https://webarchive.nla.gov.au/collection/100",
+                "agencies": [ { "name": "Agency", "url": "http://agency.example.com/" } ],
+                "subcollections": [ { "id": 101 } ],
+                "breadcrumbs": [ { "id": 0, "name": "Collections" }, { "id": 100, "name": "Elections" } ],
+                "snapshots": [ { "snapshotviewurl": "/awa/2001/http://example.com/",
+                    "gatheredUrl": "http://example.com/" } ],
+                "startDate": { "monthyear": "January 2001" },
+                "endDate": { "monthyear": "December 2001" }
+            }))
+
+        if uri.startswith(aiu.trove_collection.collection_json_prefix):
+            return FakeTroveResponse(404, "")
+
+        return FakeTroveResponse(404, "It looks like we don’t have a page for this collection.")
+
+class TestTroveCollectionCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+
+        session = FakeTroveSession()
+        collection = aiu.TroveCollection(100, session=session, cache=self.directory)
+
+        self.assertEqual(collection.get_collection_name(), "Elections")
+        self.assertEqual(len(session.requested_uris), 1)
+
+        session = FakeTroveSession()
+        collection = aiu.TroveCollection(100, session=session, cache=self.directory)
+
+        self.assertEqual(collection.get_collection_name(), "Elections")
+        self.assertEqual(collection.list_memento_urims(),
+            [ "https://webarchive.nla.gov.au/awa/2001/http://example.com/" ])
+        self.assertEqual(collection.get_subcollections(), [ 101 ])
+        self.assertEqual(collection.get_archived_since(), "January 2001")
+        self.assertEqual(session.requested_uris, [])
+
+    def test_not_found_is_not_cached(self):
+
+        for i in range(2):
+
+            session = FakeTroveSession()
+            collection = aiu.TroveCollection(404, session=session, cache=self.directory)
+
+            self.assertFalse(collection.does_exist())
+            self.assertEqual(len(session.requested_uris), 2)
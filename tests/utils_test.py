@@ -0,0 +1,205 @@
+import unittest
+import os
+import csv
+import json
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from requests_futures.sessions import FuturesSession
+
+from aiu import process_timemaps_for_mementos, load_captured_timemaps, discover_raw_urims, \
+    iter_raw_urims, iter_uri_responses, fetch_timemaps
+from aiu.utils import _iter_windowed_responses
+
+timemap_text = '<http://example.com/>; rel="original", ' \
+    '<http://wayback.archive-it.org/1068/20090101000000/http://example.com/>; ' \
+    'rel="first memento"; datetime="Thu, 01 Jan 2009 00:00:00 GMT", ' \
+    '<http://wayback.archive-it.org/1068/20100101000000/http://example.com/>; ' \
+    'rel="last memento"; datetime="Fri, 01 Jan 2010 00:00:00 GMT"'
+
+class StubArchiveHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        if self.path.startswith("/timemap/"):
+            body = timemap_text.encode('utf8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/link-format")
+        else:
+            body = b"not found"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+
+        if self.path.startswith("/memento/"):
+            self.send_response(200)
+            self.send_header("Memento-Datetime", "Thu, 01 Jan 2009 00:00:00 GMT")
+        elif self.path.startswith("/redirect/"):
+            self.send_response(302)
+            self.send_header("Location", self.path.replace("/redirect/", "/memento/"))
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class TestProcessTimeMaps(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = HTTPServer(("127.0.0.1", 0), StubArchiveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        self.base_uri = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_process_timemaps_for_mementos(self):
+
+        urits = [ "{}/timemap/{}".format(self.base_uri, i) for i in range(5) ]
+        missing_urit = "{}/missing".format(self.base_uri)
+
+        expected_mementos = [ "http://wayback.archive-it.org/1068/20090101000000/http://example.com/",
+            "http://wayback.archive-it.org/1068/20100101000000/http://example.com/" ]
+
+        for storage in ("raw", "compact"):
+
+            with tempfile.TemporaryDirectory() as working_directory:
+
+                timemap_data = process_timemaps_for_mementos(urits + [ missing_urit ],
+                    working_directory, storage=storage, max_workers=3)
+
+                self.assertEqual(sorted(timemap_data), sorted(urits))
+
+                for urit in urits:
+                    self.assertEqual(
+                        [ memento["uri"] for memento in timemap_data[urit]["mementos"]["list"] ],
+                        expected_mementos)
+
+                timemap_directory = os.path.join(working_directory, "capture", "timemaps")
+
+                with open(os.path.join(timemap_directory, "manifest.tsv")) as f:
+                    rows = list(csv.DictReader(f, delimiter='\t'))
+
+                self.assertEqual(sorted(row["URI-T"] for row in rows), sorted(urits))
+
+                with open(os.path.join(timemap_directory, "errors.jsonl")) as f:
+                    errors = [ json.loads(line) for line in f ]
+
+                self.assertEqual(len(errors), 1)
+                self.assertEqual(errors[0]["URI-T"], missing_urit)
+                self.assertEqual(errors[0]["status"], 404)
+
+                reloaded = load_captured_timemaps(working_directory, workers=1)
+
+                self.assertEqual(sorted(reloaded), sorted(urits))
+                self.assertEqual(reloaded[urits[0]].to_dict(),
+                    timemap_data[urits[0]] if storage == "raw" else timemap_data[urits[0]].to_dict())
+
+    def test_discover_raw_urims(self):
+
+        urims = [ "{}/memento/{}".format(self.base_uri, i) for i in range(5) ]
+        redirect_urim = "{}/redirect/5".format(self.base_uri)
+        missing_urim = "{}/notamemento".format(self.base_uri)
+
+        raw_urimdata, errordata = discover_raw_urims(
+            urims + [ redirect_urim, missing_urim ], max_workers=3)
+
+        expected_raw_urimdata = { urim: urim for urim in urims }
+        expected_raw_urimdata[redirect_urim] = "{}/memento/5".format(self.base_uri)
+
+        self.assertEqual(raw_urimdata, expected_raw_urimdata)
+        self.assertEqual(list(errordata), [ missing_urim ])
+
+        results = list(iter_raw_urims(urims + [ missing_urim ], max_workers=2))
+
+        self.assertEqual(sorted(result[0] for result in results), sorted(urims + [ missing_urim ]))
+
+        for urim, raw_urim, error in results:
+
+            if urim == missing_urim:
+                self.assertIsNone(raw_urim)
+                self.assertIsNotNone(error)
+            else:
+                self.assertEqual(raw_urim, urim)
+                self.assertIsNone(error)
+
+    def test_iter_uri_responses(self):
+
+        urits = [ "{}/timemap/{}".format(self.base_uri, i) for i in range(10) ]
+
+        with FuturesSession(max_workers=4) as session:
+            results = list(iter_uri_responses(session, urits + urits[:3], window=3))
+
+        self.assertEqual(sorted(urit for urit, future in results), sorted(urits))
+
+        for urit, future in results:
+            self.assertEqual(future.result().text, timemap_text)
+
+    def test_fetch_timemaps(self):
+
+        urits = [ "{}/timemap/{}".format(self.base_uri, i) for i in range(5) ]
+        missing_urit = "{}/missing".format(self.base_uri)
+
+        timemap_data, errors_data = fetch_timemaps(urits + [ missing_urit ], max_workers=2)
+
+        self.assertEqual(sorted(timemap_data), sorted(urits))
+        self.assertEqual(len(timemap_data[urits[0]]["mementos"]["list"]), 2)
+
+        self.assertEqual(list(errors_data), [ missing_urit ])
+        self.assertEqual(errors_data[missing_urit]["type"], "http_error")
+        self.assertEqual(errors_data[missing_urit]["data"]["response_status"], 404)
+        self.assertEqual(errors_data[missing_urit]["data"]["response_content"], "not found")
+
+class TestWindowedResponses(unittest.TestCase):
+
+    def test_window_is_respected(self):
+
+        lock = threading.Lock()
+        in_flight = [ 0 ]
+        most_in_flight = [ 0 ]
+
+        def work(uri):
+
+            with lock:
+                in_flight[0] += 1
+                most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+
+            time.sleep(0.01)
+
+            with lock:
+                in_flight[0] -= 1
+
+            return uri.upper()
+
+        uris = [ "uri{}".format(i) for i in range(30) ]
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+
+            results = list(_iter_windowed_responses(
+                lambda uri: executor.submit(work, uri), iter(uris), 4))
+
+        self.assertEqual(sorted(uri for uri, future in results), sorted(uris))
+        self.assertTrue(all(future.result() == uri.upper() for uri, future in results))
+        self.assertLessEqual(most_in_flight[0], 4)
+
+        with self.assertRaises(ValueError):
+            list(_iter_windowed_responses(None, uris, 0))
@@ -0,0 +1,495 @@
+import io
+import os
+import gzip
+import json
+import pickle
+import tempfile
+import threading
+import unittest
+
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import requests_cache
+
+from requests.structures import CaseInsensitiveDict
+
+from warcio.archiveiterator import ArchiveIterator
+
+from aiu import create_session, create_uncached_session
+from aiu.warc import fetch_mementos_and_write_warcs, iter_raw_mementos, \
+    export_mementos_to_warc, cdx_urlkey, cdx_header, ConsumedRawStreamException, \
+    RawMemento, payload_spool_size, write_warc_series_in_processes
+from aiu.dedup import DedupIndex
+
+from . import utils_test
+
+def raw_memento_body(path):
+
+    return gzip.compress("memento at {}".format(path).encode('utf8'), mtime=0)
+
+class StubRawMementoHandler(utils_test.StubArchiveHandler):
+    """Serves gzipped raw mementos at /raw/*, without an original relation
+    at /raw/nolink/*, all with the same payload at /raw/same/*, and a URI-M
+    with one at /memento/*. URI-Ms at /toraw/* redirect to /raw/*. The
+    raw mementos requested are listed in `server.raw_requests`."""
+
+    def do_HEAD(self):
+
+        if self.path.startswith("/raw/"):
+            self.send_response(200)
+            self.send_header("Memento-Datetime", "Thu, 01 Jan 2009 00:00:00 GMT")
+        elif self.path.startswith("/toraw/"):
+            self.send_response(302)
+            self.send_header("Location", self.path.replace("/toraw/", "/raw/"))
+        else:
+            utils_test.StubArchiveHandler.do_HEAD(self)
+            return
+
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+
+        if self.path.startswith("/raw/"):
+
+            self.server.raw_requests.append(self.path)
+
+            if self.path.startswith("/raw/same/"):
+                body = raw_memento_body("/raw/same")
+            else:
+                body = raw_memento_body(self.path)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Memento-Datetime", "Thu, 01 Jan 2009 00:00:00 GMT")
+
+            if not self.path.startswith("/raw/nolink/"):
+                self.send_header("Link", '<http://example.com{}>; rel="original"'.format(
+                    self.path[len("/raw"):]))
+
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        elif self.path.startswith("/memento/"):
+
+            self.send_response(200)
+            self.send_header("Link", '<http://example.com/sampled>; rel="original"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        else:
+            utils_test.StubArchiveHandler.do_GET(self)
+
+def read_cdx(cdx_filename, directory):
+    """Returns the header and lines of a CDX, and the response record each
+    line points to as (WARC-Target-URI, WARC-Source-URI-Orig)."""
+
+    with open(cdx_filename) as f:
+        header = f.readline().rstrip("\n")
+        lines = [ line.rstrip("\n") for line in f ]
+
+    records = []
+
+    for line in lines:
+
+        fields = line.split(" ")
+
+        with open(os.path.join(directory, fields[10]), 'rb') as f:
+            f.seek(int(fields[9]))
+            record = next(iter(ArchiveIterator(f)))
+
+            records.append((record.rec_headers.get_header('WARC-Target-URI'),
+                record.rec_headers.get_header('WARC-Source-URI-Orig')))
+
+    return header, lines, records
+
+class TestCDX(unittest.TestCase):
+
+    def test_cdx_urlkey(self):
+
+        self.assertEqual(cdx_urlkey("http://www.Example.com/Path?b=2&a=1#top"),
+            "com,example)/path?a=1&b=2")
+        self.assertEqual(cdx_urlkey("https://example.com"), "com,example)/")
+        self.assertEqual(cdx_urlkey("http://example.com:8080/"), "com,example:8080)/")
+        self.assertEqual(cdx_urlkey("https://www2.example.com:443/a"), "com,example)/a")
+
+class TestRawMemento(unittest.TestCase):
+
+    def raw_memento(self, i, payload):
+
+        return RawMemento("http://archive.example.com/raw/{}".format(i),
+            [ "http://archive.example.com/memento/{}".format(i) ], status_code=200,
+            headers=CaseInsensitiveDict({ "Content-Type": "text/plain",
+                "Memento-Datetime": "Thu, 01 Jan 2009 00:00:00 GMT" }),
+            payload=io.BytesIO(payload), urir="http://example.com/{}".format(i))
+
+    def test_pickle_spooled_payload(self):
+
+        payload = b"x" * (payload_spool_size + 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            memento = self.raw_memento(0, payload)
+            memento.spool_payload(directory)
+
+            pickled = pickle.dumps(memento)
+            memento.close()
+
+            # only the name of the file holding the payload is sent
+            self.assertLess(len(pickled), payload_spool_size)
+
+            unpickled = pickle.loads(pickled)
+            self.assertEqual(unpickled.payload.read(), payload)
+
+            unpickled.close()
+            self.assertEqual(os.listdir(directory), [])
+
+            memento = self.raw_memento(1, b"small")
+            memento.spool_payload(directory)
+
+            self.assertIsNone(memento.payload_filename)
+            self.assertEqual(pickle.loads(pickle.dumps(memento)).payload.read(), b"small")
+
+    def test_writer_processes_large_payloads(self):
+
+        payloads = [ b"small", b"y" * (payload_spool_size + 1), b"z" * (3 * payload_spool_size) ]
+        mementos = [ self.raw_memento(i, payload) for i, payload in enumerate(payloads) ]
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            filenames, errors = write_warc_series_in_processes(iter(mementos),
+                "{}/TEST".format(directory), { "software": "aiu tests" }, 2, queue_size=1)
+
+            self.assertEqual(errors, [])
+
+            written = {}
+
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    for record in ArchiveIterator(f):
+                        if record.rec_type == 'response':
+                            written[record.rec_headers.get_header('WARC-Target-URI')] = \
+                                record.content_stream().read()
+
+            self.assertEqual(written, { "http://example.com/{}".format(i): payload
+                for i, payload in enumerate(payloads) })
+
+        for memento in mementos:
+            self.assertTrue(memento.payload.closed)
+
+            if memento.payload_filename is not None:
+                self.assertFalse(os.path.exists(memento.payload_filename))
+
+        self.assertIsNotNone(mementos[2].payload_filename)
+
+class TestWARCPipeline(unittest.TestCase):
+
+    def setUp(self):
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubRawMementoHandler)
+        self.server.raw_requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        self.base_uri = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_fetch_mementos_and_write_warcs(self):
+
+        raw_urimdata = {
+            "{}/memento/1a".format(self.base_uri): "{}/raw/1".format(self.base_uri),
+            "{}/memento/1b".format(self.base_uri): "{}/raw/1".format(self.base_uri),
+            "{}/memento/2".format(self.base_uri): "{}/raw/2".format(self.base_uri),
+            "{}/memento/3".format(self.base_uri): "{}/raw/nolink/3".format(self.base_uri),
+            "{}/missing/4".format(self.base_uri): "{}/missing/4".format(self.base_uri)
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            filenames = fetch_mementos_and_write_warcs(raw_urimdata,
+                "{}/TEST".format(directory), { "software": "aiu tests" }, directory,
+                session=create_uncached_session(), max_workers=3, queue_size=1)
+
+            self.assertEqual(filenames, [ "{}/TEST-0.warc.gz".format(directory) ])
+
+            records = {}
+            record_ids = {}
+            revisits = {}
+
+            with open(filenames[0], 'rb') as f:
+                for record in ArchiveIterator(f):
+                    if record.rec_type == 'response':
+                        records[record.rec_headers.get_header('WARC-Source-URI-Orig')] = (
+                            record.rec_headers.get_header('WARC-Target-URI'),
+                            record.raw_stream.read())
+                        record_ids[record.rec_headers.get_header('WARC-Source-URI-Orig')] = (
+                            record.rec_headers.get_header('WARC-Record-ID'),
+                            record.rec_headers.get_header('WARC-Payload-Digest'))
+                    elif record.rec_type == 'revisit':
+                        revisits[record.rec_headers.get_header('WARC-Source-URI-Orig')] = (
+                            record.rec_headers.get_header('WARC-Target-URI'),
+                            record.rec_headers.get_header('WARC-Refers-To'),
+                            record.rec_headers.get_header('WARC-Payload-Digest'))
+
+            self.assertEqual(records, {
+                "{}/memento/1a".format(self.base_uri): ("http://example.com/1", raw_memento_body("/raw/1")),
+                "{}/memento/2".format(self.base_uri): ("http://example.com/2", raw_memento_body("/raw/2")),
+                "{}/memento/3".format(self.base_uri): ("http://example.com/sampled", raw_memento_body("/raw/nolink/3"))
+            })
+
+            # the revisit points at the response for the same raw URI-M
+            self.assertEqual(revisits, {
+                "{}/memento/1b".format(self.base_uri): ("http://example.com/1",) +
+                    record_ids["{}/memento/1a".format(self.base_uri)]
+            })
+
+            with open("{}/errors.jsonl".format(directory)) as f:
+                errors = [ json.loads(line) for line in f ]
+
+            self.assertEqual([ error["Raw URI-M"] for error in errors ],
+                [ "{}/missing/4".format(self.base_uri) ])
+
+            header, lines, indexed = read_cdx("{}/TEST.cdx".format(directory), directory)
+
+            self.assertEqual(header, cdx_header)
+            self.assertEqual(lines, sorted(lines))
+            self.assertEqual(lines[0].split(" ")[:5],
+                [ "com,example)/1", "20090101000000", "http://example.com/1", "text/html", "200" ])
+            self.assertEqual(sorted(indexed),
+                sorted( [ (records[urim][0], urim) for urim in records ] +
+                    [ ("http://example.com/1", "{}/memento/1b".format(self.base_uri)) ] ))
+            self.assertEqual(sorted( line.split(" ")[3] for line in lines ),
+                [ "text/html", "text/html", "text/html", "warc/revisit" ])
+
+    def test_export_mementos_to_warc(self):
+
+        timemap_data = { "{}/timemap/1".format(self.base_uri): { "mementos": { "list": [
+            { "uri": "{}/raw/1".format(self.base_uri) },
+            { "uri": "{}/toraw/1".format(self.base_uri) },
+            { "uri": "{}/raw/2".format(self.base_uri) },
+            { "uri": "{}/notamemento/3".format(self.base_uri) }
+        ] } } }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            filenames = export_mementos_to_warc(timemap_data, directory,
+                filename_prefix="TEST", session=create_uncached_session(), max_workers=2, gzip=False)
+
+            self.assertEqual(filenames, [ "{}/archives/TEST-0.warc".format(directory) ])
+
+            with open(filenames[0], 'rb') as f:
+                self.assertEqual(f.read(4), b"WARC")
+                f.seek(0)
+                sources = sorted( (record.rec_headers.get_header('WARC-Source-URI'),
+                    record.rec_headers.get_header('WARC-Source-URI-Orig'), record.rec_type)
+                    for record in ArchiveIterator(f) if record.rec_type != 'warcinfo' )
+
+            self.assertEqual(sources, [
+                ("{}/raw/1".format(self.base_uri), "{}/raw/1".format(self.base_uri), "response"),
+                ("{}/raw/1".format(self.base_uri), "{}/toraw/1".format(self.base_uri), "revisit"),
+                ("{}/raw/2".format(self.base_uri), "{}/raw/2".format(self.base_uri), "response")
+            ])
+
+            with open("{}/capture/memento_errors/errors.jsonl".format(directory)) as f:
+                self.assertEqual([ json.loads(line)["URI-M"] for line in f ],
+                    [ "{}/notamemento/3".format(self.base_uri) ])
+
+    def test_requests_cache_installed(self):
+
+        raw_urimdata = { "{}/memento/{}".format(self.base_uri, i):
+            "{}/raw/{}".format(self.base_uri, i) for i in range(2) }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            requests_cache.install_cache("{}/cache".format(directory), backend='sqlite')
+
+            try:
+                # a session made while the cache is installed reads and
+                # decodes bodies before they can be written as sent
+                with self.assertRaises(ConsumedRawStreamException):
+                    fetch_mementos_and_write_warcs(raw_urimdata, "{}/CACHED".format(directory),
+                        { "software": "aiu tests" }, directory, session=create_session())
+
+                filenames = fetch_mementos_and_write_warcs(raw_urimdata,
+                    "{}/TEST".format(directory), { "software": "aiu tests" }, directory)
+
+            finally:
+                requests_cache.uninstall_cache()
+
+            self.assertEqual(filenames, [ "{}/TEST-0.warc.gz".format(directory) ])
+
+            payloads = {}
+
+            with open(filenames[0], 'rb') as f:
+                for record in ArchiveIterator(f):
+                    if record.rec_type == 'response':
+                        self.assertEqual(record.http_headers.get_header('Content-Encoding'), 'gzip')
+                        payloads[record.rec_headers.get_header('WARC-Source-URI')] = \
+                            record.raw_stream.read()
+
+            self.assertEqual(payloads, { "{}/raw/{}".format(self.base_uri, i):
+                raw_memento_body("/raw/{}".format(i)) for i in range(2) })
+
+            self.assertEqual(gzip.decompress(payloads["{}/raw/0".format(self.base_uri)]),
+                b"memento at /raw/0")
+
+    def test_rollover(self):
+
+        raw_urimdata = { "{}/memento/{}".format(self.base_uri, i):
+            "{}/raw/{}".format(self.base_uri, i) for i in range(3) }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            filenames = fetch_mementos_and_write_warcs(raw_urimdata,
+                "{}/TEST".format(directory), { "software": "aiu tests" }, directory,
+                session=create_uncached_session(), rollover_size=1)
+
+            self.assertEqual(filenames, [ "{}/TEST-{}.warc.gz".format(directory, i) for i in range(3) ])
+
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    self.assertEqual([ record.rec_type for record in ArchiveIterator(f) ],
+                        [ "warcinfo", "response" ])
+
+    def test_writer_processes(self):
+
+        raw_urimdata = { "{}/memento/{}".format(self.base_uri, i):
+            "{}/raw/{}".format(self.base_uri, i) for i in range(12) }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            filenames = fetch_mementos_and_write_warcs(raw_urimdata,
+                "{}/TEST".format(directory), { "software": "aiu tests" }, directory,
+                session=create_uncached_session(), max_workers=4, queue_size=2,
+                writer_processes=3, dedup="{}/dedup.sqlite".format(directory))
+
+            # how the mementos are shared out depends on which writer is free
+            for filename in filenames:
+                self.assertRegex(os.path.basename(filename), r"^TEST-[012]-\d+\.warc\.gz$")
+
+            written = []
+
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    written.extend( record.rec_headers.get_header('WARC-Source-URI-Orig')
+                        for record in ArchiveIterator(f) if record.rec_type == 'response' )
+
+            self.assertEqual(sorted(written), sorted(raw_urimdata))
+
+            header, lines, indexed = read_cdx("{}/TEST.cdx".format(directory), directory)
+
+            self.assertEqual(lines, sorted(lines))
+            self.assertEqual(sorted( urim for target, urim in indexed ), sorted(raw_urimdata))
+            # each writer process recorded its mementos in the shared index
+            with DedupIndex("{}/dedup.sqlite".format(directory)) as dedup:
+                self.assertEqual(len(dedup), 12)
+
+            self.assertEqual(sorted( filename for filename in os.listdir(directory)
+                if not filename.startswith("dedup.sqlite") ), sorted(
+                [ "TEST.cdx", "errors.jsonl" ] + [ os.path.basename(f) for f in filenames ]))
+
+    def test_incremental_export(self):
+
+        def timemap(path):
+            return { "original_uri": "http://example.com{}".format(path),
+                "mementos": { "list": [ { "uri": "{}/raw{}".format(self.base_uri, path),
+                    "datetime": datetime(2009, 1, 1) } ] } }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            dedup_path = "{}/dedup.sqlite".format(directory)
+
+            filenames = export_mementos_to_warc({ "1": timemap("/1"), "2": timemap("/same/a") },
+                directory, filename_prefix="TEST", session=create_uncached_session(), dedup=dedup_path)
+
+            with open(filenames[0], 'rb') as f:
+                first_ids = { record.rec_headers.get_header('WARC-Target-URI'):
+                    record.rec_headers.get_header('WARC-Record-ID')
+                    for record in ArchiveIterator(f) if record.rec_type == 'response' }
+
+            self.server.raw_requests.clear()
+
+            # the collection has grown by a memento with a payload archived before
+            filenames = export_mementos_to_warc({ "1": timemap("/1"), "2": timemap("/same/a"),
+                "3": timemap("/same/b") }, directory, filename_prefix="TEST",
+                session=create_uncached_session(), dedup=dedup_path)
+
+            self.assertEqual(self.server.raw_requests, [ "/raw/same/b" ])
+
+            # the first run's WARC is continued from, not overwritten
+            self.assertEqual(filenames, [ "{}/archives/TEST-1.warc.gz".format(directory) ])
+
+            with open(filenames[0], 'rb') as f:
+                records = [ record for record in ArchiveIterator(f) if record.rec_type != 'warcinfo' ]
+
+            self.assertEqual([ record.rec_type for record in records ], [ "revisit" ])
+            self.assertEqual(records[0].rec_headers.get_header('WARC-Target-URI'),
+                "http://example.com/same/b")
+            self.assertEqual(records[0].rec_headers.get_header('WARC-Refers-To'),
+                first_ids["http://example.com/same/a"])
+            self.assertEqual(records[0].rec_headers.get_header('WARC-Refers-To-Target-URI'),
+                "http://example.com/same/a")
+
+            with DedupIndex(dedup_path) as dedup:
+                self.assertEqual(len(dedup), 3)
+                self.assertEqual(dedup.lookup_memento("http://example.com/same/b",
+                    datetime(2009, 1, 1))["filename"], os.path.basename(filenames[0]))
+
+            # nothing is left to fetch
+            self.server.raw_requests.clear()
+
+            self.assertEqual(export_mementos_to_warc({ "3": timemap("/same/b") }, directory,
+                filename_prefix="TEST", session=create_uncached_session(), dedup=dedup_path), [])
+            self.assertEqual(self.server.raw_requests, [])
+
+            header, lines, indexed = read_cdx("{}/archives/TEST.cdx".format(directory),
+                "{}/archives".format(directory))
+
+            self.assertEqual(lines, sorted(lines))
+            self.assertEqual(sorted( target for target, urim in indexed ), [
+                "http://example.com/1", "http://example.com/same/a", "http://example.com/same/b" ])
+
+    def test_incremental_export_timemap_differs(self):
+
+        # neither the URI-R nor the datetime in the TimeMap match those of
+        # the raw mementos, from their Link and Memento-Datetime headers
+        timemap_data = { "1": { "original_uri": "http://www.example.com/1/",
+            "mementos": { "list": [
+                { "uri": "{}/raw/1".format(self.base_uri), "datetime": datetime(2009, 1, 2) },
+                { "uri": "{}/toraw/1".format(self.base_uri), "datetime": datetime(2009, 1, 2) }
+            ] } } }
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            dedup_path = "{}/dedup.sqlite".format(directory)
+
+            self.assertEqual(len(export_mementos_to_warc(timemap_data, directory,
+                filename_prefix="TEST", session=create_uncached_session(), dedup=dedup_path)), 1)
+
+            self.server.raw_requests.clear()
+
+            self.assertEqual(export_mementos_to_warc(timemap_data, directory,
+                filename_prefix="TEST", session=create_uncached_session(), dedup=dedup_path), [])
+            self.assertEqual(self.server.raw_requests, [])
+
+    def test_stop_early(self):
+
+        raw_urims_to_urims = { "{}/raw/{}".format(self.base_uri, i): [ "{}/memento/{}".format(self.base_uri, i) ]
+            for i in range(20) }
+
+        mementos = iter_raw_mementos(raw_urims_to_urims, session=create_uncached_session(),
+            max_workers=4, queue_size=1)
+
+        memento = next(mementos)
+        self.assertIn(memento.raw_urim, raw_urims_to_urims)
+
+        # returns once the blocked downloads give up, rather than hanging
+        mementos.close()